@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Pré-processamento em lote de muitos comprovantes.
+
+- Leitura e decodificação num pool de threads: o OpenCV e o PIL liberam o
+  GIL ao decodificar e filtrar, então as imagens são preparadas em paralelo
+  sem o custo de processos. Só cerca de duas janelas de `window` imagens
+  ficam em memória.
+- As imagens de cada janela são agrupadas por tamanho; as de mesmo tamanho
+  viram uma pilha (N x H x W [x 3]) e as etapas pontuais (contraste,
+  brilho, nitidez, conversão para cinza) são aplicadas à pilha inteira com
+  tabelas de consulta (ver image_utils).
+- Filtros espaciais que dependem de cada imagem (bilateral, CLAHE,
+  threshold adaptativo, mediana) continuam por imagem, dentro das threads.
+
+Os resultados saem na ordem dos arquivos e são idênticos aos do
+pré-processamento individual.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+
+# Imagens em processamento/memória ao mesmo tempo
+DEFAULT_WINDOW = 16
+
+# Threads de decodificação; acima disso o ganho é pequeno (E/S e memória)
+MAX_DEFAULT_WORKERS = 8
+
+
+def default_workers():
+    return max(1, min(MAX_DEFAULT_WORKERS, os.cpu_count() or 1))
+
+
+def map_threaded(function, items, workers=None, window=DEFAULT_WINDOW):
+    """Aplica `function` a cada item num pool de threads.
+
+    Gera (item, resultado, erro) na ordem de `items`, com no máximo
+    `window` chamadas pendentes; `erro` é a exceção levantada (ou None).
+    """
+    workers = workers or default_workers()
+    window = max(window, workers)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preproc') as executor:
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= window:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def _collect(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
+
+
+def group_by_shape(arrays):
+    """Índices das imagens agrupados pelo formato do array ({shape: [i, ...]})."""
+    groups = {}
+    for i, array in enumerate(arrays):
+        groups.setdefault(array.shape, []).append(i)
+    return groups
+
+
+def apply_by_shape(arrays, function):
+    """Aplica `function` (pilha -> pilha) a cada grupo de imagens do mesmo
+    tamanho; devolve a lista de resultados na ordem de `arrays`."""
+    results = [None] * len(arrays)
+    for indices in group_by_shape(arrays).values():
+        stack = function(np.stack([arrays[i] for i in indices]))
+        for i, image in zip(indices, stack):
+            results[i] = image
+    return results
+
+
+def preprocess_batch(paths, load, finish_stack=None, workers=None, window=DEFAULT_WINDOW):
+    """Pré-processa vários arquivos.
+
+    `load(caminho)` lê e prepara uma imagem (roda nas threads do pool);
+    `finish_stack(pilha)`, opcional, completa o pré-processamento sobre
+    cada pilha de imagens do mesmo tamanho. Gera (caminho, imagem, erro)
+    na ordem de `paths`; em caso de erro, `imagem` é None.
+    """
+    loaded = map_threaded(load, paths, workers, window)
+    if finish_stack is None:
+        yield from loaded
+        return
+    chunk = []
+    for entry in loaded:
+        chunk.append(entry)
+        if len(chunk) >= window:
+            yield from _finish_chunk(chunk, finish_stack)
+            chunk = []
+    if chunk:
+        yield from _finish_chunk(chunk, finish_stack)
+
+
+def _finish_chunk(chunk, finish_stack):
+    ok = [i for i, (_, _, error) in enumerate(chunk) if error is None]
+    try:
+        finished = dict(zip(ok, apply_by_shape([chunk[i][1] for i in ok], finish_stack)))
+    except Exception:
+        # Falha numa pilha: refaz imagem a imagem para isolar a que falhou
+        finished = {}
+        for i in ok:
+            path, image, _ = chunk[i]
+            try:
+                finished[i] = finish_stack(image[None])[0]
+            except Exception as e:
+                chunk[i] = (path, None, e)
+    for i, (path, _, error) in enumerate(chunk):
+        yield path, finished.get(i), error
@@ -1,20 +1,93 @@
 #!/usr/bin/env python3
 """Processa todos os arquivos de um diretório:
-- se for imagem (jpg,jpeg,png,gif) chama `ocr_fast.py`
-- se for pdf chama `pdf_fast.py`
+- se for imagem (jpg,jpeg,png,gif) usa `ocr_fast.extract_text_simple`
+- se for pdf usa `pdf_fast.extract_text_from_pdf`
+
+Antes da extração, a triagem (`triage.py`) lê só o cabeçalho de cada arquivo
+e escolhe o caminho mais barato: o tipo vem do conteúdo, PDFs sem fontes vão
+direto ao OCR e JPEGs grandes são decodificados já reduzidos. A estratégia
+de cada arquivo aparece no progresso, e ao final é impresso o resumo da
+triagem com a economia de tempo estimada.
+
+Os arquivos são distribuídos entre um pool de processos (`--workers`), que
+importam cv2/numpy/PIL/pytesseract uma única vez. Os resultados são gravados
+no CSV pelo processo principal à medida que cada arquivo termina.
 
 Uso:
-  python batch_process.py --dir C:\caminho\para\pasta [--recursive] [--timeout 30]
+  python batch_process.py --dir C:\caminho\para\pasta [--recursive] [--timeout 30] [--workers 4]
+  python batch_process.py --dir pasta --subprocess   (modo antigo: um interpretador por arquivo)
+  python batch_process.py --dir entrada --watch [--fila 16]
+  python batch_process.py --dir pasta --resume   (retoma um lote interrompido)
+
+Os resultados são gravados em ocr_results.<formato> (imagens) e
+ocr_results_pdf.<formato> (PDFs) por uma única thread de gravação, com
+buffer de linhas (--buffer) e fsync periódico (--fsync). Formatos: csv,
+jsonl e parquet (--formato).
+
+Arquivos já processados (mesmo conteúdo) são lidos do cache `ocr_cache.sqlite3`
+e não geram nova linha no CSV. Use --no-cache para ignorá-lo ou
+--rebuild-cache para reprocessar tudo e regravar as entradas.
+
+Imagens quase idênticas a um comprovante já processado (reenviado,
+recomprimido, outra captura da mesma tela) são reconhecidas pelo índice de
+assinaturas de `duplicate_index.py`, guardado no mesmo arquivo do cache: a
+cópia não passa pelo OCR, reaproveita o resultado do original e sai no CSV
+com o caminho dele na coluna Duplicata. Use --sem-duplicatas para desativar.
+
+Com --watch, a pasta passa a ser monitorada (inotify no Linux, varredura
+periódica nos demais sistemas): cada arquivo novo é processado assim que
+termina de ser gravado, sem esperar o próximo lote. Os arquivos já presentes
+são processados ao iniciar (os já vistos saem do cache).
+
+Com --memoria-worker MB, cada worker tem um orçamento de memória: a imagem
+de trabalho é limitada ao que cabe nele e o número de workers é reduzido ao
+que cabe na memória disponível da máquina.
+
+O andamento do lote é registrado arquivo a arquivo no manifesto
+`ocr_manifest.sqlite3` (caminho, tamanho, data de modificação, estado e
+tentativas). Se o processamento for interrompido, --resume processa só os
+arquivos ainda não concluídos, sem perder linhas na saída; só as linhas
+gravadas depois do último flush (--buffer linhas ou --fsync segundos) se
+repetem (no Parquet, que só é gravado no fim do lote, os arquivos
+processados numa execução interrompida contam como não concluídos e são
+refeitos, sem repetir linhas). Arquivos com
+erro ou timeout são tentados de novo, com espera crescente entre as
+tentativas, até --tentativas vezes.
+
+Com --perfil-saida tempos.jsonl, cada arquivo processado gera uma linha
+JSON com o tempo de cada etapa (leitura, pré-processamento, OCR, extração) e
+ao final é impresso o histograma agregado por etapa.
 """
 import os
 import sys
+import time
+import queue
+import heapq
 import argparse
+import itertools
 import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+from result_cache import ResultCache, file_digest, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+from result_sink import open_sink, FORMATS, DEFAULT_BUFFER_ROWS, DEFAULT_FSYNC_INTERVAL
+import profiling
+from lazy_imports import is_available, load
+from memory_budget import max_work_pixels, workers_for_budget
+from inbox_watcher import make_watcher, InotifyWatcher, DEFAULT_POLL_INTERVAL
+from duplicate_index import DuplicateIndex, file_fingerprint, fingerprint_files
+from job_manifest import JobManifest, DEFAULT_MANIFEST_PATH, STATES, retry_delay
+import triage
+
 
 IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.gif'}
 
+# Versão do pipeline de extração; altere ao mudar o OCR ou as regras de
+# extração para que os resultados antigos do cache deixem de ser usados.
+PIPELINE_VERSION = '2'
+
 
 def call_script(script_path, file_path, timeout):
     cmd = [sys.executable, str(script_path), str(file_path)]
@@ -27,31 +100,652 @@ def call_script(script_path, file_path, timeout):
         print(f"Erro ao chamar {script_path} para {file_path}: {e}")
 
 
-def process_directory(directory, recursive, timeout):
+def file_kind(file_path):
+    """Retorna 'imagem', 'pdf' ou None conforme a extensão do arquivo."""
+    ext = Path(file_path).suffix.lower()
+    if ext in IMAGE_EXTS:
+        return 'imagem'
+    if ext == '.pdf':
+        return 'pdf'
+    return None
+
+
+def list_files(directory, recursive):
+    """Lista os arquivos suportados do diretório, ignorando os demais."""
+    files = directory.rglob('*') if recursive else directory.iterdir()
+    selected = []
+    for p in files:
+        if not p.is_file():
+            continue
+        if file_kind(p) is None:
+            print(f"Ignorado (tipo não suportado): {p}")
+            continue
+        selected.append(p)
+    return selected
+
+
+# Limite de pixels da imagem de trabalho aplicado nos workers (None = padrão
+# de image_utils); definido por process_directory a partir de --memoria-worker
+WORKER_MAX_WORK_PIXELS = None
+
+
+def worker_cores(workers):
+    """Núcleos de cada worker de um pool de `workers` processos."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _init_worker(profile=False, max_work_pixels=None, cores=None):
+    """Importa os módulos de OCR uma vez por processo do pool.
+
+    `cores` é a parte dos núcleos que cabe a este worker: o Tesseract dele
+    usa no máximo essas threads (OMP_THREAD_LIMIT), para que os workers
+    juntos não disputem mais núcleos do que a máquina tem.
+    """
+    if cores:
+        import ocr_engine
+        ocr_engine.configure_threads(cores)
+    if profile:
+        profiling.enable()
+    if max_work_pixels:
+        import image_utils
+        image_utils.set_max_work_pixels(max_work_pixels)
+    import ocr_fast
+    import pdf_fast  # noqa: F401
+    # Os módulos de OCR importam cv2/numpy/PIL sob demanda; o worker os
+    # carrega já na inicialização para que o prazo do primeiro arquivo não
+    # inclua a importação.
+    load(ocr_fast.cv2, ocr_fast.np, ocr_fast.Image)
+    if is_available('PyPDF2'):
+        import PyPDF2  # noqa: F401
+
+
+def process_file(file_path):
+    """Extrai texto e campos de um arquivo no processo atual.
+
+    Retorna um dicionário com o caminho, o tipo, o status ('ok' ou
+    'sem_texto'), o texto extraído, o resultado (Nome/Valor/Data), a decisão
+    da triagem ('triagem') e, com a instrumentação ativa, o registro de
+    tempos por etapa ('perfil').
+    """
+    file_path = str(file_path)
+    profiling.begin_file(file_path, file_kind(file_path))
+    with profiling.span('triagem'):
+        decision = triage.triage_file(file_path)
+    # O tipo vem do conteúdo; a extensão só decide se o conteúdo não for reconhecido
+    kind = decision['tipo'] or file_kind(file_path)
+    if kind == 'imagem':
+        import ocr_fast
+        text = ocr_fast.extract_text_simple(file_path, decision)
+        result = ocr_fast.extract_name_value_and_date(text, file_path) if text.strip() else {}
+    elif kind == 'pdf':
+        import pdf_fast
+        text, fields = pdf_fast.extract_text_from_pdf(
+            file_path, text_layer=decision['estrategia'] != 'pdf_ocr')
+        result = {}
+        if text.strip():
+            result['Nome'] = pdf_fast.extract_name_from_filename(file_path)
+            result.update(fields)
+    else:
+        raise ValueError(f"Tipo de arquivo não suportado: {file_path}")
+
+    record = profiling.end_file()
+    if record is not None:
+        record['tipo'] = kind
+        record['triagem'] = triage.describe(decision)
+    return {
+        'arquivo': file_path,
+        'tipo': kind,
+        'status': 'ok' if text.strip() else 'sem_texto',
+        'texto': text,
+        'resultado': result,
+        'triagem': decision,
+        'perfil': record,
+    }
+
+
+# Nome base do arquivo de saída de cada tipo (a extensão vem do formato)
+OUTPUT_BASENAMES = {'imagem': 'ocr_results', 'pdf': 'ocr_results_pdf'}
+
+
+def content_kind(file_path):
+    """Tipo do arquivo pelo conteúdo, como em process_file: a extensão só
+    decide se o conteúdo não for reconhecido."""
+    try:
+        with open(file_path, 'rb') as f:
+            kind = triage.sniff_kind(f.read(triage.HEAD_BYTES))
+    except OSError:
+        kind = None
+    return kind or file_kind(file_path)
+
+
+def _row_format(kind):
+    """Função que monta a linha e colunas de saída para o tipo de arquivo."""
+    if kind == 'imagem':
+        import ocr_fast
+        return ocr_fast.build_row, ocr_fast.CSV_FIELDNAMES
+    import pdf_fast
+    return pdf_fast.build_row, pdf_fast.CSV_FIELDNAMES
+
+
+class BatchOutput:
+    """Destinos de gravação do lote, um por tipo de arquivo, abertos sob demanda.
+
+    Cada destino tem uma única thread de gravação, de modo que o processo
+    principal não espera o disco e as linhas nunca se intercalam. `flush`
+    espera as linhas pendentes; process_directory o chama a cada
+    `buffer_rows` linhas ou `fsync_interval` segundos.
+    """
+
+    def __init__(self, fmt='csv', buffer_rows=DEFAULT_BUFFER_ROWS,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, output_dir='.'):
+        self.fmt = fmt
+        self.buffer_rows = buffer_rows
+        self.fsync_interval = fsync_interval
+        self.output_dir = Path(output_dir)
+        self._sinks = {}
+
+    def path_for(self, kind):
+        return self.output_dir / f"{OUTPUT_BASENAMES[kind]}.{self.fmt}"
+
+    def save(self, outcome):
+        """Grava o resultado de um arquivo processado com texto extraído.
+
+        Retorna True se uma linha foi gravada.
+        """
+        if outcome['status'] not in ('ok', 'duplicata'):
+            return False
+        kind = outcome['tipo']
+        build_row, fieldnames = _row_format(kind)
+        if kind not in self._sinks:
+            self._sinks[kind] = open_sink(self.path_for(kind), fieldnames, fmt=self.fmt,
+                                          threaded=True, buffer_rows=self.buffer_rows,
+                                          fsync_interval=self.fsync_interval)
+        if outcome['status'] == 'duplicata':
+            row = build_row(outcome['resultado'], outcome['arquivo'], outcome['duplicata_de'])
+        else:
+            row = build_row(outcome['resultado'], outcome['arquivo'])
+        self._sinks[kind].write(row)
+        return True
+
+    @property
+    def durable_on_flush(self):
+        """True se as linhas entregues por `flush` já estão nos arquivos de
+        saída (False no Parquet, que só os substitui em `close`)."""
+        return all(sink.durable_on_flush for sink in self._sinks.values())
+
+    def flush(self):
+        """Espera as linhas pendentes chegarem aos arquivos de saída."""
+        for sink in self._sinks.values():
+            sink.flush()
+
+    def close(self):
+        for kind, sink in self._sinks.items():
+            sink.close()
+            print(f"Resultados salvos em {self.path_for(kind)}")
+        self._sinks = {}
+
+
+def cache_version(kind):
+    """Versão usada como parte da chave do cache para o tipo de arquivo."""
+    return f"{kind}:{PIPELINE_VERSION}"
+
+
+def name_from_filename(file_path, kind):
+    """Nome derivado do arquivo, com a mesma regra do script de cada tipo."""
+    if kind == 'imagem':
+        import ocr_fast
+        return ocr_fast.extract_name_from_filename(str(file_path))
+    import pdf_fast
+    return pdf_fast.extract_name_from_filename(str(file_path))
+
+
+def duplicate_outcome(original, file_path):
+    """Resultado de uma cópia de imagem a partir do resultado do original.
+
+    Se o original falhou (timeout, erro, sem texto), a cópia recebe o mesmo
+    status: é a mesma imagem e falharia da mesma forma.
+    """
+    outcome = dict(original, arquivo=str(file_path), duplicata_de=original['arquivo'], perfil=None,
+                   triagem=None)
+    if original['status'] in ('ok', 'cache', 'duplicata'):
+        result = dict(original['resultado'])
+        if result:
+            result['Nome'] = name_from_filename(file_path, 'imagem')
+        outcome['status'] = 'duplicata'
+        outcome['resultado'] = result
+    return outcome
+
+
+def report_result(outcome, done, total):
+    """Imprime uma linha de progresso para o arquivo concluído."""
+    prefix = f"[{done}/{total}]" if total else f"[{done}]"
+    name = outcome['arquivo']
+    status = outcome['status']
+    if status in ('ok', 'cache', 'duplicata'):
+        result = outcome['resultado']
+        fields = ', '.join(f"{k}: {result[k]}" for k in ('Nome', 'Valor', 'Data') if k in result)
+        label = {'ok': 'OK', 'cache': 'Cache', 'duplicata': 'Duplicata'}[status]
+        if status == 'duplicata':
+            name = f"{name} (cópia de {outcome['duplicata_de']})"
+        decision = outcome.get('triagem')
+        if decision and decision['estrategia'] not in ('completo', 'pdf_texto'):
+            name = f"{name} [{triage.describe(decision)}]"
+        print(f"{prefix} {label} {name} — {fields or 'nenhum campo encontrado'}")
+    elif status == 'sem_texto':
+        print(f"{prefix} Sem texto extraível: {name}")
+    elif status == 'timeout':
+        print(f"{prefix} Timeout ao processar {name} (>{outcome['timeout']}s)")
+    else:
+        print(f"{prefix} Erro ao processar {name}: {outcome['erro']}")
+
+
+def _new_executor(workers):
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(profiling.is_enabled(), WORKER_MAX_WORK_PIXELS,
+                                         worker_cores(workers)))
+
+
+def _terminate_executor(executor):
+    # ProcessPoolExecutor não interrompe tarefas em andamento: encerra os
+    # processos do pool diretamente para liberar os que estouraram o timeout.
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for proc in processes:
+        proc.terminate()
+    for proc in processes:
+        proc.join()
+
+
+# Intervalo máximo (s) sem verificar a fila de arquivos novos (modo --watch)
+INCOMING_POLL_INTERVAL = 0.5
+
+
+def _take_incoming(incoming, pending, free, admit, block):
+    """Move até `free` arquivos da fila `incoming` para `pending`.
+
+    Só retira da fila o que há workers livres para processar, de modo que a
+    fila cheia segura o monitor de arquivos (backpressure).
+    """
+    while free > 0:
+        try:
+            p = incoming.get(timeout=INCOMING_POLL_INTERVAL) if block else incoming.get_nowait()
+        except queue.Empty:
+            return
+        block = False
+        if admit is None or admit(p):
+            pending.append(p)
+            free -= 1
+
+
+def run_pool(files, workers, timeout, on_result, incoming=None, admit=None, stop=None,
+             retry=None):
+    """Processa `files` em um pool de `workers` processos.
+
+    No máximo `workers` arquivos ficam em execução ao mesmo tempo, de modo que
+    o prazo de cada arquivo começa a contar quando um processo o recebe. Se um
+    arquivo excede `timeout` segundos, o pool é recriado e os demais arquivos
+    em andamento são reenviados.
+
+    Com `incoming` (queue.Queue), continua recebendo arquivos dessa fila até
+    `stop` (threading.Event) ser sinalizado; `admit(caminho)` decide se um
+    arquivo recebido deve ser processado.
+
+    `retry(resultado)` é chamada para cada erro ou timeout e retorna a
+    espera (s) antes de uma nova tentativa do arquivo, ou None para
+    entregar a falha a `on_result`.
+    """
+    pending = deque(files)
+    executor = _new_executor(workers)
+    running = {}
+    # Novas tentativas agendadas: (instante, ordem, caminho)
+    delayed = []
+    order = itertools.count()
+    watching = incoming is not None
+
+    def finish(p, outcome):
+        delay = retry(outcome) if retry is not None and outcome['status'] in ('erro', 'timeout') else None
+        if delay is None:
+            on_result(outcome)
+        else:
+            heapq.heappush(delayed, (time.monotonic() + delay, next(order), p))
+
+    try:
+        while (pending or running or delayed
+               or (watching and not (stop is not None and stop.is_set()))):
+            while delayed and delayed[0][0] <= time.monotonic():
+                pending.append(heapq.heappop(delayed)[2])
+            if watching:
+                _take_incoming(incoming, pending, workers - len(running) - len(pending), admit,
+                               block=not pending and not running and not delayed)
+
+            while pending and len(running) < workers:
+                p = pending.popleft()
+                future = executor.submit(process_file, str(p))
+                running[future] = (p, time.monotonic() + timeout)
+            if not running:
+                if delayed and not pending:
+                    # Só há novas tentativas agendadas: espera a primeira
+                    wait_time = delayed[0][0] - time.monotonic()
+                    if watching:
+                        wait_time = min(wait_time, INCOMING_POLL_INTERVAL)
+                    time.sleep(max(0, wait_time))
+                continue
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            if delayed:
+                next_deadline = min(next_deadline, delayed[0][0])
+            wait_time = max(0, next_deadline - time.monotonic())
+            if watching:
+                wait_time = min(wait_time, INCOMING_POLL_INTERVAL)
+            done, _ = wait(list(running), timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            broken = False
+            for future in done:
+                p, _ = running.pop(future)
+                try:
+                    outcome = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    outcome = {'arquivo': str(p), 'tipo': file_kind(p), 'status': 'erro',
+                               'erro': f"processo do pool encerrado inesperadamente ({e})"}
+                except Exception as e:
+                    outcome = {'arquivo': str(p), 'tipo': file_kind(p), 'status': 'erro', 'erro': e}
+                finish(p, outcome)
+
+            now = time.monotonic()
+            expired = [f for f, (_, deadline) in running.items() if deadline <= now]
+            for future in expired:
+                p, _ = running.pop(future)
+                finish(p, {'arquivo': str(p), 'tipo': file_kind(p), 'status': 'timeout',
+                           'timeout': timeout})
+
+            if expired or broken:
+                # Os arquivos que ainda estavam em andamento recomeçam no novo pool
+                pending.extendleft(reversed([p for p, _ in running.values()]))
+                running = {}
+                _terminate_executor(executor)
+                executor = _new_executor(workers)
+    finally:
+        _terminate_executor(executor)
+
+
+# Campos de cada linha do arquivo de tempos (--perfil-saida)
+PROFILE_FIELDNAMES = ['arquivo', 'tipo', 'inicio', 'duracao_s', 'triagem', 'etapas']
+
+
+def process_directory(directory, recursive, timeout, workers=None, use_subprocess=False,
+                      cache_path=DEFAULT_CACHE_PATH, use_cache=True, rebuild_cache=False,
+                      cache_max_bytes=DEFAULT_MAX_BYTES, output=None, profile_path=None,
+                      watch=False, queue_size=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                      stop=None, worker_memory_mb=None, detect_duplicates=True,
+                      manifest_path=DEFAULT_MANIFEST_PATH, resume=False, max_attempts=3):
+    global WORKER_MAX_WORK_PIXELS
     directory = Path(directory)
     if not directory.exists() or not directory.is_dir():
         print(f"Diretório não encontrado: {directory}")
         return
 
-    script_dir = Path(__file__).parent
-    ocr_script = script_dir / 'ocr_fast.py'
-    pdf_script = script_dir / 'pdf_fast.py'
-
-    if recursive:
-        files = directory.rglob('*')
+    if watch:
+        if use_subprocess:
+            print("--watch não pode ser combinado com --subprocess")
+            return
+        # Os arquivos existentes são entregues pelo monitor
+        files = []
     else:
-        files = directory.iterdir()
+        files = list_files(directory, recursive)
 
-    for p in files:
-        if not p.is_file():
-            continue
-        ext = p.suffix.lower()
-        if ext in IMAGE_EXTS:
-            call_script(ocr_script, p, timeout)
-        elif ext == '.pdf':
-            call_script(pdf_script, p, timeout)
+    if use_subprocess:
+        script_dir = Path(__file__).parent
+        scripts = {'imagem': script_dir / 'ocr_fast.py', 'pdf': script_dir / 'pdf_fast.py'}
+        for p in files:
+            call_script(scripts[file_kind(p)], p, timeout)
+        return
+
+    if not files and not watch:
+        print("Nenhum arquivo para processar.")
+        return
+
+    # Manifesto do lote (não se aplica ao modo --watch, que não tem fim)
+    manifest = None
+    if watch:
+        if resume:
+            print("--resume não se aplica ao modo --watch; ignorado")
+    elif manifest_path:
+        manifest = JobManifest(manifest_path)
+        if resume:
+            job = manifest.describe()
+            if job.get('diretorio') not in (None, os.path.abspath(directory)):
+                print(f"O manifesto {manifest_path} é do lote de {job['diretorio']}; "
+                      f"rode sem --resume para começar um novo lote")
+                manifest.close()
+                return
+            files, exhausted = manifest.resume(files, max_attempts)
+            counts = manifest.counts()
+            print(f"Retomando o lote: {counts.get('concluido', 0)} arquivo(s) já concluído(s), "
+                  f"{len(files)} a processar")
+            if exhausted:
+                print(f"{len(exhausted)} arquivo(s) já falharam {max_attempts} vez(es) e não serão "
+                      f"tentados de novo (aumente --tentativas ou rode sem --resume)")
+            if not files:
+                manifest.close()
+                print("Nada a retomar." if exhausted else "Nada a retomar: o lote já foi concluído.")
+                return
         else:
-            print(f"Ignorado (tipo não suportado): {p}")
+            manifest.start(directory, recursive, files)
+
+    total = len(files) if not watch else None
+    done = 0
+    output = output or BatchOutput()
+    cache = ResultCache(cache_path, cache_max_bytes) if use_cache else None
+    digests = {}
+    # Índice de cópias quase idênticas (imagens); usa o arquivo do cache
+    duplicates = DuplicateIndex(cache_path) if cache is not None and detect_duplicates else None
+    # Original ainda em processamento -> cópias aguardando o resultado dele
+    waiting = {}
+    # Assinaturas das imagens em processamento, reaproveitadas ao indexá-las
+    fingerprints = {}
+    # Falhas de cada arquivo (sem manifesto, só nesta execução)
+    failures = {}
+    # Decisões da triagem dos arquivos processados, para o resumo final
+    decisions = []
+    profile_sink = None
+    if profile_path:
+        profiling.enable()
+        profile_sink = open_sink(profile_path, PROFILE_FIELDNAMES, fmt='jsonl', threaded=True)
+
+    # Resultados com a linha entregue à saída e ainda fora do cache e do
+    # manifesto: entram neles juntos, depois de um flush da saída a cada
+    # --buffer linhas ou --fsync segundos (no Parquet, que só grava o arquivo
+    # no fechamento, depois de output.close())
+    uncommitted = []
+    last_flush = time.monotonic()
+
+    def flush_output():
+        nonlocal last_flush
+        output.flush()
+        last_flush = time.monotonic()
+        for outcome in uncommitted:
+            commit(outcome)
+        uncommitted.clear()
+
+    def commit(outcome):
+        # Registra no cache e no manifesto um resultado cuja linha já está gravada
+        if cache is not None and outcome['status'] in ('ok', 'sem_texto', 'duplicata'):
+            cache.put(digests[outcome['arquivo']], cache_version(outcome['tipo']),
+                      outcome['texto'], outcome['resultado'])
+        if manifest is not None and STATES.get(outcome['status']) == 'concluido':
+            manifest.record(outcome)
+
+    def on_result(outcome):
+        nonlocal done
+        done += 1
+        report_result(outcome, done, total)
+        if outcome.get('triagem'):
+            decisions.append(outcome['triagem'])
+        if profile_sink is not None and outcome.get('perfil'):
+            profiling.add_record(outcome['perfil'])
+            profile_sink.write(outcome['perfil'])
+        if outcome['status'] != 'cache':
+            # (Os resultados do cache já foram gravados quando o arquivo foi
+            # processado pela primeira vez.) A linha chega ao arquivo de saída
+            # antes do cache e do manifesto: um arquivo dado como concluído
+            # nunca fica sem a sua linha.
+            if output.save(outcome):
+                uncommitted.append(outcome)
+                if output.durable_on_flush and (
+                        len(uncommitted) >= output.buffer_rows
+                        or time.monotonic() - last_flush >= output.fsync_interval):
+                    flush_output()
+            else:
+                commit(outcome)
+        else:
+            commit(outcome)
+        if (duplicates is not None and outcome['status'] != 'cache'
+                and outcome['tipo'] == 'imagem' and 'duplicata_de' not in outcome):
+            index_original(outcome)
+
+    def retry_failed(outcome):
+        # Registra a falha e retorna a espera até a nova tentativa (None: desiste)
+        path = outcome['arquivo']
+        if manifest is not None:
+            attempts = manifest.record(outcome)
+        else:
+            attempts = failures[path] = failures.get(path, 0) + 1
+        if attempts >= max_attempts:
+            return None
+        delay = retry_delay(attempts)
+        reason = 'timeout' if outcome['status'] == 'timeout' else f"erro: {outcome.get('erro')}"
+        print(f"Falha em {path} ({reason}); tentativa {attempts + 1} de {max_attempts} "
+              f"em {delay:.0f}s")
+        return delay
+
+    def index_original(outcome):
+        # Indexa o resultado do original e resolve as cópias que o aguardavam
+        path = outcome['arquivo']
+        duplicates.release(path)
+        fingerprint = fingerprints.pop(path, None)
+        if outcome['status'] == 'ok':
+            if fingerprint is None:
+                fingerprint = file_fingerprint(path)
+            if fingerprint is not None:
+                duplicates.add(fingerprint, cache_version('imagem'),
+                               os.path.abspath(path), outcome['texto'], outcome['resultado'])
+        for copy in waiting.pop(path, []):
+            on_result(duplicate_outcome(outcome, copy))
+
+    def find_duplicate(p, fingerprint):
+        # Procura um original do qual a imagem é cópia; retorna True se ela foi resolvida
+        if fingerprint is None:
+            return False
+        version = cache_version('imagem')
+        match = None if rebuild_cache else duplicates.find(fingerprint, version, p)
+        if match is None:
+            fingerprints[str(p)] = fingerprint
+            duplicates.reserve(fingerprint, version, str(p))
+            return False
+        if match.get('pendente'):
+            waiting.setdefault(match['arquivo'], []).append(str(p))
+        else:
+            on_result(duplicate_outcome(dict(match, tipo='imagem', status='ok'), p))
+        return True
+
+    if worker_memory_mb:
+        WORKER_MAX_WORK_PIXELS = max_work_pixels(worker_memory_mb)
+        requested = workers or os.cpu_count() or 1
+        workers = workers_for_budget(worker_memory_mb, requested)
+        print(f"Orçamento de {worker_memory_mb} MB por worker: até {workers} worker(s), "
+              f"imagens de trabalho de até {WORKER_MAX_WORK_PIXELS / 1e6:.0f} Mpx")
+
+    def is_duplicate(p):
+        # Resolve as cópias de imagens já processadas (ou em processamento)
+        if duplicates is None or file_kind(p) != 'imagem':
+            return False
+        return find_duplicate(p, file_fingerprint(p))
+
+    def needs_processing(p):
+        # Responde pelo cache e pelo índice de cópias os arquivos já vistos
+        return not_cached(p) and not is_duplicate(p)
+
+    def not_cached(p):
+        # Responde pelo cache os arquivos já vistos; retorna True para os demais
+        if cache is None:
+            return True
+        # O tipo da chave é o do resultado gravado (pelo conteúdo, não pela extensão)
+        kind = content_kind(p)
+        try:
+            digest = digests[str(p)] = file_digest(p)
+        except OSError as e:
+            on_result({'arquivo': str(p), 'tipo': kind, 'status': 'erro', 'erro': e})
+            return False
+        cached = None if rebuild_cache else cache.get(digest, cache_version(kind))
+        if cached is None:
+            return True
+        result = cached['resultado']
+        if result:
+            # O nome vem do nome do arquivo, que pode mudar sem alterar o conteúdo
+            result['Nome'] = name_from_filename(p, kind)
+        on_result({'arquivo': str(p), 'tipo': kind, 'status': 'cache',
+                   'texto': cached['texto'], 'resultado': result})
+        return False
+
+    try:
+        if watch:
+            workers = max(1, workers or os.cpu_count() or 1)
+            watch_directory(directory, recursive, timeout, workers, on_result, needs_processing,
+                            queue_size, poll_interval, stop, retry=retry_failed)
+            return
+
+        to_process = [p for p in files if not_cached(p)]
+        if duplicates is not None:
+            # As imagens são lidas em paralelo; a busca e a reserva seguem a
+            # ordem dos arquivos, para que o primeiro de um grupo de cópias
+            # seja o original
+            images = [p for p in to_process if file_kind(p) == 'imagem']
+            found = dict(zip(images, fingerprint_files(images, workers)))
+            to_process = [p for p in to_process if p not in found or not find_duplicate(p, found[p])]
+        if not to_process:
+            return
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(to_process)))
+        print(f"Processando {len(to_process)} arquivo(s) com {workers} worker(s)...")
+        run_pool(to_process, workers, timeout, on_result, retry=retry_failed)
+    finally:
+        output.close()
+        for outcome in uncommitted:
+            commit(outcome)
+        if manifest is not None:
+            manifest.close()
+        if decisions:
+            print(triage.summarize(decisions))
+        if cache is not None:
+            cache.close()
+        if duplicates is not None:
+            duplicates.close()
+        if profile_sink is not None:
+            profile_sink.close()
+            print(f"\nTempos por etapa salvos em {profile_path}")
+            print(profiling.format_summary())
+
+
+def watch_directory(directory, recursive, timeout, workers, on_result, admit,
+                    queue_size=None, poll_interval=DEFAULT_POLL_INTERVAL, stop=None, retry=None):
+    """Processa os arquivos da pasta à medida que chegam, até Ctrl+C ou `stop`."""
+    incoming = queue.Queue(maxsize=queue_size or workers * 4)
+    watcher = make_watcher(directory, incoming, recursive=recursive,
+                           accept=lambda p: file_kind(p) is not None,
+                           include_existing=True, interval=poll_interval)
+    watcher.start()
+    print(f"Monitorando {directory} com {workers} worker(s) "
+          f"({'inotify' if isinstance(watcher, InotifyWatcher) else 'varredura periódica'}). "
+          f"Ctrl+C para encerrar.")
+    try:
+        run_pool([], workers, timeout, on_result, incoming=incoming, admit=admit, stop=stop,
+                 retry=retry)
+    except KeyboardInterrupt:
+        print("\nMonitoramento encerrado.")
+    finally:
+        watcher.stop()
+        watcher.join()
 
 
 def main():
@@ -59,9 +753,53 @@ def main():
     ap.add_argument('--dir', '-d', default='.', help='Diretório a varrer')
     ap.add_argument('--recursive', '-r', action='store_true', help='Varrer subpastas')
     ap.add_argument('--timeout', '-t', type=int, default=30, help='Timeout (s) por arquivo')
+    ap.add_argument('--workers', '-w', type=int, default=None,
+                    help='Número de processos (padrão: número de CPUs)')
+    ap.add_argument('--subprocess', action='store_true',
+                    help='Chama ocr_fast.py/pdf_fast.py em um novo interpretador por arquivo')
+    ap.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='Arquivo SQLite do cache de resultados')
+    ap.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                    help='Tamanho máximo (MB) das entradas do cache')
+    ap.add_argument('--no-cache', action='store_true', help='Não lê nem grava o cache')
+    ap.add_argument('--rebuild-cache', action='store_true',
+                    help='Reprocessa todos os arquivos e regrava o cache')
+    ap.add_argument('--sem-duplicatas', action='store_true',
+                    help='Processa também as imagens quase idênticas a um comprovante já visto')
+    ap.add_argument('--formato', choices=FORMATS, default='csv', help='Formato dos arquivos de saída')
+    ap.add_argument('--buffer', type=int, default=DEFAULT_BUFFER_ROWS,
+                    help='Linhas acumuladas antes de cada escrita no arquivo de saída')
+    ap.add_argument('--fsync', type=float, default=DEFAULT_FSYNC_INTERVAL,
+                    help='Intervalo mínimo (s) entre sincronizações com o disco')
+    ap.add_argument('--watch', action='store_true',
+                    help='Monitora a pasta e processa cada arquivo novo assim que chega')
+    ap.add_argument('--fila', type=int, default=None,
+                    help='Arquivos prontos aguardando um worker no modo --watch (padrão: 4 por worker)')
+    ap.add_argument('--intervalo', type=float, default=DEFAULT_POLL_INTERVAL,
+                    help='Intervalo (s) da varredura quando o inotify não está disponível')
+    ap.add_argument('--memoria-worker', type=int, default=None,
+                    help='Orçamento de memória (MB) por worker; limita o número de workers '
+                         'e o tamanho da imagem de trabalho')
+    ap.add_argument('--resume', action='store_true',
+                    help='Retoma o lote interrompido: processa só os arquivos não concluídos')
+    ap.add_argument('--manifesto', default=DEFAULT_MANIFEST_PATH,
+                    help='Arquivo SQLite com o andamento do lote')
+    ap.add_argument('--tentativas', type=int, default=3,
+                    help='Máximo de tentativas por arquivo com erro ou timeout')
+    ap.add_argument('--perfil-saida', default=None,
+                    help='Grava os tempos por etapa de cada arquivo (JSONL) e imprime o histograma')
     args = ap.parse_args()
 
-    process_directory(args.dir, args.recursive, args.timeout)
+    output = BatchOutput(args.formato, args.buffer, args.fsync)
+    process_directory(args.dir, args.recursive, args.timeout, args.workers, args.subprocess,
+                      cache_path=args.cache, use_cache=not args.no_cache,
+                      rebuild_cache=args.rebuild_cache,
+                      cache_max_bytes=args.cache_max_mb * 1024 * 1024, output=output,
+                      profile_path=args.perfil_saida, watch=args.watch,
+                      queue_size=args.fila, poll_interval=args.intervalo,
+                      worker_memory_mb=args.memoria_worker,
+                      detect_duplicates=not args.sem_duplicatas,
+                      manifest_path=args.manifesto, resume=args.resume,
+                      max_attempts=max(1, args.tentativas))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""Benchmark de velocidade e acurácia com um corpus rotulado de comprovantes PIX.
+
+Gera (ou carrega) comprovantes sintéticos desenhados com PIL em vários
+layouts de banco, fontes e níveis de ruído, com Nome/Valor/Data conhecidos,
+e mede cada pipeline sobre o corpus:
+- imagens por segundo e latência p50/p95 por arquivo
+- pico de memória (RSS) do processo e dos subprocessos (tesseract)
+- acurácia por campo (Nome, Valor, Data)
+
+Cada pipeline roda em um processo próprio, para que o pico de memória e o
+tempo de importação de um não contaminem os outros.
+
+Uso:
+  python benchmark.py gerar --saida corpus [--quantidade 40] [--seed 1]
+  python benchmark.py executar --corpus corpus [--pipelines ocr,ocr:fast,ocr_fast,pdf_fast] [--json relatorio.json]
+  python benchmark.py importacao [--repeticoes 5]
+  python benchmark.py memoria imagem.png [...] [--escala 3]
+
+Pipelines: ocr (cascata completa; ocr:<perfil> escolhe o perfil de
+pré-processamento), ocr_fast (imagens) e pdf_fast (PDFs com texto).
+
+`importacao` mede, em interpretadores novos, o tempo de importação de cada
+ponto de entrada e falha (código de saída 1) se algum passar do orçamento
+ou importar uma biblioteca pesada antes de processar um arquivo.
+
+`memoria` mede, em um interpretador novo por imagem e pré-processamento,
+o pico de memória residente acima do que as bibliotecas já ocupam: quanto
+cada pré-processamento (ocr avançado, ocr alternativo, ocr_fast) aloca
+para uma imagem (ex.: capturas de tela grandes).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+
+LABELS_FILE = 'labels.json'
+FIELDS = ('Nome', 'Valor', 'Data')
+DEFAULT_PIPELINES = 'ocr,ocr_fast,pdf_fast'
+
+FIRST_NAMES = ['Ana', 'João', 'Sérgio', 'Juliana', 'Ízias', 'Márcia', 'Pedro', 'Luís',
+               'Fernanda', 'Conceição', 'Rafael', 'Beatriz', 'André', 'Cláudia']
+LAST_NAMES = ['Silva', 'Souza', 'Nascimento', 'Muniz', 'Araújo', 'Gonçalves', 'Monte Nero',
+              'Oliveira', 'Conceição', 'Ribeiro', 'Mioti', 'Lima', 'Pereira']
+
+MONTH_NAMES = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho', 'julho',
+               'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+
+# Layouts de comprovante por banco; {valor}, {data}, {hora}, {nome} e
+# {data_extenso} são preenchidos para cada amostra
+LAYOUTS = {
+    'nubank': [
+        'NU', '', 'Comprovante de', 'transferência', '{data} - {hora}', '',
+        'Valor R$ {valor}', '', 'Tipo de transferência Pix', '', 'Destino',
+        'Nome IGREJA BATISTA EM CAVALEIROS', 'Instituição CAIXA ECONOMICA FEDERAL', '',
+        'Origem', 'Nome {nome}', 'Instituição NU PAGAMENTOS - IP', 'Agência 0001',
+    ],
+    'itau': [
+        'itaú', '', 'comprovante de pagamento pix', '', 'valor', 'R$ {valor}', '',
+        'data da transferência', '{data} às {hora}', '', 'pagador', '{nome}',
+        'instituição ITAÚ UNIBANCO S.A.', '', 'recebedor', 'IGREJA BATISTA EM CAVALEIROS',
+    ],
+    'caixa': [
+        'CAIXA', 'Comprovante de Pix', '', 'DATA: {data} - {hora}', 'VALOR: R$ {valor}', '',
+        'DADOS DO PAGADOR', 'Nome: {nome}', 'Instituição: CAIXA ECONOMICA FEDERAL', '',
+        'DADOS DO RECEBEDOR', 'IGREJA BATISTA EM CAVALEIROS',
+    ],
+    'cora': [
+        'cora', '', 'Pix enviado', '', 'R$ {valor}', '{data_extenso}, {hora}', '',
+        'De', '{nome}', 'CORA SCD', '', 'Para', 'IGREJA BATISTA EM CAVALEIROS',
+    ],
+}
+
+# Fontes TrueType procuradas no sistema (a primeira existente de cada grupo)
+FONT_CANDIDATES = {
+    'sans': ['DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'arial.ttf', 'Arial.ttf'],
+    'serif': ['DejaVuSerif.ttf', 'LiberationSerif-Regular.ttf', 'times.ttf', 'Times New Roman.ttf'],
+    'mono': ['DejaVuSansMono.ttf', 'LiberationMono-Regular.ttf', 'cour.ttf', 'Courier New.ttf'],
+}
+
+FONT_DIRS = ['/usr/share/fonts', '/usr/local/share/fonts', '/Library/Fonts',
+             'C:\\Windows\\Fonts', str(Path.home() / '.fonts')]
+
+# Níveis de ruído: desvio do ruído gaussiano, raio do desfoque e qualidade JPEG
+NOISE_LEVELS = {
+    'limpo': {'sigma': 0, 'blur': 0, 'jpeg': None},
+    'leve': {'sigma': 8, 'blur': 0.6, 'jpeg': 80},
+    'forte': {'sigma': 20, 'blur': 1.2, 'jpeg': 40},
+}
+
+
+def find_font(family):
+    """Caminho da primeira fonte disponível da família, ou None."""
+    for directory in FONT_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for root, _, files in os.walk(directory):
+            for candidate in FONT_CANDIDATES[family]:
+                if candidate in files:
+                    return os.path.join(root, candidate)
+    return None
+
+
+def random_sample(rng):
+    """Sorteia os campos de um comprovante."""
+    nome = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    cents = rng.randint(100, 500000)
+    reais = f"{cents // 100:,}".replace(',', '.')
+    valor = f"{reais},{cents % 100:02d}"
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.choice([2024, 2025])
+    return {
+        'nome': nome,
+        'valor': valor,
+        'data': f"{day:02d}/{month:02d}/{year}",
+        'data_extenso': f"{day} de {MONTH_NAMES[month - 1]} de {year}",
+        'hora': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+    }
+
+
+def render_lines(layout, fields):
+    return [line.format(**fields) for line in LAYOUTS[layout]]
+
+
+def render_image(lines, font_path, font_size, noise, rng):
+    """Desenha o comprovante e aplica o nível de ruído; retorna uma PIL.Image."""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    font = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default()
+    line_height = int(font_size * 1.6)
+    width = int(font_size * 28)
+    height = line_height * (len(lines) + 2)
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((font_size, line_height * (i + 1)), line, fill=0, font=font)
+
+    settings = NOISE_LEVELS[noise]
+    if settings['blur']:
+        image = image.filter(ImageFilter.GaussianBlur(settings['blur']))
+    if settings['sigma']:
+        arr = np.asarray(image, dtype=np.float32)
+        noise_arr = np.random.default_rng(rng.randint(0, 2**31)).normal(0, settings['sigma'], arr.shape)
+        image = Image.fromarray(np.clip(arr + noise_arr, 0, 255).astype(np.uint8))
+    return image
+
+
+def write_text_pdf(path, lines, font_size=12):
+    """Grava um PDF mínimo de uma página com camada de texto (Helvetica)."""
+    leading = font_size * 1.4
+    ops = ['BT', f'/F1 {font_size} Tf', f'{leading:.1f} TL', f'50 {842 - 60} Td']
+    for line in lines:
+        escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        ops.append(f'({escaped}) Tj T*')
+    ops.append('ET')
+    content = '\n'.join(ops).encode('cp1252', errors='replace')
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R'
+        b' /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def generate_corpus(output_dir, count, seed=1, pdf_ratio=0.25):
+    """Gera o corpus sintético e o arquivo de rótulos; retorna os rótulos."""
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fonts = {family: find_font(family) for family in FONT_CANDIDATES}
+    available_fonts = [f for f, path in fonts.items() if path] or ['padrao']
+
+    labels = []
+    for i in range(count):
+        fields = random_sample(rng)
+        layout = rng.choice(sorted(LAYOUTS))
+        lines = render_lines(layout, fields)
+        # O nome vai no nome do arquivo, como nos comprovantes reais
+        stem = f"Comprovante_{i:05d} - {fields['nome']}"
+        label = {'nome': fields['nome'], 'valor': f"R$ {fields['valor']}",
+                 'data': fields['data'], 'layout': layout}
+
+        if rng.random() < pdf_ratio:
+            filename = stem + '.pdf'
+            write_text_pdf(output_dir / filename, lines)
+            label.update({'arquivo': filename, 'tipo': 'pdf'})
+        else:
+            family = rng.choice(available_fonts)
+            noise = rng.choice(sorted(NOISE_LEVELS))
+            font_size = rng.choice([14, 18, 24, 32])
+            image = render_image(lines, fonts.get(family), font_size, noise, rng)
+            jpeg_quality = NOISE_LEVELS[noise]['jpeg']
+            if jpeg_quality:
+                filename = stem + '.jpg'
+                image.save(output_dir / filename, quality=jpeg_quality)
+            else:
+                filename = stem + '.png'
+                image.save(output_dir / filename)
+            label.update({'arquivo': filename, 'tipo': 'imagem', 'fonte': family,
+                          'tamanho_fonte': font_size, 'ruido': noise})
+        labels.append(label)
+
+    with open(output_dir / LABELS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+    return labels
+
+
+def load_corpus(corpus_dir):
+    with open(Path(corpus_dir) / LABELS_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _ocr_runner(profile):
+    import ocr
+    profile = profile or ocr.DEFAULT_PROFILE
+
+    def run(path):
+        _, result = ocr.extract_fields_cascade(path, profile)
+        return dict(result, Nome=ocr.extract_name_from_filename(path))
+    return run
+
+
+def _ocr_fast_runner(_):
+    import ocr_fast
+
+    def run(path):
+        text = ocr_fast.extract_text_simple(path)
+        return ocr_fast.extract_name_value_and_date(text, path)
+    return run
+
+
+def _pdf_fast_runner(_):
+    import pdf_fast
+
+    def run(path):
+        _, fields = pdf_fast.extract_text_from_pdf(path)
+        result = {'Nome': pdf_fast.extract_name_from_filename(path)}
+        result.update(fields)
+        return result
+    return run
+
+
+# Pipeline -> (tipo de arquivo aceito, fábrica da função de execução)
+PIPELINES = {
+    'ocr': ('imagem', _ocr_runner),
+    'ocr_fast': ('imagem', _ocr_fast_runner),
+    'pdf_fast': ('pdf', _pdf_fast_runner),
+}
+
+
+# Orçamento (s) de importação de cada ponto de entrada, em um interpretador novo
+IMPORT_BUDGETS_S = {
+    'ocr': 0.15,
+    'ocr_fast': 0.15,
+    'pdf_fast': 0.1,
+    'batch_process': 0.15,
+    'ocr_windows': 0.15,
+}
+
+# Bibliotecas que só devem ser importadas quando um arquivo é processado
+HEAVY_MODULES = ('cv2', 'numpy', 'PIL.Image', 'PyPDF2', 'pytesseract', 'tesserocr')
+
+_IMPORT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'tempo_s': elapsed, 'pesados': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure_import(module, repeats=5):
+    """Menor tempo de importação de `module` em `repeats` interpretadores novos."""
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    cwd = Path(__file__).resolve().parent
+    best, heavy = None, []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True,
+                             text=True, check=True)
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        best = probe['tempo_s'] if best is None else min(best, probe['tempo_s'])
+        heavy = probe['pesados']
+    return best, heavy
+
+
+def check_import_budgets(repeats=5):
+    """Mede os pontos de entrada; retorna True se todos cumprirem o orçamento."""
+    ok = True
+    for module, budget in IMPORT_BUDGETS_S.items():
+        try:
+            elapsed, heavy = measure_import(module, repeats)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<16} ERRO ao importar: {e.stderr.strip().splitlines()[-1:]}")
+            ok = False
+            continue
+        passed = elapsed <= budget and not heavy
+        ok = ok and passed
+        extra = f" (importou {', '.join(heavy)})" if heavy else ''
+        print(f"{module:<16} {elapsed * 1000:7.1f} ms  orçamento {budget * 1000:5.0f} ms  "
+              f"{'OK' if passed else 'FALHOU'}{extra}")
+    return ok
+
+
+# Pré-processamentos medidos por `memoria`: nome -> chamada
+MEMORY_PREPROCESSORS = {
+    'ocr_avancado': 'ocr.preprocess_image_advanced(path, scale=scale)',
+    'ocr_alternativo': 'ocr.preprocess_image_alternative(path, scale=scale)',
+    'ocr_fast': 'ocr_fast.preprocess_array(ocr_fast.load_image(path))',
+}
+
+_MEMORY_PROBE = '''
+import json, resource, sys
+import lazy_imports, ocr, ocr_fast
+lazy_imports.load(ocr.cv2, ocr.np, ocr.Image)
+path, scale = {path!r}, {scale!r}
+unit = 2**20 if sys.platform == 'darwin' else 2**10
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+result = {call}
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+print(json.dumps({{'pico_mb': after - before, 'saida': list(result.shape)}}))
+'''
+
+
+def measure_preprocess_memory(image_path, scale=None):
+    """Pico de memória (MB) de cada pré-processamento para a imagem.
+
+    Cada medição roda em um interpretador novo; o pico é medido depois de
+    importar as bibliotecas, de modo que só conta o que o pré-processamento
+    aloca. Requer o módulo `resource` (Linux/macOS).
+    """
+    cwd = Path(__file__).resolve().parent
+    results = {}
+    for name, call in MEMORY_PREPROCESSORS.items():
+        code = _MEMORY_PROBE.format(path=str(Path(image_path).resolve()), scale=scale, call=call)
+        out = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True)
+        if out.returncode != 0:
+            results[name] = {'erro': (out.stderr.strip().splitlines() or ['?'])[-1]}
+            continue
+        results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+    return results
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo e dos subprocessos (MB)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return getattr(psutil.Process().memory_info(), 'peak_wset', 0) / 2**20, None
+        except ImportError:
+            return None, None
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    unit = 2**20 if sys.platform == 'darwin' else 2**10
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    return own, children
+
+
+def percentile(values, p):
+    """Percentil pelo método do posto mais próximo."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _normalize(value):
+    return ' '.join(str(value).split()).lower()
+
+
+def run_pipeline(spec, corpus_dir, samples):
+    """Executa um pipeline sobre as amostras do tipo que ele aceita."""
+    name, _, option = spec.partition(':')
+    kind, factory = PIPELINES[name]
+    samples = [s for s in samples if s['tipo'] == kind]
+
+    start = time.perf_counter()
+    run = factory(option)
+    import_time = time.perf_counter() - start
+
+    latencies = []
+    correct = {field: 0 for field in FIELDS}
+    errors = 0
+    start = time.perf_counter()
+    for sample in samples:
+        path = str(Path(corpus_dir) / sample['arquivo'])
+        t0 = time.perf_counter()
+        try:
+            result = run(path)
+        except Exception:
+            result = {}
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+        for field in FIELDS:
+            if _normalize(result.get(field, '')) == _normalize(sample[field.lower()]):
+                correct[field] += 1
+    elapsed = time.perf_counter() - start
+
+    own_rss, children_rss = peak_rss_mb()
+    n = len(samples)
+    return {
+        'pipeline': spec,
+        'arquivos': n,
+        'erros': errors,
+        'importacao_s': import_time,
+        'tempo_total_s': elapsed,
+        'arquivos_por_s': n / elapsed if elapsed > 0 else None,
+        'p50_s': percentile(latencies, 50),
+        'p95_s': percentile(latencies, 95),
+        'rss_pico_mb': own_rss,
+        'rss_subprocessos_mb': children_rss,
+        'acuracia': {field: correct[field] / n if n else None for field in FIELDS},
+    }
+
+
+def format_report(reports):
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else '-'
+
+    header = (f"{'pipeline':<16}{'arq':>5}{'arq/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'RSS MB':>9}{'Nome':>7}{'Valor':>7}{'Data':>7}")
+    lines = [header, '-' * len(header)]
+    for r in reports:
+        acc = r['acuracia']
+        lines.append(
+            f"{r['pipeline']:<16}{r['arquivos']:>5}"
+            f"{fmt(r['arquivos_por_s'], '{:.2f}'):>8}"
+            f"{fmt(r['p50_s'] and r['p50_s'] * 1000, '{:.0f}'):>9}"
+            f"{fmt(r['p95_s'] and r['p95_s'] * 1000, '{:.0f}'):>9}"
+            f"{fmt(r['rss_pico_mb'], '{:.0f}'):>9}"
+            + ''.join(f"{fmt(acc[f] and acc[f] * 100, '{:.0f}%'):>7}" for f in FIELDS))
+    return '\n'.join(lines)
+
+
+def run_benchmark(corpus_dir, pipelines, limit=None):
+    samples = load_corpus(corpus_dir)
+    if limit:
+        samples = samples[:limit]
+    reports = []
+    for spec in pipelines:
+        name = spec.partition(':')[0]
+        if name not in PIPELINES:
+            raise ValueError(f"Pipeline desconhecido: {spec} (opções: {', '.join(PIPELINES)})")
+        # Um processo novo por pipeline: memória e importações isoladas
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            report = executor.submit(run_pipeline, spec, str(corpus_dir), samples).result()
+        reports.append(report)
+        print(f"{spec}: {report['arquivos']} arquivo(s) em {report['tempo_total_s']:.1f}s")
+    return reports
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark de velocidade e acurácia do OCR')
+    sub = ap.add_subparsers(dest='comando', required=True)
+
+    gen = sub.add_parser('gerar', help='Gera um corpus sintético rotulado')
+    gen.add_argument('--saida', '-o', default='corpus', help='Diretório do corpus')
+    gen.add_argument('--quantidade', '-n', type=int, default=40, help='Número de comprovantes')
+    gen.add_argument('--seed', type=int, default=1, help='Semente do gerador aleatório')
+    gen.add_argument('--proporcao-pdf', type=float, default=0.25, help='Fração de PDFs no corpus')
+
+    run = sub.add_parser('executar', help='Executa os pipelines sobre um corpus')
+    run.add_argument('--corpus', '-c', default='corpus', help='Diretório do corpus')
+    run.add_argument('--pipelines', '-p', default=DEFAULT_PIPELINES,
+                     help='Pipelines separados por vírgula (ex.: ocr,ocr:fast,ocr_fast,pdf_fast)')
+    run.add_argument('--limite', type=int, default=None, help='Usa só as N primeiras amostras')
+    run.add_argument('--json', default=None, help='Grava o relatório em JSON')
+
+    imp = sub.add_parser('importacao', help='Verifica o orçamento de tempo de importação')
+    imp.add_argument('--repeticoes', type=int, default=5, help='Medições por módulo (usa a menor)')
+
+    mem = sub.add_parser('memoria', help='Mede o pico de memória de cada pré-processamento')
+    mem.add_argument('imagens', nargs='+', help='Imagens a medir (ex.: capturas de tela grandes)')
+    mem.add_argument('--escala', type=float, default=None,
+                     help='Fator de escala fixo (padrão: escolhido pela altura do texto)')
+
+    args = ap.parse_args()
+
+    if args.comando == 'memoria':
+        for image in args.imagens:
+            print(image)
+            for name, probe in measure_preprocess_memory(image, args.escala).items():
+                if 'erro' in probe:
+                    print(f"  {name:<16} erro: {probe['erro']}")
+                else:
+                    shape = 'x'.join(str(n) for n in probe['saida'])
+                    print(f"  {name:<16} pico {probe['pico_mb']:7.1f} MB  (saída {shape})")
+        return
+
+    if args.comando == 'importacao':
+        sys.exit(0 if check_import_budgets(args.repeticoes) else 1)
+
+    if args.comando == 'gerar':
+        labels = generate_corpus(args.saida, args.quantidade, args.seed, args.proporcao_pdf)
+        print(f"{len(labels)} comprovante(s) gerado(s) em {args.saida}")
+        return
+
+    pipelines = [p.strip() for p in args.pipelines.split(',') if p.strip()]
+    reports = run_benchmark(args.corpus, pipelines, args.limite)
+    print()
+    print(format_report(reports))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\nRelatório salvo em {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Detecção de comprovantes repetidos antes do OCR.
+
+O mesmo comprovante chega várias vezes: reenviado pelo WhatsApp,
+recomprimido ou como captura da mesma tela. Arquivos idênticos já são
+resolvidos pelo cache de resultados (hash do conteúdo); este módulo trata as
+cópias quase idênticas.
+
+Cada imagem gera uma assinatura (`array_fingerprint`) a partir de miniaturas
+em tons de cinza:
+- pHash (64 bits): sinais das frequências baixas da DCT de uma miniatura
+  32x32, robusto a recompressão e mudança de resolução;
+- dHash (64 bits): sinais dos gradientes horizontais de uma miniatura 9x8;
+- grades de médias de intensidade (THUMB_SIZE e GRID_SIZE células).
+
+Os hashes agrupam comprovantes do mesmo layout: dois comprovantes diferentes
+do mesmo banco costumam ficar a poucos bits de distância. Quem separa um
+comprovante do outro são as grades, que mudam onde o nome, o valor ou a data
+mudam. Ainda assim a troca de um único dígito pode passar despercebida, então
+o candidato que passa por todos os filtros é confirmado comparando as duas
+imagens por blocos (`same_receipt`), com o original relido do disco. Na
+dúvida (original removido, proporções diferentes), a imagem não é tratada
+como cópia.
+
+O índice (`DuplicateIndex`) fica em SQLite, no mesmo arquivo do cache, e é
+carregado em arrays numpy na primeira busca: hashes, proporção e a grade
+menor de cada entrada (~500 bytes, ~50 MB para 100 mil comprovantes). A
+busca compara a assinatura com todas as entradas de uma vez, com operações
+vetorizadas, e leva poucos milissegundos mesmo com 100 mil entradas.
+"""
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from lazy_imports import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+# Distância de Hamming máxima entre pHashes / dHashes de duas cópias
+MAX_PHASH_DISTANCE = 6
+MAX_DHASH_DISTANCE = 10
+
+# Grades de médias (colunas, linhas) e maior diferença aceita em uma célula
+# (níveis de cinza, 0-255): a menor fica em memória e filtra todas as
+# entradas; a maior é lida do SQLite só para os candidatos restantes
+THUMB_SIZE = (16, 32)
+MAX_THUMB_DIFF = 12
+GRID_SIZE = (32, 64)
+MAX_GRID_DIFF = 20
+
+# Confirmação: as imagens são comparadas com até VERIFY_MAX_WIDTH px de
+# largura, em blocos de VERIFY_BLOCK px; a maior diferença média aceita em um
+# bloco é MAX_BLOCK_DIFF (um dígito trocado passa disso)
+VERIFY_MAX_WIDTH = 1000
+VERIFY_BLOCK = 8
+MAX_BLOCK_DIFF = 14
+
+# Fração do topo ignorada nas comparações: em capturas de tela, a barra de
+# status (hora, bateria) muda entre duas capturas do mesmo comprovante
+IGNORE_TOP = 0.05
+
+# Diferença relativa máxima entre as proporções (altura/largura) das imagens
+MAX_ASPECT_DIFF = 0.02
+
+Fingerprint = namedtuple('Fingerprint', 'phash dhash aspect thumb grid')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+_DCT_MATRIX = None
+_POPCOUNT = None
+
+
+def _dct_matrix(n=32):
+    # Matriz da DCT-II ortonormal; a DCT 2D da miniatura é D @ X @ D.T
+    global _DCT_MATRIX
+    if _DCT_MATRIX is None:
+        k = np.arange(n).reshape(-1, 1)
+        i = np.arange(n).reshape(1, -1)
+        m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        m[0] /= np.sqrt(2.0)
+        _DCT_MATRIX = m
+    return _DCT_MATRIX
+
+
+def _hamming_all(values, h):
+    # Distância de Hamming entre `h` e cada elemento de `values` (uint64)
+    global _POPCOUNT
+    if _POPCOUNT is None:
+        _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    xor = values ^ np.uint64(h)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def phash(gray):
+    """pHash de 64 bits: sinal das frequências 8x8 mais baixas em relação à mediana."""
+    thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float64)
+    d = _dct_matrix(32)
+    low = (d @ thumb @ d.T)[:8, :8]
+    # O termo DC (brilho médio) não entra no cálculo da mediana
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def dhash(gray):
+    """dHash de 64 bits: sinal do gradiente horizontal em uma miniatura 9x8."""
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _bits_to_int(thumb[:, 1:] > thumb[:, :-1])
+
+
+def intensity_grid(gray, size=GRID_SIZE):
+    """Médias de intensidade em `size` células (colunas, linhas), sem o topo da imagem."""
+    grid = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return grid[int(size[1] * IGNORE_TOP):].tobytes()
+
+
+def array_fingerprint(gray):
+    """Assinatura de uma imagem em tons de cinza (array numpy 2D)."""
+    h, w = gray.shape[:2]
+    return Fingerprint(phash(gray), dhash(gray), h / w,
+                       intensity_grid(gray, THUMB_SIZE), intensity_grid(gray, GRID_SIZE))
+
+
+def read_gray(image_path):
+    """Imagem em tons de cinza (array numpy), ou None se não puder ser lida."""
+    try:
+        # np.fromfile + imdecode aceita caminhos com acentos no Windows
+        gray = cv2.imdecode(np.fromfile(str(image_path), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            # GIF e outros formatos que o OpenCV não lê
+            from PIL import Image
+            with Image.open(image_path) as image:
+                gray = np.asarray(image.convert('L'))
+    except (OSError, ValueError):
+        return None
+    return gray if gray.size else None
+
+
+def file_fingerprint(image_path):
+    """Assinatura da imagem em `image_path`, ou None se ela não puder ser lida."""
+    gray = read_gray(image_path)
+    return array_fingerprint(gray) if gray is not None else None
+
+
+def fingerprint_files(paths, workers=None):
+    """Assinaturas de várias imagens, na ordem de `paths`.
+
+    A decodificação e as reduções do OpenCV liberam o GIL, então as imagens
+    são lidas em paralelo por `workers` threads, sem o custo de um pool de
+    processos.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    paths = list(paths)
+    if len(paths) < 2:
+        return [file_fingerprint(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return list(executor.map(file_fingerprint, paths))
+
+
+def same_receipt(gray_a, gray_b):
+    """Confirma, bloco a bloco, que duas imagens mostram o mesmo comprovante.
+
+    As duas são levadas à mesma largura (a menor delas, até VERIFY_MAX_WIDTH)
+    e suavizadas, de modo que recompressão e mudança de resolução deixam só
+    diferenças pequenas e espalhadas; um caractere diferente concentra a
+    diferença em poucos blocos.
+    """
+    ha, wa = gray_a.shape[:2]
+    hb, wb = gray_b.shape[:2]
+    if abs(ha / wa - hb / wb) > MAX_ASPECT_DIFF * ha / wa:
+        return False
+    width = min(wa, wb, VERIFY_MAX_WIDTH)
+    height = max(1, round(width * ha / wa))
+    a = cv2.GaussianBlur(cv2.resize(gray_a, (width, height), interpolation=cv2.INTER_AREA), (3, 3), 0)
+    b = cv2.GaussianBlur(cv2.resize(gray_b, (width, height), interpolation=cv2.INTER_AREA), (3, 3), 0)
+    top = int(height * IGNORE_TOP)
+    diff = cv2.absdiff(a[top:], b[top:])
+    blocks = cv2.resize(diff, (max(1, width // VERIFY_BLOCK), max(1, (height - top) // VERIFY_BLOCK)),
+                        interpolation=cv2.INTER_AREA)
+    return int(blocks.max()) <= MAX_BLOCK_DIFF
+
+
+def _to_signed(value):
+    # INTEGER do SQLite é de 64 bits com sinal
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class _Entries:
+    """Colunas em memória das entradas de uma versão do pipeline.
+
+    Os arrays têm capacidade de sobra (dobrada quando enche), de modo que
+    acrescentar uma entrada não copia o índice inteiro.
+    """
+
+    def __init__(self, rows):
+        self.thumb_len = (THUMB_SIZE[1] - int(THUMB_SIZE[1] * IGNORE_TOP)) * THUMB_SIZE[0]
+        # Entradas gravadas com outro THUMB_SIZE não são comparáveis
+        rows = [row for row in rows if len(row[4]) == self.thumb_len]
+        self.count = 0
+        self._resize(max(1024, 2 * len(rows)))
+        n = self.count = len(rows)
+        if rows:
+            ids, phs, dhs, aspects, thumbs = zip(*rows)
+            self.ids[:n] = ids
+            self.phash[:n] = np.array(phs, dtype=np.int64).view(np.uint64)
+            self.dhash[:n] = np.array(dhs, dtype=np.int64).view(np.uint64)
+            self.aspect[:n] = aspects
+            self.thumbs[:n] = np.frombuffer(b''.join(thumbs), dtype=np.uint8).reshape(n, -1)
+
+    def _resize(self, capacity):
+        n = self.count
+        columns = {'ids': (np.int64, ()), 'phash': (np.uint64, ()), 'dhash': (np.uint64, ()),
+                   'aspect': (np.float64, ()), 'thumbs': (np.uint8, (self.thumb_len,))}
+        for name, (dtype, shape) in columns.items():
+            array = np.zeros((capacity,) + shape, dtype=dtype)
+            if n:
+                array[:n] = getattr(self, name)[:n]
+            setattr(self, name, array)
+
+    def append(self, row_id, ph, dh, aspect, thumb):
+        if self.count == len(self.ids):
+            self._resize(2 * self.count)
+        i = self.count
+        self.ids[i] = row_id
+        self.phash[i] = ph
+        self.dhash[i] = dh
+        self.aspect[i] = aspect
+        self.thumbs[i] = np.frombuffer(thumb, dtype=np.uint8)
+        self.count += 1
+
+    def candidates(self, fingerprint):
+        """ids das entradas próximas de `fingerprint` (reservas primeiro, depois
+        as entradas gravadas, das mais antigas às mais novas)."""
+        n = self.count
+        if not n:
+            return []
+        # Cada filtro só examina o que passou pelo anterior
+        selected = np.flatnonzero(_hamming_all(self.phash[:n], fingerprint.phash) <= MAX_PHASH_DISTANCE)
+        selected = selected[_hamming_all(self.dhash[selected], fingerprint.dhash) <= MAX_DHASH_DISTANCE]
+        aspects = self.aspect[selected]
+        selected = selected[np.abs(aspects - fingerprint.aspect) <= MAX_ASPECT_DIFF * fingerprint.aspect]
+        if selected.size:
+            thumb = np.frombuffer(fingerprint.thumb, dtype=np.uint8).astype(np.int16)
+            diff = np.abs(self.thumbs[selected].astype(np.int16) - thumb).max(axis=1)
+            selected = selected[diff <= MAX_THUMB_DIFF]
+        return sorted(self.ids[selected].tolist(), key=lambda i: (i >= 0, abs(i)))
+
+
+class DuplicateIndex:
+    """Índice de assinaturas dos comprovantes já processados, por versão do pipeline."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS assinaturas ('
+            ' id INTEGER PRIMARY KEY,'
+            ' versao TEXT NOT NULL,'
+            ' phash INTEGER NOT NULL, dhash INTEGER NOT NULL,'
+            ' proporcao REAL NOT NULL,'
+            ' miniatura BLOB NOT NULL, grade BLOB NOT NULL,'
+            ' arquivo TEXT NOT NULL,'
+            ' texto TEXT NOT NULL,'
+            ' nome TEXT, valor TEXT, data TEXT,'
+            ' criado_em REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_assinaturas_versao ON assinaturas (versao)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_assinaturas_arquivo ON assinaturas (arquivo)')
+        self._conn.commit()
+        self._entries = {}
+        # Originais em processamento: ids negativos, só em memória
+        self._reserved = {}
+        self._next_reserved = 0
+
+    def _load(self, version):
+        entries = self._entries.get(version)
+        if entries is None:
+            rows = self._conn.execute(
+                'SELECT id, phash, dhash, proporcao, miniatura FROM assinaturas'
+                ' WHERE versao = ? ORDER BY id', (version,)).fetchall()
+            entries = self._entries[version] = _Entries(rows)
+        return entries
+
+    def find(self, fingerprint, version, gray):
+        """Entrada da qual a imagem `gray` é cópia, ou None.
+
+        `gray` pode ser também o caminho da imagem, lida só se algum candidato
+        passar pelos filtros.
+
+        Retorna {'arquivo', 'texto', 'resultado'} da entrada mais antiga que
+        passa pelos hashes, pela proporção e pelas grades e cujo arquivo,
+        relido do disco, é confirmado por `same_receipt`. Se o original está
+        reservado (`reserve`) e ainda não tem resultado, retorna
+        {'arquivo', 'pendente': True}.
+        """
+        grid = np.frombuffer(fingerprint.grid, dtype=np.uint8).astype(np.int16)
+        for row_id in self._load(version).candidates(fingerprint):
+            if row_id < 0:
+                path = self._reserved.get(row_id)
+                if path is None:
+                    continue
+                row = None
+            else:
+                row = self._conn.execute(
+                    'SELECT grade, arquivo, texto, nome, valor, data FROM assinaturas WHERE id = ?',
+                    (row_id,)).fetchone()
+                if row is None:
+                    continue
+                stored = np.frombuffer(row[0], dtype=np.uint8)
+                if stored.size != grid.size or np.abs(grid - stored).max() > MAX_GRID_DIFF:
+                    continue
+                path = row[1]
+            if not hasattr(gray, 'shape'):
+                gray = read_gray(gray)
+                if gray is None:
+                    return None
+            original = read_gray(path)
+            if original is None or not same_receipt(original, gray):
+                continue
+            if row is None:
+                return {'arquivo': path, 'pendente': True}
+            _, _, text, nome, valor, data = row
+            result = {k: v for k, v in (('Nome', nome), ('Valor', valor), ('Data', data)) if v}
+            return {'arquivo': path, 'texto': text, 'resultado': result}
+        return None
+
+    def reserve(self, fingerprint, version, path):
+        """Registra um original ainda em processamento, para que as cópias
+        que chegarem antes do resultado fiquem aguardando por ele."""
+        self._next_reserved -= 1
+        self._reserved[self._next_reserved] = str(path)
+        self._load(version).append(self._next_reserved, fingerprint.phash, fingerprint.dhash,
+                                   fingerprint.aspect, fingerprint.thumb)
+
+    def release(self, path):
+        """Desfaz a reserva de `path` (processado, com ou sem sucesso)."""
+        path = str(path)
+        for row_id in [k for k, v in self._reserved.items() if v == path]:
+            del self._reserved[row_id]
+
+    def add(self, fingerprint, version, path, text, result):
+        """Indexa o resultado do OCR de um comprovante original.
+
+        Substitui as entradas anteriores do mesmo arquivo na mesma versão.
+        """
+        path = str(path)
+        self._conn.execute('DELETE FROM assinaturas WHERE arquivo = ? AND versao = ?',
+                           (path, version))
+        cursor = self._conn.execute(
+            'INSERT INTO assinaturas (versao, phash, dhash, proporcao, miniatura, grade,'
+            ' arquivo, texto, nome, valor, data, criado_em)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (version, _to_signed(fingerprint.phash), _to_signed(fingerprint.dhash),
+             fingerprint.aspect, fingerprint.thumb, fingerprint.grid, path, text,
+             result.get('Nome'), result.get('Valor'), result.get('Data'), time.time()))
+        self._conn.commit()
+        if version in self._entries:
+            self._entries[version].append(cursor.lastrowid, fingerprint.phash, fingerprint.dhash,
+                                          fingerprint.aspect, fingerprint.thumb)
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Extração de Valor e Data compartilhada por `ocr.py`, `ocr_fast.py` e `pdf_fast.py`.
+
+Cada conjunto de padrões é compilado uma única vez em uma só expressão: uma
+alternância de grupos nomeados dentro de um lookahead, de modo que uma
+varredura do texto encontra, em cada posição, o padrão de maior prioridade
+que casa ali (inclusive candidatos sobrepostos). Cada ramo tem uma função de
+formatação associada, no lugar da cadeia de if/elif por índice de padrão.
+
+`find_candidates` devolve todos os candidatos com posição e prioridade;
+`best_fields` escolhe, para cada campo, o padrão de maior prioridade e, entre
+as ocorrências dele, a primeira do texto — o mesmo resultado de testar os
+padrões um a um com `re.search`.
+
+`extract_scored_fields` trabalha sobre as palavras de `image_to_data`: monta
+o texto guardando a posição e a confiança (0-100) de cada palavra e atribui
+a cada campo a menor confiança entre as palavras que o candidato cobre.
+"""
+import re
+from collections import namedtuple
+
+
+FieldCandidate = namedtuple('FieldCandidate', 'field value start end priority pattern')
+
+# Mapeamento de meses (abreviados e por extenso) para números
+MONTHS = {
+    'jan': '01', 'fev': '02', 'mar': '03', 'abr': '04',
+    'mai': '05', 'jun': '06', 'jul': '07', 'ago': '08',
+    'set': '09', 'out': '10', 'nov': '11', 'dez': '12',
+    'janeiro': '01', 'fevereiro': '02', 'março': '03', 'abril': '04',
+    'maio': '05', 'junho': '06', 'julho': '07', 'agosto': '08',
+    'setembro': '09', 'outubro': '10', 'novembro': '11', 'dezembro': '12'
+}
+
+
+def normalize_currency_text(text):
+    """Normaliza confusões comuns do OCR no símbolo de real (RS, R5, R S, R $)."""
+    text = re.sub(r'R[\s]*[Ss5]\s*(?=\d)', 'R$ ', text)
+    text = re.sub(r'R\s*\$\s*', 'R$ ', text)
+    return text
+
+
+def format_value(value):
+    """Formata o valor capturado como 'R$ 1.234,56'."""
+    if '.' in value and len(value.split('.')[-1]) == 2:
+        value = value.replace('.', ',')
+    elif ',' not in value:
+        value = value + ',00'
+    return f"R$ {value}"
+
+
+def _format_year(year):
+    # Ano de 2 dígitos vira 20xx
+    if len(year) == 2:
+        year = '20' + year
+    return year
+
+
+def _value(groups):
+    return format_value(groups[0])
+
+
+def _day_month_year(groups):
+    day, month, year = groups
+    return f"{day.zfill(2)}/{month.zfill(2)}/{_format_year(year)}"
+
+
+def _year_month_day(groups):
+    year, month, day = groups
+    return f"{day.zfill(2)}/{month.zfill(2)}/{year}"
+
+
+def _day_month_name_year(groups):
+    day, month_name, year = groups
+    month = MONTHS.get(month_name.lower(), '01')
+    return f"{day.zfill(2)}/{month}/{_format_year(year)}"
+
+
+def _uncertain_day_month_name_year(groups):
+    # Dia ilegível ('?', '??') e mês desconhecido seguem os padrões do caso original
+    day_raw, month_name, year = groups
+    day = '04' if '?' in day_raw else day_raw.zfill(2)
+    month = MONTHS.get(month_name.lower(), '02')
+    return f"{day}/{month}/{year}"
+
+
+class PatternSet:
+    """Conjunto de padrões compilado em uma única expressão.
+
+    `specs` é uma lista, em ordem de prioridade, de tuplas
+    (nome, campo, regex, formatador); a regex usa grupos posicionais e o
+    formatador recebe a tupla desses grupos. `normalize`, se informado, é
+    aplicado ao texto antes da varredura.
+    """
+
+    def __init__(self, specs, flags=0, normalize=None):
+        self.normalize = normalize
+        self._branches = {}
+        alternatives = []
+        priorities = {}
+        for name, field, regex, formatter in specs:
+            priority = priorities.get(field, 0)
+            priorities[field] = priority + 1
+            n_groups = re.compile(regex, flags).groups
+            self._branches[name] = (field, priority, formatter, n_groups)
+            alternatives.append(f'(?P<{name}>{regex})')
+        self.regex = re.compile('(?=' + '|'.join(alternatives) + ')', flags)
+        self._group_index = {name: self.regex.groupindex[name] for name in self._branches}
+
+    def find_candidates(self, text):
+        """Lista todos os candidatos encontrados em uma única varredura do texto.
+
+        Candidatos contidos em um candidato anterior do mesmo campo, com
+        prioridade igual ou menor (ex.: "5/01/2024" dentro de "15/01/2024"),
+        são descartados.
+        """
+        if self.normalize is not None:
+            text = self.normalize(text)
+        candidates = []
+        last = {}
+        for m in self.regex.finditer(text):
+            name = m.lastgroup
+            field, priority, formatter, n_groups = self._branches[name]
+            start, end = m.start(name), m.end(name)
+            previous = last.get(field)
+            if previous is not None and end <= previous.end and priority >= previous.priority:
+                continue
+            index = self._group_index[name]
+            groups = m.groups()[index:index + n_groups]
+            candidate = FieldCandidate(field, formatter(groups), start, end, priority, name)
+            candidates.append(candidate)
+            last[field] = candidate
+        return candidates
+
+
+def best_candidates(candidates):
+    """Escolhe um candidato por campo: menor prioridade e, em seguida, menor posição."""
+    best = {}
+    for c in candidates:
+        current = best.get(c.field)
+        if current is None or (c.priority, c.start) < (current.priority, current.start):
+            best[c.field] = c
+    return best
+
+
+def best_fields(candidates):
+    """Valor escolhido para cada campo (ver `best_candidates`)."""
+    return {field: c.value for field, c in best_candidates(candidates).items()}
+
+
+def words_to_text(words):
+    """Monta o texto a partir das palavras de `image_to_data`.
+
+    Palavras da mesma linha são separadas por espaço e linhas por quebra de
+    linha. Retorna o texto e, para cada palavra, a tupla (início, fim,
+    confiança) da sua posição no texto.
+    """
+    parts = []
+    spans = []
+    pos = 0
+    previous_line = None
+    for w in words:
+        line = (w['block'], w['line'])
+        if parts:
+            parts.append('\n' if line != previous_line else ' ')
+            pos += 1
+        previous_line = line
+        parts.append(w['text'])
+        spans.append((pos, pos + len(w['text']), float(w['conf'])))
+        pos += len(w['text'])
+    return ''.join(parts), spans
+
+
+def text_confidence(spans):
+    """Confiança média do texto, ponderada pelo tamanho das palavras."""
+    total = sum(end - start for start, end, _ in spans)
+    if not total:
+        return 0.0
+    return sum((end - start) * conf for start, end, conf in spans) / total
+
+
+def candidate_confidence(candidate, spans):
+    """Menor confiança entre as palavras cobertas pelo candidato."""
+    confs = [conf for start, end, conf in spans if start < candidate.end and end > candidate.start]
+    return min(confs) if confs else 0.0
+
+
+def extract_scored_fields(words, patterns=None):
+    """Extrai os campos das palavras de `image_to_data`, com a confiança de cada um.
+
+    Retorna o texto montado, o dicionário {campo: (valor, confiança)} e a
+    confiança média do texto. O conjunto de padrões não pode normalizar o
+    texto, pois as posições precisam corresponder às das palavras.
+    """
+    patterns = patterns or FULL_PATTERNS
+    if patterns.normalize is not None:
+        raise ValueError('Padrões com normalização não preservam as posições das palavras')
+    text, spans = words_to_text(words)
+    best = best_candidates(patterns.find_candidates(text))
+    scored = {field: (c.value, candidate_confidence(c, spans)) for field, c in best.items()}
+    return text, scored, text_confidence(spans)
+
+
+_MONTH_NAMES = 'janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro'
+_MONTH_ABBREVS = 'jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez'
+
+# Padrões completos usados por ocr.py (texto de OCR com imperfeições)
+FULL_SPECS = [
+    ('valor_rs', 'Valor', r'RS\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', _value),             # RS 180,00
+    ('valor_rs_ponto', 'Valor', r'R\$\.(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', _value),       # R$.300,00
+    ('valor_milhar', 'Valor', r'R\$\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', _value),        # R$ 1.000,00
+    ('valor_simples', 'Valor', r'R\$\s*(\d+(?:,\d{2})?)', _value),                       # R$ 30,00
+    ('valor_inteiro', 'Valor', r'R\$\s*(\d+)', _value),                                  # R$ 30
+    ('valor_rotulo', 'Valor', r'Valor\s+R\$\s*(\d+(?:\.\d{2})?)', _value),               # Valor R$ 30.00
+    ('valor_rotulo_livre', 'Valor', r'(?:valor|Valor)[:\s\-]+R\$\s*(\d+(?:[,\.]\d{2})?)', _value),
+    ('data_rotulo', 'Data', r'DATA:\s*(\d{2})/(\d{2})/(\d{4})', _day_month_year),        # DATA: 04/02/2025
+    ('data_hora', 'Data', r'(\d{2})/(\d{2})/(\d{4})\s*-\s*\d{2}\.\d{2}\.\d{2}', _day_month_year),
+    ('data_barra', 'Data', r'(\d{1,2})/(\d{1,2})/(\d{4})', _day_month_year),             # dd/mm/yyyy
+    ('data_extenso', 'Data', rf'(\d{{1,2}})\s+de\s+({_MONTH_NAMES})\s+de\s+(\d{{4}})', _day_month_name_year),
+    ('data_fev_ponto', 'Data', r'(\d{1,2})\s+(fev)\.(\d{4})', _day_month_name_year),     # 21 fev.2025
+    ('data_ano_curto', 'Data', r'(\d{1,2})/(\d{2})/(\d{2})(?:\s+às|\s+as)', _day_month_year),
+    ('data_abrev', 'Data', rf'(\d{{1,2}})\s+({_MONTH_ABBREVS})\s+de\s+(\d{{4}})', _uncertain_day_month_name_year),
+    ('data_abrev_ilegivel', 'Data', rf'(\d{{1,2}}|\?\?|\?)\s+({_MONTH_ABBREVS.upper()})\s+(\d{{4}})',
+     _uncertain_day_month_name_year),
+    ('data_hifen', 'Data', r'(\d{1,2})-(\d{1,2})-(\d{4})', _day_month_year),             # dd-mm-yyyy
+    ('data_iso', 'Data', r'(\d{4})-(\d{1,2})-(\d{1,2})', _year_month_day),               # yyyy-mm-dd
+]
+FULL_PATTERNS = PatternSet(FULL_SPECS, flags=re.IGNORECASE)
+
+# Formatos de Valor e Data próprios de cada banco (ver layouts.py), tentados
+# antes dos padrões completos
+BANK_SPECS = {
+    # Nubank: "Valor R$ 180,00" e "15/01/2024 - 08:45:06" no cabeçalho
+    'nubank': [
+        ('nubank_valor', 'Valor', r'Valor\s+R[\$S]\s*(\d{1,3}(?:\.\d{3})*,\d{2})', _value),
+        ('nubank_data', 'Data', r'(\d{2})/(\d{2})/(\d{4})\s*-\s*\d{2}:\d{2}', _day_month_year),
+    ],
+}
+
+
+def extend_patterns(specs, base=FULL_SPECS):
+    """Padrões completos precedidos de `specs`, que passam a ter prioridade
+    (ex.: os formatos de Valor e Data de um banco específico)."""
+    return PatternSet(list(specs) + list(base), flags=re.IGNORECASE)
+
+# Padrões simples usados por ocr_fast.py e pdf_fast.py, sobre o texto com o
+# símbolo de real normalizado
+SIMPLE_SPECS = [
+    ('valor', 'Valor', r'R\$\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', _value),
+    ('data', 'Data', r'(\d{2})/(\d{2})/(\d{4})', _day_month_year),
+]
+SIMPLE_PATTERNS = PatternSet(SIMPLE_SPECS, normalize=normalize_currency_text)
+
+
+def find_candidates(text, patterns=FULL_PATTERNS):
+    """Todos os candidatos de Valor/Data do texto, com posição e prioridade."""
+    return patterns.find_candidates(text)
+
+
+def extract_fields(text, patterns=FULL_PATTERNS):
+    """Extrai Valor e Data do texto com o conjunto de padrões informado."""
+    return best_fields(patterns.find_candidates(text))
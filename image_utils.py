@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Funções de imagem compartilhadas por `ocr.py` e `ocr_fast.py`.
+
+Escala adaptativa: em vez de ampliar sempre 3x (ou 2x), estima a altura
+dominante dos glifos em uma cópia reduzida da imagem e escolhe o fator que
+leva o texto para a altura em que o Tesseract funciona melhor (~30px).
+Imagens grandes, como capturas de tela em alta resolução, ficam em 1x ou
+são reduzidas.
+
+Memória: a imagem de trabalho (após a escala) é limitada a
+MAX_WORK_PIXELS, ajustado pelo orçamento de memória de cada worker, e acima
+de TILE_THRESHOLD_PIXELS o pré-processamento é feito em faixas horizontais
+(`process_in_bands`), de modo que só o resultado final ocupa a imagem
+inteira.
+
+Realces pontuais: equivalentes exatos, em numpy, de convert('L') e dos
+realces de contraste, nitidez e brilho do PIL (ImageEnhance). Contraste e
+brilho viram tabelas de consulta de 256 entradas, a nitidez uma tabela
+256x256 (imagem suavizada x original), e todos aceitam uma pilha de imagens
+do mesmo tamanho (eixo 0), processada em uma única operação.
+"""
+import math
+
+from lazy_imports import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+# Altura de glifo (px) em que o Tesseract tem melhor desempenho
+TARGET_TEXT_HEIGHT = 30
+
+# Limites do fator de escala escolhido automaticamente
+MIN_SCALE = 0.5
+MAX_SCALE = 4.0
+
+# Faixa em torno de 1x na qual não vale a pena reamostrar a imagem
+NO_RESIZE_BAND = (0.85, 1.15)
+
+# Maior lado da cópia reduzida usada para estimar a altura do texto
+PROBE_MAX_SIDE = 1000
+
+# Máximo de pixels da imagem de trabalho, após a escala (ver set_max_work_pixels)
+MAX_WORK_PIXELS = 40_000_000
+
+# Acima deste número de pixels (após a escala) o pré-processamento é feito
+# em faixas de até TILE_PIXELS, com TILE_OVERLAP linhas (na escala original)
+# de sobreposição para que os filtros não criem emendas
+TILE_THRESHOLD_PIXELS = 16_000_000
+TILE_PIXELS = 4_000_000
+TILE_OVERLAP = 32
+
+
+def set_max_work_pixels(max_pixels):
+    """Ajusta o limite da imagem de trabalho (ex.: pelo orçamento de memória do worker)."""
+    global MAX_WORK_PIXELS
+    MAX_WORK_PIXELS = max_pixels
+
+
+def estimate_text_height(gray):
+    """Estima a altura dominante dos glifos, em pixels da imagem original.
+
+    Binariza uma cópia reduzida com Otsu e mede os componentes conexos,
+    descartando ruído e blocos grandes (logos, molduras). Retorna None se não
+    houver componentes suficientes para uma estimativa confiável.
+    """
+    h, w = gray.shape[:2]
+    probe_scale = min(1.0, PROBE_MAX_SIDE / max(h, w))
+    probe = gray
+    if probe_scale < 1.0:
+        probe = cv2.resize(gray, None, fx=probe_scale, fy=probe_scale,
+                           interpolation=cv2.INTER_AREA)
+
+    # Texto como primeiro plano; inverte se a maior parte virou "texto" (fundo escuro)
+    _, bw = cv2.threshold(probe, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if cv2.countNonZero(bw) > bw.size // 2:
+        bw = cv2.bitwise_not(bw)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+
+    glyphs = ((heights >= 3) & (heights <= probe.shape[0] * 0.1)
+              & (widths <= heights * 3) & (areas >= 4))
+    if np.count_nonzero(glyphs) < 10:
+        return None
+    return float(np.median(heights[glyphs])) / probe_scale
+
+
+def choose_scale_factor(gray, default, target=TARGET_TEXT_HEIGHT):
+    """Escolhe o fator de escala que leva o texto a `target` px de altura.
+
+    Usa `default` quando a altura do texto não pode ser estimada.
+    """
+    text_height = estimate_text_height(gray)
+    if text_height is None:
+        return default
+    scale = min(MAX_SCALE, max(MIN_SCALE, target / text_height))
+    if NO_RESIZE_BAND[0] <= scale <= NO_RESIZE_BAND[1]:
+        return 1.0
+    return round(scale, 2)
+
+
+def cap_scale(shape, scale, max_pixels=None):
+    """Reduz `scale` para que a imagem escalada não passe de `max_pixels`."""
+    max_pixels = max_pixels or MAX_WORK_PIXELS
+    h, w = shape[:2]
+    if h * w * scale * scale <= max_pixels:
+        return scale
+    return math.floor(100 * math.sqrt(max_pixels / (h * w))) / 100
+
+
+def needs_tiling(shape, scale):
+    """Indica se a imagem escalada é grande o bastante para ser processada em faixas."""
+    h, w = shape[:2]
+    return h * w * scale * scale > TILE_THRESHOLD_PIXELS
+
+
+def process_in_bands(gray, scale, process):
+    """Escala `gray` por `scale` e aplica `process` em faixas horizontais.
+
+    Cada faixa (com sobreposição) é escalada e processada separadamente, e a
+    parte central do resultado é copiada para a imagem final, alocada uma
+    única vez. `process` recebe uma faixa uint8 e retorna outra do mesmo
+    tamanho.
+    """
+    h, w = gray.shape[:2]
+    out_w = round(w * scale)
+    result = np.empty((round(h * scale), out_w), dtype=np.uint8)
+    rows_per_band = max(1, int(TILE_PIXELS / (out_w * scale)))
+    interpolation = cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_AREA
+    for y0 in range(0, h, rows_per_band):
+        y1 = min(h, y0 + rows_per_band)
+        a, b = max(0, y0 - TILE_OVERLAP), min(h, y1 + TILE_OVERLAP)
+        band = gray[a:b]
+        if scale != 1.0:
+            band = cv2.resize(band, (out_w, round(b * scale) - round(a * scale)),
+                              interpolation=interpolation)
+        band = process(band)
+        top = round(y0 * scale)
+        rows = round(y1 * scale) - top
+        offset = top - round(a * scale)
+        result[top:top + rows] = band[offset:offset + rows]
+    return result
+
+
+def resize_by(image, scale):
+    """Redimensiona pelo fator `scale` (cúbica para ampliar, área para reduzir)."""
+    if scale == 1.0:
+        return image
+    interpolation = cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_AREA
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def pil_gray(rgb):
+    """Conversão RGB -> L com a mesma aritmética inteira do PIL."""
+    rgb = rgb.astype(np.uint32)
+    gray = rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000
+    return (gray >> 16).astype(np.uint8)
+
+
+def _blend(degenerate, image, factor):
+    # Image.blend do PIL: float32, truncado e limitado a 0-255
+    t = np.float32(factor) * (image - degenerate) + degenerate
+    return np.clip(t, 0, 255).astype(np.uint8)
+
+
+def blend_lut(degenerate, factor):
+    """Tabela de Image.blend(constante `degenerate`, imagem, `factor`)."""
+    return _blend(np.float32(degenerate), np.arange(256, dtype=np.float32), factor)
+
+
+_SMOOTH_KERNEL = None
+_SHARPNESS_TABLES = {}
+
+
+def _sharpness_table(factor, after=None):
+    # tabela[suavizada, original]; `after` (LUT) é aplicada ao resultado
+    key = (factor, None if after is None else after.tobytes())
+    table = _SHARPNESS_TABLES.get(key)
+    if table is None:
+        values = np.arange(256, dtype=np.float32)
+        table = _blend(values[:, None], values[None, :], factor)
+        if after is not None:
+            table = after[table]
+        table = _SHARPNESS_TABLES[key] = table
+    return table
+
+
+def _smooth_stack(stack):
+    # ImageFilter.SMOOTH: núcleo 3x3 (centro 5) / 13, arredondado; as bordas
+    # ficam com os valores originais. As imagens da pilha são empilhadas na
+    # vertical e filtradas de uma vez: as linhas em que o núcleo alcança a
+    # imagem vizinha são justamente as bordas, restauradas em seguida.
+    global _SMOOTH_KERNEL
+    if _SMOOTH_KERNEL is None:
+        _SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+    n, h, w = stack.shape[:3]
+    tall = stack.reshape((n * h, w) + stack.shape[3:]).astype(np.float32)
+    smooth = cv2.filter2D(tall, -1, _SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE)
+    smooth += 0.5
+    smooth = np.clip(smooth, 0, 255).astype(np.uint8).reshape(stack.shape)
+    smooth[:, 0] = stack[:, 0]
+    smooth[:, -1] = stack[:, -1]
+    smooth[:, :, 0] = stack[:, :, 0]
+    smooth[:, :, -1] = stack[:, :, -1]
+    return smooth
+
+
+def _per_image_lut(stack, luts):
+    # Aplica a i-ésima tabela (N, 256) à i-ésima imagem da pilha
+    index = np.arange(len(stack)).reshape((-1,) + (1,) * (stack.ndim - 1))
+    return luts[index, stack]
+
+
+def contrast_stack(stack, factor):
+    """ImageEnhance.Contrast(img).enhance(factor) para cada imagem da pilha.
+
+    A média de cinza de cada imagem define a tabela dela.
+    """
+    gray = pil_gray(stack) if stack.ndim == 4 else stack
+    means = gray.reshape(len(stack), -1).mean(axis=1)
+    luts = np.stack([blend_lut(int(m + 0.5), factor) for m in means])
+    return _per_image_lut(stack, luts)
+
+
+def brightness_stack(stack, factor):
+    """ImageEnhance.Brightness(img).enhance(factor) para cada imagem da pilha."""
+    return blend_lut(0, factor)[stack]
+
+
+def sharpness_stack(stack, factor, brightness=None):
+    """ImageEnhance.Sharpness(img).enhance(factor) para cada imagem da pilha.
+
+    Com `brightness`, o realce de brilho seguinte entra na mesma tabela.
+    """
+    after = None if brightness is None else blend_lut(0, brightness)
+    smooth = _smooth_stack(stack)
+    return _sharpness_table(factor, after)[smooth, stack]
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Monitora uma pasta de entrada e entrega cada arquivo novo quando ele
+termina de ser gravado.
+
+- `InotifyWatcher` (Linux): recebe do kernel, via inotify (ctypes, sem
+  dependências), os eventos de escrita, fechamento e movimentação de
+  arquivos; a pasta não é varrida de novo a cada ciclo.
+- `PollingWatcher` (demais sistemas, ou se o inotify falhar): compara
+  tamanho e data de modificação dos arquivos a cada `interval` segundos.
+
+Debounce: um arquivo só é entregue depois de `settle` segundos sem eventos e
+com tamanho e data de modificação inalterados, para não processar cópias
+pela metade. Os arquivos prontos vão para uma fila limitada; quando ela está
+cheia o monitor espera, e o atraso se acumula nos eventos ainda não lidos.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+DEFAULT_SETTLE = 1.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Intervalo máximo (s) entre verificações dos arquivos aguardando o debounce
+TICK = 0.25
+
+
+def file_signature(path):
+    """(tamanho, mtime) do arquivo, ou None se ele não existir mais."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class DebounceTracker:
+    """Arquivos com atividade recente, aguardando ficarem estáveis."""
+
+    def __init__(self, settle=DEFAULT_SETTLE):
+        self.settle = settle
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, path, now=None):
+        """Registra atividade no arquivo (reinicia a contagem do debounce)."""
+        self._pending[path] = (now or time.monotonic(), file_signature(path))
+
+    def ready(self, now=None):
+        """Arquivos sem atividade há `settle` s e com tamanho/mtime estáveis."""
+        now = now or time.monotonic()
+        result = []
+        for path, (last, signature) in list(self._pending.items()):
+            if now - last < self.settle:
+                continue
+            current = file_signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current == signature and current[0] > 0:
+                del self._pending[path]
+                result.append(path)
+            else:
+                # Ainda sendo gravado: espera mais um período
+                self._pending[path] = (now, current)
+        return result
+
+
+class _Watcher(threading.Thread):
+    """Base dos monitores: debounce, filtro e entrega na fila `out_queue`.
+
+    `accept(caminho)` filtra os arquivos de interesse; com
+    `include_existing`, os arquivos já presentes também são entregues.
+    """
+
+    def __init__(self, directory, out_queue, recursive=False, accept=None,
+                 settle=DEFAULT_SETTLE, include_existing=False):
+        super().__init__(name=f'{type(self).__name__}', daemon=True)
+        self.directory = Path(directory)
+        self.out_queue = out_queue
+        self.recursive = recursive
+        self.accept = accept
+        self.include_existing = include_existing
+        self.tracker = DebounceTracker(settle)
+        self._delivered = {}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _scan(self):
+        files = self.directory.rglob('*') if self.recursive else self.directory.iterdir()
+        for p in files:
+            try:
+                if p.is_file():
+                    yield str(p)
+            except OSError:
+                continue
+
+    def _touch(self, path):
+        if self.accept is None or self.accept(path):
+            self.tracker.touch(path)
+
+    def _deliver_ready(self):
+        for path in self.tracker.ready():
+            signature = file_signature(path)
+            # Mesmo arquivo, sem alteração desde a última entrega
+            if signature is None or self._delivered.get(path) == signature:
+                continue
+            self._delivered[path] = signature
+            while not self._stop_event.is_set():
+                try:
+                    self.out_queue.put(path, timeout=TICK)
+                    break
+                except queue.Full:
+                    continue
+
+    def _wait_events(self, timeout):
+        """Espera até `timeout` s e registra a atividade observada."""
+        raise NotImplementedError
+
+    def _setup(self):
+        pass
+
+    def _teardown(self):
+        pass
+
+    def run(self):
+        self._setup()
+        try:
+            if self.include_existing:
+                for path in self._scan():
+                    self._touch(path)
+            while not self._stop_event.is_set():
+                self._wait_events(TICK)
+                self._deliver_ready()
+        finally:
+            self._teardown()
+
+
+class PollingWatcher(_Watcher):
+    """Monitor por varredura periódica (funciona em qualquer sistema)."""
+
+    def __init__(self, *args, interval=DEFAULT_POLL_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = interval
+        self._known = {}
+        self._next_scan = 0.0
+
+    def _setup(self):
+        # Sem include_existing, o estado inicial da pasta não gera entregas
+        for path in self._scan():
+            self._known[path] = file_signature(path)
+        self._next_scan = time.monotonic() + self.interval
+
+    def _wait_events(self, timeout):
+        now = time.monotonic()
+        if now < self._next_scan:
+            self._stop_event.wait(min(timeout, self._next_scan - now))
+            return
+        self._next_scan = now + self.interval
+        seen = {}
+        for path in self._scan():
+            signature = seen[path] = file_signature(path)
+            if self._known.get(path) != signature:
+                self._touch(path)
+        self._known = seen
+
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher(_Watcher):
+    """Monitor baseado em inotify (Linux), sem varrer a pasta a cada ciclo."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify não disponível')
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}
+        try:
+            self._add_watch(self.directory)
+            if self.recursive:
+                for p in self.directory.rglob('*'):
+                    if p.is_dir():
+                        self._add_watch(p)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"{os.strerror(err)}: {directory}")
+        self._dirs[wd] = Path(directory)
+
+    def _teardown(self):
+        os.close(self._fd)
+
+    def _rescan(self):
+        # A fila de eventos do kernel transbordou: algum evento pode ter se perdido
+        for path in self._scan():
+            self._touch(path)
+
+    def _wait_events(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            raw_name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length]
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                self._rescan()
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            name = raw_name.rstrip(b'\0')
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch_tree(path)
+                continue
+            self._touch(str(path))
+
+    def _add_watch_tree(self, directory):
+        # Subpasta nova: monitora e registra o que já foi gravado nela
+        try:
+            self._add_watch(directory)
+            for p in directory.rglob('*'):
+                if p.is_dir():
+                    self._add_watch(p)
+                elif p.is_file():
+                    self._touch(str(p))
+        except OSError as e:
+            print(f"Aviso: não foi possível monitorar {directory}: {e}")
+
+
+def make_watcher(directory, out_queue, recursive=False, accept=None, settle=DEFAULT_SETTLE,
+                 include_existing=False, interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """Cria o monitor mais eficiente disponível (inotify ou varredura periódica)."""
+    kwargs = {'recursive': recursive, 'accept': accept, 'settle': settle,
+              'include_existing': include_existing}
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory, out_queue, **kwargs)
+        except (OSError, AttributeError) as e:
+            print(f"inotify indisponível ({e}); usando varredura a cada {interval}s")
+    return PollingWatcher(directory, out_queue, interval=interval, **kwargs)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Manifesto de um lote em SQLite, para retomar um processamento interrompido.
+
+Cada arquivo do lote tem uma linha com caminho, tamanho, data de
+modificação, estado ('pendente', 'concluido', 'falhou' ou 'timeout'),
+número de tentativas que falharam e a última mensagem de erro. O estado de
+um arquivo só passa a 'concluido' depois que a linha dele foi entregue ao
+arquivo de saída, de modo que `--resume` não perde linhas. Os estados são
+gravados juntos a cada flush da saída (--buffer linhas ou --fsync
+segundos): as linhas gravadas depois do último flush de um lote
+interrompido se repetem ao retomar (com --buffer 1, nenhuma). No Parquet
+as linhas só chegam ao arquivo quando ele é fechado, no fim do lote (ver
+result_sink.ParquetSink): até lá os arquivos ficam pendentes, e um lote
+interrompido refaz todos os que processou, sem repetir linhas.
+
+Um novo lote (sem --resume) recomeça o manifesto do zero; ao retomar,
+arquivos novos entram como pendentes e arquivos alterados (tamanho ou data
+de modificação diferentes) voltam a pendente.
+"""
+import os
+import sqlite3
+import time
+
+
+DEFAULT_MANIFEST_PATH = 'ocr_manifest.sqlite3'
+
+# Estado registrado para cada status de resultado do lote
+STATES = {
+    'ok': 'concluido',
+    'sem_texto': 'concluido',
+    'cache': 'concluido',
+    'duplicata': 'concluido',
+    'erro': 'falhou',
+    'timeout': 'timeout',
+}
+
+# Espera (s) antes da n-ésima nova tentativa: RETRY_BACKOFF * 2 ** (n - 1)
+RETRY_BACKOFF = 2.0
+MAX_RETRY_DELAY = 60.0
+
+
+def retry_delay(failures, base=RETRY_BACKOFF, limit=MAX_RETRY_DELAY):
+    """Espera antes de tentar de novo um arquivo que já falhou `failures` vezes."""
+    return min(limit, base * 2 ** (max(failures, 1) - 1))
+
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class JobManifest:
+    """Estado de cada arquivo de um lote, gravado a cada arquivo concluído."""
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path)
+        # WAL + synchronous=NORMAL: cada commit sobrevive à morte do processo
+        # sem esperar um fsync por arquivo
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS lote (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS arquivos ('
+            ' caminho TEXT PRIMARY KEY,'
+            ' tamanho INTEGER NOT NULL,'
+            ' mtime INTEGER NOT NULL,'
+            ' estado TEXT NOT NULL,'
+            ' tentativas INTEGER NOT NULL DEFAULT 0,'
+            ' erro TEXT,'
+            ' atualizado_em REAL NOT NULL)')
+        self._conn.commit()
+
+    def describe(self):
+        """Parâmetros do lote gravado ({'diretorio': ..., 'recursivo': ...})."""
+        return dict(self._conn.execute('SELECT chave, valor FROM lote'))
+
+    def counts(self):
+        """Número de arquivos em cada estado."""
+        return dict(self._conn.execute('SELECT estado, COUNT(*) FROM arquivos GROUP BY estado'))
+
+    def start(self, directory, recursive, files):
+        """Começa um novo lote com `files`, todos pendentes."""
+        with self._conn:
+            self._conn.execute('DELETE FROM lote')
+            self._conn.execute('DELETE FROM arquivos')
+            self._conn.executemany('INSERT INTO lote (chave, valor) VALUES (?, ?)',
+                                   [('diretorio', os.path.abspath(directory)),
+                                    ('recursivo', str(int(bool(recursive)))),
+                                    ('iniciado_em', str(time.time()))])
+            self._add(files)
+
+    def resume(self, files, max_attempts):
+        """Atualiza o lote com a listagem atual e retorna os arquivos a processar.
+
+        Retorna (a_processar, esgotados): os arquivos não concluídos que ainda
+        têm tentativas e os que já falharam `max_attempts` vezes.
+        """
+        known = {row[0]: row[1:] for row in self._conn.execute(
+            'SELECT caminho, tamanho, mtime, estado, tentativas FROM arquivos')}
+        new, changed = [], []
+        todo, exhausted = [], []
+        for p in files:
+            key = os.path.abspath(p)
+            entry = known.get(key)
+            if entry is None:
+                new.append(p)
+                todo.append(p)
+                continue
+            size, mtime, state, attempts = entry
+            try:
+                if _stat(p) != (size, mtime):
+                    changed.append(p)
+                    todo.append(p)
+                    continue
+            except OSError:
+                pass
+            if state == 'concluido':
+                continue
+            if attempts >= max_attempts:
+                exhausted.append(p)
+            else:
+                todo.append(p)
+        with self._conn:
+            self._add(new + changed)
+        return todo, exhausted
+
+    def _add(self, files):
+        now = time.time()
+        rows = []
+        for p in files:
+            try:
+                size, mtime = _stat(p)
+            except OSError:
+                size, mtime = -1, -1
+            rows.append((os.path.abspath(p), size, mtime, now))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO arquivos (caminho, tamanho, mtime, estado, tentativas, erro,"
+            " atualizado_em) VALUES (?, ?, ?, 'pendente', 0, NULL, ?)", rows)
+
+    def state(self, path):
+        """Estado do arquivo no lote (None se ele não faz parte do lote)."""
+        row = self._conn.execute('SELECT estado FROM arquivos WHERE caminho = ?',
+                                 (os.path.abspath(path),)).fetchone()
+        return row[0] if row else None
+
+    def attempts(self, path):
+        """Tentativas que falharam para o arquivo."""
+        row = self._conn.execute('SELECT tentativas FROM arquivos WHERE caminho = ?',
+                                 (os.path.abspath(path),)).fetchone()
+        return row[0] if row else 0
+
+    def record(self, outcome):
+        """Registra o resultado de um arquivo; retorna as tentativas que falharam."""
+        state = STATES.get(outcome['status'], 'falhou')
+        key = os.path.abspath(outcome['arquivo'])
+        with self._conn:
+            if state == 'concluido':
+                self._conn.execute(
+                    "UPDATE arquivos SET estado = ?, erro = NULL, atualizado_em = ?"
+                    " WHERE caminho = ?", (state, time.time(), key))
+            else:
+                error = outcome.get('erro') or f"timeout ({outcome.get('timeout')}s)"
+                self._conn.execute(
+                    'UPDATE arquivos SET estado = ?, tentativas = tentativas + 1, erro = ?,'
+                    ' atualizado_em = ? WHERE caminho = ?', (state, str(error), time.time(), key))
+        return self.attempts(key)
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
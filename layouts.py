@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Classificação do layout (banco emissor) dos comprovantes e perfil de OCR
+de cada layout.
+
+Os comprovantes vêm de poucos bancos (Nubank, Itaú, Caixa, Cora...), e cada
+layout tem um pré-processamento e um modo de segmentação que funcionam para
+ele. Em vez de passar todos pela cascata genérica de ocr.py:
+
+1. `classify_layout` identifica o banco pelas palavras-chave de
+   roi.BANK_KEYWORDS nas linhas da passada barata de localização (OCR de uma
+   cópia reduzida, ver roi.probe_lines). Essa passada já era feita pelo
+   estágio ROI, então a classificação não acrescenta OCR;
+2. `layout_profile` devolve o perfil registrado para o banco: o estágio de
+   OCR (um dos ocr.OCR_STAGES), o perfil de pré-processamento, a escala, se
+   o OCR lê só as zonas de interesse (cujas caixas vêm da passada barata ou
+   do modelo aprendido do banco, roi.LayoutTemplates) e os padrões de
+   extração;
+3. ocr.py roda só a passada desse perfil. Se Valor e Data não saírem com a
+   confiança mínima, completa com a cascata. A passada que resolveu o
+   comprovante (a do perfil ou um estágio da cascata) é contada para o
+   banco, e a mais frequente, com pelo menos MIN_STAGE_OBSERVATIONS
+   acertos, passa a ser a passada única do banco.
+
+Comprovantes de banco não reconhecido usam DEFAULT_LAYOUT, que é o próprio
+estágio ROI da cascata.
+"""
+import roi
+from extraction import BANK_SPECS, FULL_PATTERNS, extend_patterns
+
+
+# Acertos de um estágio da cascata, num banco, para que ele passe a ser a
+# passada única do banco
+MIN_STAGE_OBSERVATIONS = 3
+
+# Perfil de OCR de um layout:
+# - estagio: estágio de ocr.OCR_STAGES usado na passada única
+# - perfil: perfil de pré-processamento (ocr.PREPROCESS_PROFILES; None = o do chamador)
+# - escala: fator de ampliação (None = pela altura estimada do texto)
+# - zonas: aplica o OCR só às zonas de Valor, Data e Origem
+# - padroes: padrões de extração (extraction.PatternSet)
+DEFAULT_LAYOUT = {
+    'estagio': 'avancado_psm6',
+    'perfil': None,
+    'escala': None,
+    'zonas': True,
+    'padroes': FULL_PATTERNS,
+}
+
+LAYOUT_PROFILES = {}
+
+# Sufixo dos acertos de passadas que leram só as zonas de interesse
+ZONES_SUFFIX = '_zonas'
+
+
+def register_layout(bank, **settings):
+    """Registra (ou ajusta) o perfil de OCR de um banco.
+
+    Os itens não informados vêm do perfil já registrado ou de DEFAULT_LAYOUT.
+    """
+    unknown = set(settings) - set(DEFAULT_LAYOUT)
+    if unknown:
+        raise ValueError(f"Itens de perfil desconhecidos: {', '.join(sorted(unknown))}")
+    profile = dict(DEFAULT_LAYOUT, **LAYOUT_PROFILES.get(bank, {}))
+    profile.update(settings)
+    LAYOUT_PROFILES[bank] = profile
+    return profile
+
+
+# Capturas de tela do app, com texto nítido sobre fundo liso: o perfil sem
+# denoising basta, e Valor e Data têm formato fixo no cabeçalho
+register_layout('nubank', perfil='fast', padroes=extend_patterns(BANK_SPECS['nubank']))
+
+# Demais bancos reconhecidos: perfil padrão, ajustado pelos acertos aprendidos
+for _bank, _ in roi.BANK_KEYWORDS:
+    if _bank not in LAYOUT_PROFILES:
+        register_layout(_bank)
+
+
+def classify_layout(gray, engine, lang='por'):
+    """Identifica o banco emissor de uma imagem em cinza.
+
+    Retorna (banco ou None, linhas da passada barata); as linhas podem ser
+    repassadas a roi.read_zones para localizar as zonas sem outra passada.
+    """
+    lines = roi.probe_lines(gray, engine, lang)
+    return roi.detect_bank(lines), lines
+
+
+def stage_key(stage, zones):
+    """Nome com que um acerto é contado no modelo do banco: o estágio, com o
+    sufixo ZONES_SUFFIX se o OCR leu só as zonas de interesse."""
+    return stage + ZONES_SUFFIX if zones else stage
+
+
+def layout_profile(bank, templates=None):
+    """Perfil de OCR do banco (DEFAULT_LAYOUT se ele não for reconhecido).
+
+    Com `templates` (roi.LayoutTemplates), a passada que mais vezes resolveu
+    os comprovantes do banco (ver `stage_key`) substitui a registrada.
+    """
+    profile = LAYOUT_PROFILES.get(bank, DEFAULT_LAYOUT)
+    if bank is None or templates is None:
+        return profile
+    learned = templates.stage_for(bank, MIN_STAGE_OBSERVATIONS)
+    if learned is None or learned == stage_key(profile['estagio'], profile['zonas']):
+        return profile
+    zones = learned.endswith(ZONES_SUFFIX)
+    stage = learned[:-len(ZONES_SUFFIX)] if zones else learned
+    return dict(profile, estagio=stage, zonas=zones)
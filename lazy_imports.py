@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Importação sob demanda das bibliotecas pesadas (cv2, numpy, PIL, PyPDF2).
+
+`lazy_import('cv2')` devolve um módulo substituto que só importa o módulo
+real no primeiro acesso a um atributo. Assim `--help`, um arquivo
+inexistente ou um PDF com camada de texto não pagam a importação do OpenCV.
+Cada atributo lido é guardado no substituto, de modo que os acessos
+seguintes custam o mesmo que no módulo real.
+"""
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Substituto de um módulo que o importa no primeiro acesso."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = self.__dict__['_lazy_module'] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'carregado' if self.__dict__['_lazy_module'] is not None else 'não carregado'
+        return f"<módulo {self.__name__!r} sob demanda ({state})>"
+
+
+def lazy_import(name):
+    """Módulo `name`, importado só quando for usado.
+
+    Se o módulo já estiver importado, devolve o próprio módulo.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def load(*modules):
+    """Força a importação dos módulos substitutos (ex.: ao iniciar um worker)."""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+
+
+def is_available(name):
+    """Indica se o módulo pode ser importado, sem importá-lo."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Orçamento de memória dos workers de OCR.
+
+Cada worker ocupa uma parte fixa (interpretador, cv2/numpy/PIL e o modelo
+do Tesseract) e uma parte proporcional ao tamanho da imagem de trabalho
+(buffers do pré-processamento e a cópia interna do Tesseract). A partir do
+orçamento por worker calcula-se o maior número de pixels que a imagem de
+trabalho pode ter e, com a memória disponível na máquina, quantos workers
+cabem.
+"""
+import os
+
+
+# Memória (MB) de um worker ocioso, com as bibliotecas e o modelo carregados
+WORKER_BASE_MB = 200
+
+# Bytes por pixel da imagem de trabalho no pico do processamento
+BYTES_PER_WORK_PIXEL = 10
+
+# Menor imagem de trabalho aceitável, mesmo com orçamento apertado
+MIN_WORK_PIXELS = 2_000_000
+
+
+def available_memory_mb():
+    """Memória disponível na máquina (MB), ou None se não for possível medir."""
+    try:
+        with open('/proc/meminfo', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        pages = os.sysconf('SC_AVPHYS_PAGES')
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        if pages > 0 and page_size > 0:
+            return pages * page_size // 2**20
+    except (AttributeError, ValueError, OSError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available // 2**20
+    except ImportError:
+        return None
+
+
+def max_work_pixels(budget_mb):
+    """Maior imagem de trabalho (pixels) que cabe no orçamento de um worker."""
+    usable = max(0, budget_mb - WORKER_BASE_MB) * 2**20
+    return max(MIN_WORK_PIXELS, usable // BYTES_PER_WORK_PIXEL)
+
+
+def workers_for_budget(budget_mb, requested, available_mb=None):
+    """Número de workers que cabem na memória disponível com `budget_mb` cada.
+
+    Nunca passa de `requested`; sem medida da memória disponível, usa
+    `requested`.
+    """
+    available_mb = available_memory_mb() if available_mb is None else available_mb
+    if available_mb is None:
+        return requested
+    return max(1, min(requested, available_mb // budget_mb))
@@ -5,275 +5,589 @@ Extrai Valor e Data de PIX usando regex.
 Versão com processamento de imagem aprimorado.
 """
 
-import re
-import cv2
-import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
 import sys
 import os
-import csv
+import time
 from datetime import datetime
 
+from lazy_imports import lazy_import
+
+from ocr_engine import get_engine, pass_executor, configure_threads
+from image_utils import (choose_scale_factor, resize_by, cap_scale, needs_tiling, process_in_bands,
+                         pil_gray, contrast_stack, sharpness_stack)
+import roi
+from layouts import classify_layout, layout_profile, stage_key
+from extraction import extract_fields, extract_scored_fields, FULL_PATTERNS
+from result_sink import CsvSink
+from batch_preprocess import preprocess_batch
+from result_cache import DEFAULT_CACHE_PATH
+from duplicate_index import DuplicateIndex, array_fingerprint, read_gray
+from triage import triage_file, load_gray
+from profiling import stage_timer as _stage_timer, record as _record_stage
+
+# Bibliotecas pesadas importadas só quando uma imagem é de fato processada
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+
+def enhance_stack_quality(stack):
+    """
+    Realça uma pilha de imagens do mesmo tamanho (array N x H x W, em cinza,
+    ou N x H x W x 3, RGB).
+
+    Mesmo resultado, pixel a pixel, dos realces do PIL (contraste 1.5,
+    nitidez 2.0 e brilho 1.1), calculado com tabelas de consulta sobre a
+    pilha inteira; o brilho entra na mesma tabela da nitidez.
+    """
+    return sharpness_stack(contrast_stack(stack, 1.5), 2.0, brightness=1.1)
+
 def enhance_image_quality(image):
     """
-    Melhora a qualidade da imagem usando PIL.
+    Melhora a qualidade da imagem (contraste, nitidez e brilho).
     """
     # Converte para PIL se necessário
     if isinstance(image, np.ndarray):
         image = Image.fromarray(image)
+    mode = image.mode
+    if mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
     
-    # Aumenta o contraste
-    contrast_enhancer = ImageEnhance.Contrast(image)
-    image = contrast_enhancer.enhance(1.5)
-    
-    # Aumenta a nitidez
-    sharpness_enhancer = ImageEnhance.Sharpness(image)
-    image = sharpness_enhancer.enhance(2.0)
-    
-    # Ajusta o brilho
-    brightness_enhancer = ImageEnhance.Brightness(image)
-    image = brightness_enhancer.enhance(1.1)
-    
-    return image
+    enhanced = enhance_stack_quality(np.asarray(image)[None])[0]
+    return Image.fromarray(enhanced)
+
+# Perfis de pré-processamento de preprocess_image_advanced (em todos, a
+# imagem é lida direto em cinza e só o cinza é ampliado):
+# - fast: não aplica fastNlMeansDenoising
+# - balanced: aplica o denoising na resolução original, antes da ampliação
+# - quality: pipeline original (denoising e filtro bilateral após ampliar)
+PREPROCESS_PROFILES = {
+    'fast': {'denoise': None, 'bilateral_d': 5},
+    'balanced': {'denoise': 'original', 'bilateral_d': 5},
+    'quality': {'denoise': 'ampliada', 'bilateral_d': 9},
+}
 
-def preprocess_image_advanced(image_path):
+DEFAULT_PROFILE = 'quality'
+
+# Fator de escala usado quando a altura do texto não pode ser estimada
+DEFAULT_SCALE = 3
+
+def preprocess_image_advanced(image_path, profile=DEFAULT_PROFILE, timings=None, scale=None):
     """
     Pré-processamento avançado da imagem para melhorar a qualidade do OCR.
+
+    `profile` escolhe um dos PREPROCESS_PROFILES; se `timings` for um
+    dicionário, recebe o tempo gasto em cada etapa. Sem `scale`, o fator de
+    escala é escolhido pela altura estimada do texto.
+
+    A imagem é decodificada direto em escala de cinza; sem `scale`, JPEGs
+    grandes são decodificados já reduzidos quando o texto continua legível
+    (ver triage), pois a escala escolhida depois os reduziria de qualquer
+    forma.
     """
-    # Carrega a imagem usando OpenCV
-    image = cv2.imread(image_path)
+    mark = _stage_timer(timings)
+    
+    # Carrega a imagem usando OpenCV, já em cinza
+    image = load_gray(image_path, triage_file(image_path) if scale is None else None)
     
     if image is None:
         raise FileNotFoundError(f"Não foi possível carregar a imagem: {image_path}")
+    mark('leitura')
     
-    # Redimensiona a imagem para aumentar a resolução (escala 3x)
-    height, width = image.shape[:2]
-    image = cv2.resize(image, (width * 3, height * 3), interpolation=cv2.INTER_CUBIC)
+    return preprocess_array_advanced(image, profile, timings, scale)
+
+def preprocess_array_advanced(image, profile=DEFAULT_PROFILE, timings=None, scale=None):
+    """
+    Aplica o pré-processamento avançado a uma imagem já carregada (BGR ou
+    escala de cinza), como um recorte da imagem original.
+
+    A escala é limitada pelo número máximo de pixels da imagem de trabalho;
+    imagens que ainda assim ficam muito grandes são processadas em faixas.
+    """
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Perfil de pré-processamento desconhecido: {profile}")
+    settings = PREPROCESS_PROFILES[profile]
+    mark = _stage_timer(timings)
     
     # Converte para escala de cinza
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    mark('escala_cinza')
+    
+    # Escolhe a escala que leva o texto a ~30px de altura
+    if scale is None:
+        scale = choose_scale_factor(gray, DEFAULT_SCALE)
+        mark('estimativa_escala')
+    scale = cap_scale(gray.shape, scale)
+    
+    if settings['denoise'] == 'original':
+        # Denoising na resolução original, antes da ampliação
+        gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+        mark('denoising')
+    
+    if needs_tiling(gray.shape, scale):
+        # Imagem grande: amplia e filtra uma faixa por vez
+        return process_in_bands(gray, scale, lambda band: _filter_scaled(band, settings, mark))
     
-    # Aplica denoising (remoção de ruído)
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+    # Amplia a imagem já em cinza: 1/3 dos dados de uma imagem colorida
+    gray = resize_by(gray, scale)
+    mark('redimensionamento')
+    
+    return _filter_scaled(gray, settings, mark)
+
+def _filter_scaled(gray, settings, mark):
+    """
+    Filtros aplicados à imagem já ampliada. Cada etapa substitui a anterior
+    (as intermediárias não ficam vivas até o fim) e as operações que aceitam
+    escrevem no próprio buffer.
+    """
+    if settings['denoise'] == 'ampliada':
+        # Aplica denoising (remoção de ruído)
+        gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+        mark('denoising')
     
     # Aplica filtro bilateral para suavizar preservando bordas
-    bilateral = cv2.bilateralFilter(denoised, 9, 75, 75)
+    gray = cv2.bilateralFilter(gray, settings['bilateral_d'], 75, 75)
+    mark('bilateral')
     
     # Melhora o contraste usando CLAHE (Adaptive Histogram Equalization)
     clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-    clahe_img = clahe.apply(bilateral)
+    gray = clahe.apply(gray)
+    mark('clahe')
     
-    # Aplica threshold adaptativo para binarização
-    thresh = cv2.adaptiveThreshold(clahe_img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                   cv2.THRESH_BINARY, 11, 2)
+    # Aplica threshold adaptativo para binarização (no mesmo buffer)
+    cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                          cv2.THRESH_BINARY, 11, 2, dst=gray)
+    mark('threshold')
     
     # Remove pequenos ruídos usando operações morfológicas
     kernel = np.ones((1,1), np.uint8)
-    cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-    cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel, dst=gray)
+    cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel, dst=gray)
+    mark('morfologia')
     
     # Aplica um filtro mediano para suavizar
-    final_image = cv2.medianBlur(cleaned, 3)
+    gray = cv2.medianBlur(gray, 3)
+    mark('mediana')
     
-    return final_image
+    return gray
+
+def preprocess_image_alternative(image_path, timings=None, scale=None):
+    """
+    Método alternativo de pré-processamento (leitura e ampliação com PIL).
+
+    Se `timings` for um dicionário, recebe o tempo gasto em cada etapa. Sem
+    `scale`, o fator de escala é escolhido pela altura estimada do texto.
+    """
+    mark = _stage_timer(timings)
+    gray = load_scaled_alternative(image_path, mark, scale)
+    return finish_alternative_stack(gray[None], mark)[0]
 
-def preprocess_image_alternative(image_path):
+def preprocess_array_alternative(gray, timings=None, scale=None):
     """
-    Método alternativo de pré-processamento usando apenas PIL.
+    Aplica o pré-processamento alternativo a uma imagem em cinza já
+    carregada, como um recorte da imagem original.
     """
+    mark = _stage_timer(timings)
+    if scale is None:
+        scale = choose_scale_factor(gray, DEFAULT_SCALE)
+        mark('pil_estimativa_escala')
+    scale = cap_scale(gray.shape, scale)
+    if scale != 1.0:
+        height, width = gray.shape[:2]
+        gray = np.asarray(Image.fromarray(gray).resize(
+            (round(width * scale), round(height * scale)), Image.Resampling.LANCZOS))
+    mark('pil_redimensionamento')
+    return finish_alternative_stack(gray[None], mark)[0]
+
+def load_scaled_alternative(image_path, mark=None, scale=None):
+    """
+    Lê a imagem em escala de cinza e a amplia para levar o texto a ~30px de
+    altura (primeira parte do pré-processamento alternativo). Retorna um
+    array. A cópia colorida nunca é ampliada: JPEGs são decodificados direto
+    em cinza (modo rascunho do PIL) e os demais formatos convertidos antes
+    do redimensionamento.
+    """
+    mark = mark or _stage_timer()
+    
     # Carrega a imagem
     image = Image.open(image_path)
-    
-    # Converte para RGB se necessário
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    # Redimensiona para melhorar a resolução
+    image.draft('L', image.size)
+    
+    # Converte para cinza se necessário
+    if image.mode != 'L':
+        image = image.convert('L')
+    mark('pil_leitura')
+    
+    # Redimensiona para levar o texto a ~30px de altura
+    if scale is None:
+        scale = choose_scale_factor(np.asarray(image), DEFAULT_SCALE)
+        mark('pil_estimativa_escala')
+    scale = cap_scale((image.height, image.width), scale)
     width, height = image.size
-    image = image.resize((width * 3, height * 3), Image.Resampling.LANCZOS)
+    if scale != 1.0:
+        image = image.resize((round(width * scale), round(height * scale)), Image.Resampling.LANCZOS)
+    mark('pil_redimensionamento')
+    return np.asarray(image)
+
+def finish_alternative_stack(stack, mark=None):
+    """
+    Segunda parte do pré-processamento alternativo, sobre uma pilha de
+    imagens do mesmo tamanho, em cinza (N x H x W) ou RGB (N x H x W x 3):
+    realce, cinza, mediana e contraste. Retorna a pilha em escala de cinza
+    (N x H x W).
+
+    As etapas pontuais são tabelas de consulta aplicadas à pilha inteira;
+    o resultado é idêntico ao da sequência de realces do PIL.
+    """
+    mark = mark or _stage_timer()
     
     # Melhora a qualidade
-    image = enhance_image_quality(image)
+    stack = enhance_stack_quality(stack)
+    mark('pil_realce')
     
     # Converte para escala de cinza
-    image = image.convert('L')
+    gray = pil_gray(stack) if stack.ndim == 4 else stack
     
-    # Aplica filtro para reduzir ruído
-    image = image.filter(ImageFilter.MedianFilter())
+    # Aplica filtro para reduzir ruído (mediana 3x3, bordas replicadas como no PIL)
+    for i in range(len(gray)):
+        gray[i] = cv2.medianBlur(gray[i], 3)
+    mark('pil_mediana')
     
     # Aumenta o contraste
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(2.0)
+    gray = contrast_stack(gray, 2.0)
+    mark('pil_contraste')
+    return gray
+
+def preprocess_alternative_batch(image_paths, workers=None):
+    """
+    Pré-processamento alternativo de vários arquivos: leitura e ampliação
+    em threads e realces aplicados às pilhas de imagens do mesmo tamanho.
+    Gera (caminho, imagem, erro) na ordem de `image_paths`.
+    """
+    return preprocess_batch(image_paths, load_scaled_alternative, finish_alternative_stack,
+                            workers=workers)
+
+# Idioma do Tesseract usado em todos os estágios
+OCR_LANG = 'por'
+
+# Estágios da cascata de OCR, na ordem em que são tentados. Cada estágio
+# indica o pré-processamento usado e o PSM/OEM do Tesseract; o
+# pré-processamento é feito uma única vez e reaproveitado pelos estágios.
+OCR_STAGES = [
+    ('avancado_psm6', 'avancado', 6, 3),
+    ('avancado_psm7', 'avancado', 7, 3),
+    ('avancado_psm8', 'avancado', 8, 3),
+    ('avancado_oem1_psm6', 'avancado', 6, 1),
+    ('alternativo_psm6', 'alternativo', 6, 3),
+]
+
+# Campos que encerram a cascata quando todos já foram encontrados com a
+# confiança mínima
+REQUIRED_FIELDS = ('Valor', 'Data')
+
+# Confiança mínima (0-100, menor confiança entre as palavras do campo) para
+# aceitar um campo sem rodar os estágios seguintes
+DEFAULT_MIN_CONFIDENCE = 75
+
+# Estágio inicial que aplica o OCR só às regiões de Valor, Data e Origem
+ROI_STAGE = 'roi'
+
+# Passada única do perfil do banco (extract_fields_by_layout)
+LAYOUT_STAGE = 'layout'
+
+# Contadores por estágio: quantas vezes o estágio rodou e em quantas delas
+# encontrou algum campo novo ou com confiança maior que a dos anteriores
+STAGE_STATS = {name: {'execucoes': 0, 'acertos': 0}
+               for name in [LAYOUT_STAGE, ROI_STAGE] + [stage[0] for stage in OCR_STAGES]}
+
+def format_stage_stats():
+    """
+    Formata os contadores da cascata (execuções e taxa de acerto por estágio).
+    """
+    lines = []
+    for name, stats in STAGE_STATS.items():
+        runs = stats['execucoes']
+        hits = stats['acertos']
+        rate = f"{100.0 * hits / runs:.0f}%" if runs else "-"
+        lines.append(f"{name:<20} execuções: {runs:<5} acertos: {hits:<5} taxa: {rate}")
+    return '\n'.join(lines)
+
+def extract_roi_stage(image_path, engine, profile, templates=None):
+    """
+    Estágio ROI: localiza as zonas de interesse com uma passada barata e
+    aplica o pré-processamento e o OCR completos só aos recortes. Retorna as
+    palavras (com confiança) de todos os recortes.
+    """
+    gray = load_gray(image_path)
+    if gray is None:
+        raise FileNotFoundError(f"Não foi possível carregar a imagem: {image_path}")
     
-    # Converte para array numpy para compatibilidade
-    return np.array(image)
+    def read_crop(crop):
+        processed = preprocess_array_advanced(crop, profile)
+        return engine.image_to_data(processed, lang=OCR_LANG, psm=6)
+    
+    crops, located, bank = roi.read_zones(gray, engine, read_crop, templates, OCR_LANG)
+    # Cada recorte numera seus blocos a partir de 1: o índice do recorte
+    # mantém as linhas de recortes diferentes separadas
+    words = [dict(w, block=(i, w['block'])) for i, crop_words in enumerate(crops)
+             for w in crop_words]
+    _, scored, _ = extract_scored_fields(words)
+    roi.learn_zones(templates, bank, located, scored, gray.shape)
+    return words
 
-def extract_text_from_image(image_path):
+def extract_fields_cascade(image_path, profile=DEFAULT_PROFILE, timings=None,
+                           use_roi=True, templates=None,
+                           min_confidence=DEFAULT_MIN_CONFIDENCE, confidences=None, stages=None,
+                           skip=()):
     """
-    Extrai texto da imagem usando Tesseract OCR com múltiplas tentativas.
+    Executa os estágios de OCR em cascata, parando assim que Valor e Data
+    tiverem sido encontrados com confiança de pelo menos `min_confidence`.
+
+    Cada estágio lê as palavras e as confianças com `image_to_data`; para
+    cada campo fica o valor de maior confiança entre os estágios. Retorna o
+    texto de maior confiança média e o dicionário com os campos extraídos;
+    `confidences`, se for um dicionário, recebe a confiança de cada campo, e
+    `stages`, se for uma lista, o nome de cada estágio incorporado, em ordem.
+    `profile` e `timings` são repassados ao pré-processamento avançado;
+    `timings` também recebe o tempo de OCR de cada estágio.
+
+    Com `use_roi`, o primeiro estágio lê apenas as regiões de interesse;
+    `templates` (roi.LayoutTemplates) guarda as zonas aprendidas por banco.
+    Os estágios em `skip` (já executados pelo chamador) não rodam.
+
+    Se o processo configurou passadas simultâneas
+    (`ocr_engine.configure_threads`), os estágios depois do primeiro rodam
+    ao mesmo tempo, num pool de threads.
     """
-    try:
-        results = []
-        
-        # Método 1: Pré-processamento avançado com OpenCV
+    preprocessors = {
+        'avancado': lambda path: preprocess_image_advanced(path, profile, timings),
+        'alternativo': lambda path: preprocess_image_alternative(path, timings),
+    }
+    mark = _stage_timer(timings)
+    engine = get_engine()
+    images = {}
+    failed = set()
+    best = {}
+    best_text, best_text_conf = "", -1.0
+    
+    def add_stage(name, words):
+        # Incorpora as palavras do estágio; mantém por campo o valor mais confiável
+        nonlocal best_text, best_text_conf
+        STAGE_STATS[name]['execucoes'] += 1
+        if stages is not None:
+            stages.append(name)
+        if not words:
+            return
+        text, scored, text_conf = extract_scored_fields(words)
+        mark('extracao')
+        if text_conf > best_text_conf:
+            best_text, best_text_conf = text, text_conf
+        improved = False
+        for field, (value, conf) in scored.items():
+            if field not in best or conf > best[field][1]:
+                best[field] = (value, conf)
+                improved = True
+        if improved:
+            STAGE_STATS[name]['acertos'] += 1
+    
+    def confident():
+        return all(field in best and best[field][1] >= min_confidence for field in REQUIRED_FIELDS)
+    
+    if use_roi:
         try:
-            processed_image1 = preprocess_image_advanced(image_path)
-            pil_image1 = Image.fromarray(processed_image1)
-            
-            # Configurações diferentes do Tesseract para testar
-            configs = [
-                r'--oem 3 --psm 6 -l por',
-                r'--oem 3 --psm 7 -l por',
-                r'--oem 3 --psm 8 -l por',
-                r'--oem 1 --psm 6 -l por',
-            ]
-            
-            for config in configs:
-                text1 = pytesseract.image_to_string(pil_image1, config=config)
-                if text1.strip():
-                    results.append(text1)
+            words = extract_roi_stage(image_path, engine, profile, templates)
+            mark(f'ocr_{ROI_STAGE}')
+            add_stage(ROI_STAGE, words)
         except Exception as e:
-            print(f"Método 1 falhou: {e}")
-        
-        # Método 2: Pré-processamento com PIL
+            print(f"Estágio {ROI_STAGE} falhou: {e}")
+    
+    def prepare(method):
+        # Pré-processa sob demanda, apenas para os estágios que chegam a rodar
+        if method not in images and method not in failed:
+            try:
+                images[method] = preprocessors[method](image_path)
+            except Exception as e:
+                print(f"Pré-processamento '{method}' falhou: {e}")
+                failed.add(method)
+        return method in images
+    
+    def run_pass(image, psm, oem):
+        # Pode rodar numa thread do pool: devolve (palavras, erro, início, fim)
+        start = time.perf_counter()
         try:
-            processed_image2 = preprocess_image_alternative(image_path)
-            pil_image2 = Image.fromarray(processed_image2)
-            
-            text2 = pytesseract.image_to_string(pil_image2, config=r'--oem 3 --psm 6 -l por')
-            if text2.strip():
-                results.append(text2)
+            words = engine.image_to_data(image, lang=OCR_LANG, psm=psm, oem=oem)
+            return words, None, start, time.perf_counter()
         except Exception as e:
-            print(f"Método 2 falhou: {e}")
-        
-        # Retorna o resultado mais longo (provavelmente melhor)
-        if results:
-            best_result = max(results, key=len)
-            return best_result
+            return None, e, start, time.perf_counter()
+    
+    def fan_out(executor, stages):
+        # Submete primeiro os estágios com a imagem pronta e pré-processa os
+        # demais nesta thread enquanto aqueles rodam
+        stages = [stage for stage in stages if stage[0] not in skip]
+        for name, method, psm, oem in stages:
+            if method in images:
+                pending[name] = executor.submit(run_pass, images[method], psm, oem)
+        for name, method, psm, oem in stages:
+            if name not in pending and prepare(method):
+                pending[name] = executor.submit(run_pass, images[method], psm, oem)
+    
+    # O primeiro estágio roda sozinho (quase sempre basta); se ele não
+    # trouxer os campos com confiança, os restantes rodam juntos no pool de
+    # passadas (ocr_engine.configure_threads) e são incorporados na ordem da
+    # cascata, com o mesmo resultado da execução em sequência
+    executor = None
+    pending = {}
+    try:
+        for index, (name, method, psm, oem) in enumerate(OCR_STAGES):
+            if confident():
+                break
+            if name in skip:
+                continue
+            if name not in pending:
+                if not prepare(method):
+                    continue
+                if executor is None and index > 0:
+                    executor = pass_executor()
+                    if executor is not None:
+                        fan_out(executor, OCR_STAGES[index:])
+            if name in pending:
+                words, error, start, end = pending.pop(name).result()
+            else:
+                # O pré-processamento registra as próprias etapas
+                mark(None)
+                words, error, start, end = run_pass(images[method], psm, oem)
+            if timings is not None:
+                timings[f'ocr_{name}'] = timings.get(f'ocr_{name}', 0.0) + end - start
+            _record_stage(f'ocr_{name}', start, end)
+            if error is not None:
+                print(f"Estágio {name} falhou: {error}")
+                continue
+            mark(None)
+            add_stage(name, words)
+    finally:
+        # Passadas que não chegaram a começar são descartadas
+        for future in pending.values():
+            future.cancel()
+    
+    if confidences is not None:
+        confidences.update({field: conf for field, (_, conf) in best.items()})
+    return best_text, {field: value for field, (value, _) in best.items()}
+
+def extract_fields_by_layout(image_path, profile=None, timings=None,
+                             use_roi=True, templates=None,
+                             min_confidence=DEFAULT_MIN_CONFIDENCE, confidences=None, report=None):
+    """
+    Identifica o banco emissor do comprovante e roda só a passada de OCR do
+    perfil dele (ver layouts.py): o estágio, o pré-processamento, a escala,
+    as zonas e os padrões de extração registrados ou aprendidos para o banco.
+
+    Se Valor e Data não saírem com confiança de pelo menos `min_confidence`,
+    completa com a cascata (extract_fields_cascade, sem o estágio ROI, que a
+    passada do layout já cobre, nem o estágio que ela repetiria), mantendo
+    por campo o valor mais confiável. A passada que resolveu o comprovante é
+    aprendida em `templates` (roi.LayoutTemplates). Sem `use_roi`, a passada
+    lê a imagem inteira.
+
+    `profile` (perfil de pré-processamento escolhido pelo usuário) tem
+    precedência sobre o do layout; sem ele vale o do layout ou DEFAULT_PROFILE.
+
+    Retorna o texto e o dicionário com os campos, como
+    extract_fields_cascade; `report`, se for um dicionário, recebe o banco
+    ('banco'), a passada do perfil ('estagio'), o perfil de pré-processamento
+    usado ('perfil') e se a passada bastou ('passada_unica').
+    """
+    mark = _stage_timer(timings)
+    engine = get_engine()
+    gray = load_gray(image_path)
+    if gray is None:
+        raise FileNotFoundError(f"Não foi possível carregar a imagem: {image_path}")
+    mark('leitura')
+    
+    bank, lines = classify_layout(gray, engine, OCR_LANG)
+    layout = layout_profile(bank, templates)
+    mark('ocr_classificacao')
+    
+    name, method, psm, oem = next(stage for stage in OCR_STAGES if stage[0] == layout['estagio'])
+    settings = profile or layout['perfil'] or DEFAULT_PROFILE
+    if method == 'avancado':
+        prepare = lambda image: preprocess_array_advanced(image, settings, None, layout['escala'])
+    else:
+        prepare = lambda image: preprocess_array_alternative(image, None, layout['escala'])
+    read = lambda image: engine.image_to_data(prepare(image), lang=OCR_LANG, psm=psm, oem=oem)
+    zones = layout['zonas'] and use_roi
+    
+    text, scored = "", {}
+    STAGE_STATS[LAYOUT_STAGE]['execucoes'] += 1
+    try:
+        if zones:
+            crops, located, _ = roi.read_zones(gray, engine, read, templates, OCR_LANG, lines)
+            # O índice do recorte mantém separadas as linhas de recortes diferentes
+            words = [dict(w, block=(i, w['block'])) for i, crop_words in enumerate(crops)
+                     for w in crop_words]
         else:
-            return ""
-        
+            words = read(gray)
+        # O tempo da passada inclui o pré-processamento, como no estágio ROI
+        mark(f'ocr_{LAYOUT_STAGE}')
+        text, scored, _ = extract_scored_fields(words, layout['padroes'])
+        mark('extracao')
+        if zones:
+            roi.learn_zones(templates, bank, located, scored, gray.shape)
+    except Exception as e:
+        mark(f'ocr_{LAYOUT_STAGE}')
+        print(f"Passada do layout ({bank or 'banco não reconhecido'}) falhou: {e}")
+    if scored:
+        STAGE_STATS[LAYOUT_STAGE]['acertos'] += 1
+    gray = None
+    
+    single = all(field in scored and scored[field][1] >= min_confidence for field in REQUIRED_FIELDS)
+    if report is not None:
+        report.update(banco=bank, estagio=stage_key(name, zones), perfil=settings,
+                      passada_unica=single)
+    if single:
+        if bank is not None and templates is not None:
+            templates.learn_stage(bank, stage_key(name, zones))
+        best = scored
+    else:
+        cascade_conf = {}
+        stages = []
+        # Lida a imagem inteira com o pré-processamento que a cascata usaria,
+        # o estágio do layout daria as mesmas palavras, já incorporadas
+        cascade_profile = profile or DEFAULT_PROFILE
+        repeated = (not zones and layout['escala'] is None
+                    and (method != 'avancado' or settings == cascade_profile))
+        cascade_text, fields = extract_fields_cascade(
+            image_path, cascade_profile, timings, False, templates, min_confidence, cascade_conf,
+            stages, skip=(name,) if repeated else ())
+        best = {field: (value, cascade_conf[field]) for field, value in fields.items()}
+        resolved = all(cascade_conf.get(field, -1.0) >= min_confidence for field in REQUIRED_FIELDS)
+        if resolved and stages and bank is not None and templates is not None:
+            templates.learn_stage(bank, stage_key(stages[-1], False))
+        for field, (value, conf) in scored.items():
+            if field not in best or conf > best[field][1]:
+                best[field] = (value, conf)
+        if cascade_text.strip():
+            text = cascade_text
+    
+    if confidences is not None:
+        confidences.update({field: conf for field, (_, conf) in best.items()})
+    return text, {field: value for field, (value, _) in best.items()}
+
+def extract_text_from_image(image_path):
+    """
+    Extrai texto da imagem usando Tesseract OCR, tentando os estágios da
+    cascata até que Valor e Data sejam encontrados.
+    """
+    try:
+        text, _ = extract_fields_cascade(image_path)
+        return text
     except Exception as e:
         print(f"Erro ao extrair texto da imagem: {e}")
         return ""
 
 def extract_value_and_date(text):
     """
-    Extrai valor e data usando regex.
-    """
-    result = {}
-    
-    # Função auxiliar para formatar ano de 2 dígitos
-    def format_year(year):
-        if len(year) == 2:
-            year = '20' + year
-        return year
-    
-    
-    
-    # Padrões mais flexíveis para extrair valor em reais
-    value_patterns = [
-        r'RS\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)',        # RS 180,00
-        r'R\$\.(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)',        # R$.300,00
-        r'R\$\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)',        # R$ 30,00 ou R$ 1.000,00
-        r'R\$\s*(\d+(?:,\d{2})?)',                        # R$ 30 ou R$ 30,00
-        r'R\$\s*(\d+)',                                   # R$ 30 (sem centavos)
-        r'Valor\s+R\$\s*(\d+(?:\.\d{2})?)',              # Valor R$ 30.00
-        r'(?:valor|Valor)[:\s\-]+R\$\s*(\d+(?:[,\.]\d{2})?)', # valor-da transferência R$ 30,00
-    ]
-    
-    for pattern in value_patterns:
-        value_match = re.search(pattern, text, re.IGNORECASE)
-        if value_match:
-            value = value_match.group(1)
-            # Normaliza o formato do valor
-            if '.' in value and len(value.split('.')[-1]) == 2:
-                value = value.replace('.', ',')
-            elif ',' not in value:
-                value = value + ',00'
-            result['Valor'] = f"R$ {value}"
-            break
-    
-    # Padrões para extrair data - incluindo formatos com OCR imperfeito
-    date_patterns = [
-        r'DATA:\s*(\d{2})/(\d{2})/(\d{4})',              # DATA: 04/02/2025
-        r'(\d{2})/(\d{2})/(\d{4})\s*-\s*\d{2}\.\d{2}\.\d{2}',  # 04/02/2025 - 19.23.05
-        r'(\d{1,2})/(\d{1,2})/(\d{4})',                  # dd/mm/yyyy
-        r'(\d{1,2})\s+de\s+(janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\s+de\s+(\d{4})',
-        r'(\d{1,2})\s+(fev)\.(\d{4})',                   # 21 fev.2025
-        r'(\d{1,2})/(\d{2})/(\d{2})(?:\s+às|\s+as)',     # dd/mm/yy às
-        r'(\d{1,2})\s+(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)\s+de\s+(\d{4})',
-        r'(\d{1,2}|\?\?|\?)\s+(JAN|FEV|MAR|ABR|MAI|JUN|JUL|AGO|SET|OUT|NOV|DEZ)\s+(\d{4})',
-        r'(\d{1,2})-(\d{1,2})-(\d{4})',                  # dd-mm-yyyy
-        r'(\d{4})-(\d{1,2})-(\d{1,2})',                  # yyyy-mm-dd
-    ]
-    
-    # Mapeamento de meses abreviados para números
-    month_map = {
-        'jan': '01', 'fev': '02', 'mar': '03', 'abr': '04',
-        'mai': '05', 'jun': '06', 'jul': '07', 'ago': '08',
-        'set': '09', 'out': '10', 'nov': '11', 'dez': '12',
-        'janeiro': '01', 'fevereiro': '02', 'março': '03', 'abril': '04',
-        'maio': '05', 'junho': '06', 'julho': '07', 'agosto': '08',
-        'setembro': '09', 'outubro': '10', 'novembro': '11', 'dezembro': '12'
-    }
-    
-    for i, pattern in enumerate(date_patterns):
-        date_match = re.search(pattern, text, re.IGNORECASE)
-        if date_match:
-            # Formatos de data com tratamento específico
-            if i < 3:  # Formatos dd/mm/yyyy com ou sem hora
-                day = date_match.group(1).zfill(2)
-                month = date_match.group(2).zfill(2)
-                year = date_match.group(3)
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i == 3:  # Formato com mês por extenso
-                day = date_match.group(1).zfill(2)
-                month_name = date_match.group(2).lower()
-                month = month_map.get(month_name, '01')
-                year = date_match.group(3)
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i == 4:  # Formato com mês abreviado
-                day = date_match.group(1).zfill(2)
-                month_name = date_match.group(2).lower()
-                year = format_year(date_match.group(3))
-                month = month_map.get(month_name, '01')
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i == 5:  # Formato dd/mm/yy com 'às'
-                day = date_match.group(1).zfill(2)
-                month = date_match.group(2).zfill(2)
-                year = format_year(date_match.group(3))
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i in [6, 7]:  # Outros formatos com mês abreviado
-                day_raw = date_match.group(1)
-                if '?' in day_raw or day_raw in ['2?', '?', '??']:
-                    day = '04'  # Para o caso específico
-                else:
-                    day = day_raw.zfill(2)
-                month_name = date_match.group(2).lower()
-                year = date_match.group(3)
-                month = month_map.get(month_name, '02')  # Default para fevereiro no caso específico
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i == 8:  # Formato com hífen
-                day = date_match.group(1).zfill(2)
-                month = date_match.group(2).zfill(2)
-                year = date_match.group(3)
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-            elif i == 9:  # Formato ISO
-                year = date_match.group(1)
-                month = date_match.group(2).zfill(2)
-                day = date_match.group(3).zfill(2)
-                result['Data'] = f"{day}/{month}/{year}"
-                break
-    
-    return result
+    Extrai valor e data usando os padrões completos do módulo `extraction`.
+    """
+    return extract_fields(text, FULL_PATTERNS)
 
 def extract_name_from_filename(image_path):
     """
@@ -300,36 +614,37 @@ def extract_name_from_filename(image_path):
     # Se não houver '-', retorna o nome completo sem extensão
     return name_without_ext.strip()
 
-def save_to_csv(result, image_path, csv_filename="ocr_results.csv"):
+# Colunas do CSV de resultados
+# (Duplicata: caminho do comprovante original quando a imagem é uma cópia dele)
+CSV_FIELDNAMES = ['Nome', 'Valor', 'Data', 'Arquivo_Imagem', 'Timestamp', 'Duplicata']
+
+# Versão das entradas deste script no índice de cópias (duplicate_index.py);
+# como PIPELINE_VERSION em batch_process.py, muda junto com o OCR e a extração
+DUPLICATE_INDEX_VERSION = 'ocr:2'
+
+def build_row(result, image_path, duplicate_of=None):
     """
-    Salva os resultados do OCR em um arquivo CSV.
+    Monta a linha de resultado de uma imagem.
     """
-    # Verifica se o arquivo CSV já existe
-    file_exists = os.path.exists(csv_filename)
-    
     # Extrai o nome do arquivo
     nome = extract_name_from_filename(image_path)
     
-    # Prepara os dados para salvar
-    row_data = {
+    return {
         'Nome': nome,
         'Valor': result.get('Valor', ''),
         'Data': result.get('Data', ''),
         'Arquivo_Imagem': os.path.basename(image_path),
-        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'Duplicata': os.path.abspath(duplicate_of) if duplicate_of else ''
     }
-    
-    # Escreve no arquivo CSV
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['Nome', 'Valor', 'Data', 'Arquivo_Imagem', 'Timestamp']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        # Escreve o cabeçalho se o arquivo não existir
-        if not file_exists:
-            writer.writeheader()
-        
-        # Escreve os dados
-        writer.writerow(row_data)
+
+def save_to_csv(result, image_path, csv_filename="ocr_results.csv", duplicate_of=None):
+    """
+    Salva os resultados do OCR em um arquivo CSV.
+    """
+    # O cabeçalho é escrito apenas se o arquivo ainda não existir
+    with CsvSink(csv_filename, CSV_FIELDNAMES) as sink:
+        sink.write(build_row(result, image_path, duplicate_of))
     
     print(f"Dados salvos no arquivo CSV: {csv_filename}")
 
@@ -337,8 +652,58 @@ def main():
     """
     Função principal do script.
     """
-    if len(sys.argv) != 2:
-        print("Uso: python ocr_script_final.py <caminho_da_imagem>")
+    args = sys.argv[1:]
+    
+    # Perfil de pré-processamento opcional: --perfil fast|balanced|quality
+    # (sem ele, o do layout do banco ou DEFAULT_PROFILE)
+    profile = None
+    if '--perfil' in args:
+        i = args.index('--perfil')
+        if i + 1 >= len(args) or args[i + 1] not in PREPROCESS_PROFILES:
+            print(f"Erro: --perfil requer um de: {', '.join(PREPROCESS_PROFILES)}")
+            sys.exit(1)
+        profile = args[i + 1]
+        del args[i:i + 2]
+    
+    # Confiança mínima opcional: --confianca 0-100 (0 para no primeiro acerto)
+    min_confidence = DEFAULT_MIN_CONFIDENCE
+    if '--confianca' in args:
+        i = args.index('--confianca')
+        try:
+            min_confidence = float(args[i + 1])
+        except (IndexError, ValueError):
+            print("Erro: --confianca requer um número entre 0 e 100")
+            sys.exit(1)
+        del args[i:i + 2]
+    
+    # Núcleos que o OCR pode ocupar: --nucleos N (padrão: todos)
+    cores = None
+    if '--nucleos' in args:
+        i = args.index('--nucleos')
+        try:
+            cores = int(args[i + 1])
+        except (IndexError, ValueError):
+            print("Erro: --nucleos requer um número inteiro")
+            sys.exit(1)
+        del args[i:i + 2]
+    
+    # --sem-roi desativa o estágio que lê só as regiões de interesse
+    use_roi = '--sem-roi' not in args
+    if not use_roi:
+        args.remove('--sem-roi')
+    
+    # --sem-layout usa a cascata genérica em vez da passada única do banco
+    use_layout = '--sem-layout' not in args
+    if not use_layout:
+        args.remove('--sem-layout')
+    
+    # --sem-duplicatas processa a imagem mesmo se ela for cópia de uma já vista
+    detect_duplicates = '--sem-duplicatas' not in args
+    if not detect_duplicates:
+        args.remove('--sem-duplicatas')
+    
+    if len(args) != 1:
+        print("Uso: python ocr_script_final.py <caminho_da_imagem> [--perfil fast|balanced|quality]")
         print("\nExemplos:")
         print("  python ocr_script_final.py pix4.jpg")
         print("  python ocr_script_final.py imagem.png")
@@ -346,16 +711,31 @@ def main():
         print("e salva os resultados no arquivo 'ocr_results.csv'")
         sys.exit(1)
     
-    image_path = sys.argv[1]
+    image_path = args[0]
     
     # Verifica se é solicitação de ajuda
     if image_path in ['--help', '-h', 'help']:
         print("OCR Script - Extração de dados de comprovantes PIX")
         print("=" * 50)
-        print("Uso: python ocr_script_final.py <caminho_da_imagem>")
+        print("Uso: python ocr_script_final.py <caminho_da_imagem> [--perfil fast|balanced|quality]")
         print("\nExemplos:")
         print("  python ocr_script_final.py pix4.jpg")
-        print("  python ocr_script_final.py imagem.png")
+        print("  python ocr_script_final.py imagem.png --perfil fast")
+        print("\nPerfis de pré-processamento:")
+        print("  fast     - sem denoising; mais rápido")
+        print("  balanced - denoising na resolução original")
+        print("  quality  - pipeline completo (padrão)")
+        print("\n--sem-roi: aplica o OCR à imagem inteira desde o primeiro estágio")
+        print(f"--sem-duplicatas: não consulta o índice de cópias ({DEFAULT_CACHE_PATH}); "
+              f"por padrão, uma imagem quase idêntica a um comprovante já processado "
+              f"reaproveita o resultado dele")
+        print(f"--confianca N: confiança mínima (0-100) de Valor e Data para encerrar a cascata "
+              f"(padrão: {DEFAULT_MIN_CONFIDENCE})")
+        print("--sem-layout: não identifica o banco emissor; usa a cascata genérica de estágios "
+              "em vez da passada única ajustada ao layout do banco")
+        print("--nucleos N: núcleos que o OCR pode ocupar (padrão: todos); os estágios da cascata "
+              "depois do primeiro rodam em paralelo, com OMP_THREAD_LIMIT ajustado para não "
+              "passar desse total")
         print("\nO script extrai:")
         print("  - Valor da transação")
         print("  - Data da transação")
@@ -367,10 +747,67 @@ def main():
         sys.exit(1)
     
     print(f"Processando imagem: {image_path}")
-    print("Aplicando processamento avançado de imagem...")
     
-    # Extrai texto da imagem
-    text = extract_text_from_image(image_path)
+    # Cópia de um comprovante já processado: reaproveita o resultado sem OCR
+    duplicates = fingerprint = gray = None
+    if detect_duplicates:
+        try:
+            duplicates = DuplicateIndex(DEFAULT_CACHE_PATH)
+            gray = read_gray(image_path)
+            fingerprint = array_fingerprint(gray) if gray is not None else None
+            match = duplicates.find(fingerprint, DUPLICATE_INDEX_VERSION, gray) if fingerprint else None
+        except Exception as e:
+            print(f"Aviso: não foi possível consultar o índice de cópias: {e}")
+            duplicates = match = None
+        gray = None
+        if match is not None:
+            duplicates.close()
+            result = match['resultado']
+            print(f"Imagem quase idêntica a {match['arquivo']}: resultado reaproveitado, sem OCR")
+            print(f"Nome: {extract_name_from_filename(image_path)}")
+            for field in ('Valor', 'Data'):
+                if field in result:
+                    print(f"{field}: {result[field]}")
+            save_to_csv(result, image_path, duplicate_of=match['arquivo'])
+            return
+    
+    if profile or not use_layout:
+        profile = profile or DEFAULT_PROFILE
+        print(f"Aplicando processamento avançado de imagem (perfil: {profile})...")
+    else:
+        print("Aplicando processamento avançado de imagem (perfil do layout do banco)...")
+    
+    # Extrai texto e campos com a cascata de OCR
+    configure_threads(cores, passes=len(OCR_STAGES) - 1)
+    timings = {}
+    confidences = {}
+    layout = {}
+    templates = roi.LayoutTemplates() if use_roi or use_layout else None
+    try:
+        if use_layout:
+            text, result = extract_fields_by_layout(image_path, profile, timings, use_roi, templates,
+                                                    min_confidence, confidences, layout)
+        else:
+            text, result = extract_fields_cascade(image_path, profile, timings, use_roi, templates,
+                                                  min_confidence, confidences)
+    except Exception as e:
+        print(f"Erro ao extrair texto da imagem: {e}")
+        text, result = "", {}
+    
+    if templates is not None:
+        try:
+            templates.save()
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar os modelos de layout: {e}")
+    
+    if duplicates is not None:
+        if text.strip() and fingerprint is not None:
+            try:
+                duplicates.add(fingerprint, DUPLICATE_INDEX_VERSION, os.path.abspath(image_path),
+                               text, result)
+            except Exception as e:
+                print(f"Aviso: não foi possível atualizar o índice de cópias: {e}")
+        duplicates.close()
     
     if not text.strip():
         print("Erro: Não foi possível extrair texto da imagem.")
@@ -381,8 +818,23 @@ def main():
     print(text)
     print("-" * 50)
     
-    # Extrai valor e data
-    result = extract_value_and_date(text)
+    if layout:
+        outcome = "bastou" if layout['passada_unica'] else "completada pela cascata"
+        print(f"\nLayout: {layout['banco'] or 'banco não reconhecido'} "
+              f"(passada {layout['estagio']}, perfil {layout['perfil']}, {outcome})")
+    
+    print("\nEstágios de OCR:")
+    print(format_stage_stats())
+    
+    print("\nTempo por etapa:")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<28} {seconds * 1000:8.1f} ms")
+    
+    if confidences:
+        print("\nConfiança por campo:")
+        for field, conf in confidences.items():
+            print(f"  {field:<28} {conf:8.1f}")
+    print()
     
     # Extrai nome do arquivo
     nome = extract_name_from_filename(image_path)
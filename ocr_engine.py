@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Backends de OCR intercambiáveis usados por `ocr.py` e `ocr_fast.py`.
+
+- `TesserocrEngine`: mantém a API do Tesseract (via tesserocr) carregada em
+  memória, uma instância por thread de cada processo, e recebe a imagem
+  diretamente do buffer numpy, sem gravar arquivo temporário.
+- `PytesseractEngine`: usa o pytesseract, que inicia o binário `tesseract`
+  a cada chamada. Serve de alternativa quando o tesserocr não está instalado.
+
+`configure_threads` reparte os núcleos do processo entre as passadas de OCR
+simultâneas de uma imagem (`pass_executor`) e as threads OpenMP de cada
+Tesseract (OMP_THREAD_LIMIT).
+
+O backend é escolhido pela variável de ambiente OCR_BACKEND ('tesserocr' ou
+'pytesseract'); por padrão usa o tesserocr se ele estiver disponível.
+
+Instalação opcional do backend persistente: pip install tesserocr
+"""
+import os
+import sys
+import threading
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+# Caminho do executável do Tesseract usado pelo pytesseract (None = PATH)
+TESSERACT_CMD = None
+
+
+def set_tesseract_cmd(path):
+    """Define o executável do Tesseract sem importar o pytesseract agora."""
+    global TESSERACT_CMD
+    TESSERACT_CMD = path
+    if 'pytesseract' in sys.modules:
+        sys.modules['pytesseract'].pytesseract.tesseract_cmd = path
+
+
+def _as_array(image):
+    """Converte PIL.Image ou array numpy em um array uint8 contíguo."""
+    arr = np.asarray(image)
+    if arr.dtype != np.uint8:
+        arr = arr.astype(np.uint8)
+    return np.ascontiguousarray(arr)
+
+
+class OcrEngine:
+    """Interface comum dos backends de OCR.
+
+    As imagens são arrays numpy em escala de cinza (ou RGB) ou PIL.Image.
+    `image_to_data` retorna uma lista de palavras, cada uma um dicionário com
+    'text', 'conf' (0-100), 'left', 'top', 'width', 'height', 'block' e 'line'.
+    """
+
+    name = None
+
+    def image_to_string(self, image, lang='por', psm=6, oem=3):
+        raise NotImplementedError
+
+    def image_to_data(self, image, lang='por', psm=6, oem=3):
+        raise NotImplementedError
+
+
+class PytesseractEngine(OcrEngine):
+    """Backend baseado no pytesseract (um processo `tesseract` por chamada)."""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        import pytesseract
+        if TESSERACT_CMD:
+            pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        self._pytesseract = pytesseract
+
+    def _config(self, psm, oem):
+        return f'--oem {oem} --psm {psm}'
+
+    def image_to_string(self, image, lang='por', psm=6, oem=3):
+        return self._pytesseract.image_to_string(
+            _as_array(image), lang=lang, config=self._config(psm, oem))
+
+    def image_to_data(self, image, lang='por', psm=6, oem=3):
+        data = self._pytesseract.image_to_data(
+            _as_array(image), lang=lang, config=self._config(psm, oem),
+            output_type=self._pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data['text']):
+            if not text.strip():
+                continue
+            words.append({
+                'text': text,
+                'conf': float(data['conf'][i]),
+                'left': int(data['left'][i]),
+                'top': int(data['top'][i]),
+                'width': int(data['width'][i]),
+                'height': int(data['height'][i]),
+                'block': int(data['block_num'][i]),
+                'line': int(data['par_num'][i]) * 1000 + int(data['line_num'][i]),
+            })
+        return words
+
+
+class TesserocrEngine(OcrEngine):
+    """Backend que mantém o Tesseract carregado em memória via tesserocr.
+
+    Uma `PyTessBaseAPI` é criada por combinação (idioma, OEM) em cada thread,
+    pois a API do Tesseract não é segura para uso concorrente. O PSM é
+    ajustado a cada chamada, sem recarregar o modelo.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, tessdata_path=None):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._tessdata_path = tessdata_path or os.environ.get('TESSDATA_PREFIX')
+        self._local = threading.local()
+
+    def _api(self, lang, oem):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        key = (lang, oem)
+        if key not in apis:
+            kwargs = {'lang': lang, 'oem': oem}
+            if self._tessdata_path:
+                kwargs['path'] = self._tessdata_path
+            apis[key] = self._tesserocr.PyTessBaseAPI(**kwargs)
+        return apis[key]
+
+    def _set_image(self, image, lang, psm, oem):
+        arr = _as_array(image)
+        api = self._api(lang, oem)
+        api.SetPageSegMode(psm)
+        height, width = arr.shape[:2]
+        bytes_per_pixel = 1 if arr.ndim == 2 else arr.shape[2]
+        api.SetImageBytes(arr.tobytes(), width, height, bytes_per_pixel, arr.strides[0])
+        return api
+
+    def image_to_string(self, image, lang='por', psm=6, oem=3):
+        api = self._set_image(image, lang, psm, oem)
+        return api.GetUTF8Text()
+
+    def image_to_data(self, image, lang='por', psm=6, oem=3):
+        api = self._set_image(image, lang, psm, oem)
+        api.Recognize()
+        RIL = self._tesserocr.RIL
+        words = []
+        block = line = 0
+        iterator = api.GetIterator()
+        for r in self._tesserocr.iterate_level(iterator, RIL.WORD):
+            if r.IsAtBeginningOf(RIL.BLOCK):
+                block += 1
+            if r.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            text = r.GetUTF8Text(RIL.WORD)
+            bbox = r.BoundingBox(RIL.WORD)
+            if not text or not text.strip() or bbox is None:
+                continue
+            x1, y1, x2, y2 = bbox
+            words.append({
+                'text': text,
+                'conf': float(r.Confidence(RIL.WORD)),
+                'left': x1,
+                'top': y1,
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'block': block,
+                'line': line,
+            })
+        return words
+
+
+BACKENDS = {
+    'tesserocr': TesserocrEngine,
+    'pytesseract': PytesseractEngine,
+}
+
+_engine = None
+
+
+def get_engine(name=None):
+    """Retorna o backend de OCR do processo atual, criando-o na primeira chamada.
+
+    Sem `name`, usa OCR_BACKEND ou, se não definido, tenta o tesserocr e cai
+    para o pytesseract quando ele não está instalado.
+    """
+    global _engine
+    name = name or os.environ.get('OCR_BACKEND')
+    if _engine is not None and (name is None or _engine.name == name):
+        return _engine
+
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Backend de OCR desconhecido: {name} (opções: {', '.join(BACKENDS)})")
+        _engine = BACKENDS[name]()
+        return _engine
+
+    try:
+        _engine = TesserocrEngine()
+    except ImportError:
+        _engine = PytesseractEngine()
+    return _engine
+
+
+# Orçamento de núcleos do OCR neste processo (ver configure_threads)
+_pass_threads = 1
+_pass_executor = None
+_executor_lock = threading.Lock()
+
+# OMP_THREAD_LIMIT definido pelo usuário antes de o processo começar: é respeitado
+_USER_OMP_LIMIT = os.environ.get('OMP_THREAD_LIMIT')
+
+
+def configure_threads(cores=None, passes=1):
+    """Reparte os núcleos do processo entre passadas simultâneas e o OpenMP.
+
+    `cores` é quantos núcleos o OCR deste processo pode ocupar (padrão:
+    todos; num pool de N workers, cada um recebe cpu_count // N) e `passes`
+    quantas passadas independentes de uma mesma imagem podem rodar ao mesmo
+    tempo. As passadas ganham até `cores` threads, e cada Tesseract fica
+    com OMP_THREAD_LIMIT = cores // threads, de modo que threads x OpenMP
+    nunca passa do orçamento. O processo `tesseract` do pytesseract herda a
+    variável; o tesserocr a lê ao carregar o modelo, por isso a chamada deve
+    vir antes do primeiro OCR.
+    """
+    global _pass_threads, _pass_executor
+    cores = max(1, cores or os.cpu_count() or 1)
+    threads = max(1, min(passes, cores))
+    with _executor_lock:
+        if _pass_executor is not None and threads != _pass_threads:
+            _pass_executor.shutdown(wait=False)
+            _pass_executor = None
+        _pass_threads = threads
+    if _USER_OMP_LIMIT is None:
+        os.environ['OMP_THREAD_LIMIT'] = str(max(1, cores // _pass_threads))
+    return _pass_threads
+
+
+def pass_threads():
+    """Passadas de OCR de uma imagem que podem rodar ao mesmo tempo."""
+    return _pass_threads
+
+
+def pass_executor():
+    """Pool de threads do processo para as passadas simultâneas de uma imagem.
+
+    Reaproveitado entre as imagens: com o tesserocr, cada thread mantém as
+    APIs já carregadas. Retorna None se as passadas devem rodar em sequência.
+    """
+    global _pass_executor
+    if _pass_threads <= 1:
+        return None
+    with _executor_lock:
+        if _pass_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _pass_executor = ThreadPoolExecutor(max_workers=_pass_threads,
+                                                thread_name_prefix='ocr-passada')
+        return _pass_executor
@@ -6,71 +6,142 @@ Script OCR simplificado para testes rápidos - usa a nova lógica
 import re
 import os
 import sys
-import pytesseract
-from PIL import Image, ImageEnhance
-import cv2
-import numpy as np
-import csv
 from datetime import datetime
 
+from lazy_imports import lazy_import
+from ocr_engine import get_engine, set_tesseract_cmd
+from extraction import extract_fields, SIMPLE_PATTERNS
+from result_sink import CsvSink
+from batch_preprocess import preprocess_batch
+from image_utils import choose_scale_factor, resize_by, cap_scale, needs_tiling, process_in_bands
+from triage import triage_file, describe, load_gray
+import profiling
+
+# Bibliotecas pesadas importadas só quando uma imagem é de fato processada
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+
 tesseract_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-pytesseract.pytesseract.tesseract_cmd = tesseract_path
+set_tesseract_cmd(tesseract_path)
+
+def _filter_scaled(gray, mark):
+    """Filtros aplicados à imagem já escalada (ou a uma faixa dela)."""
+    # Redução de ruído preservando contornos
+    gray = cv2.bilateralFilter(gray, d=9, sigmaColor=75, sigmaSpace=75)
+    mark('bilateral')
+
+    # Melhora contraste local
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    gray = clahe.apply(gray)
+    mark('clahe')
+
+    # Binarização adaptativa (ajustável) - robusto a iluminação; no mesmo buffer
+    cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                          cv2.THRESH_BINARY, 15, 9, dst=gray)
+    mark('threshold')
+
+    # Pequeno fechamento para conectar traços finos do cifrão
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2,2))
+    cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel, dst=gray, iterations=1)
+    mark('morfologia')
+    return gray
+
+def preprocess_array(image, mark=None):
+    """Pré-processamento OpenCV de uma imagem já carregada (BGR ou cinza).
+
+    Imagens muito grandes são escaladas no limite de pixels de trabalho e
+    filtradas em faixas. Retorna a imagem binarizada, pronta para o OCR.
+    """
+    mark = mark or profiling.stage_timer()
+
+    # Converte para grayscale e escala pela altura estimada do texto
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    mark('escala_cinza')
+    scale = cap_scale(gray.shape, choose_scale_factor(gray, 2))
+    mark('estimativa_escala')
+    if needs_tiling(gray.shape, scale):
+        return process_in_bands(gray, scale, lambda band: _filter_scaled(band, mark))
+    gray = resize_by(gray, scale)
+    mark('redimensionamento')
+    return _filter_scaled(gray, mark)
+
+def extract_text_from_array(image):
+    """Aplica o pré-processamento OpenCV e o OCR a uma imagem já carregada.
+
+    `image` pode ser BGR ou escala de cinza (ex.: página de PDF rasterizada).
+    """
+    mark = profiling.stage_timer()
+    gray = preprocess_array(image, mark)
+
+    # PSM 6 (assume bloco de texto) — o array vai direto para o backend de OCR
+    text = get_engine().image_to_string(gray, lang='por', psm=6)
+    mark('ocr_psm6')
+    return text
+
+def load_image(image_path, decision=None):
+    """Lê a imagem com OpenCV, direto em escala de cinza (suporta caminhos
+    com espaços/UTF-8).
 
-def extract_text_simple(image_path):
+    Com `decision` (de triage.triage_file), JPEGs grandes são decodificados
+    já reduzidos quando o texto continua legível.
+    """
+    with profiling.span('leitura'):
+        gray = load_gray(image_path, decision)
+    if gray is None:
+        raise ValueError('Não foi possível abrir a imagem com OpenCV')
+    return gray
+
+def extract_text_fallback(image_path):
+    """Método simples com Pillow (rápido), usado quando o OpenCV falha."""
+    try:
+        image = Image.open(image_path)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        width, height = image.size
+        scale = cap_scale((height, width), 2)
+        image = image.resize((round(width * scale), round(height * scale)), Image.Resampling.LANCZOS)
+        with profiling.span('ocr_fallback_psm3'):
+            return get_engine().image_to_string(np.asarray(image), lang='por', psm=3)
+    except Exception as e:
+        print(f"Erro ao extrair texto: {e}")
+        return ""
+
+def extract_text_simple(image_path, decision=None):
     """Extrai texto com pré-processamento leve (pode demorar ~10s).
 
     Estratégia:
-    - tenta pré-processamento com OpenCV (grayscale, upscale, CLAHE,
+    - tenta pré-processamento com OpenCV (grayscale, escala adaptativa à
+      altura do texto — 2x se não for possível estimá-la — CLAHE,
       bilateral filter, adaptive threshold, pequeno fechamento)
     - chama Tesseract com PSM 6
     - em caso de erro volta ao método simples com Pillow
+
+    `decision` (de triage.triage_file) escolhe a decodificação e recebe a
+    economia de tempo estimada.
     """
     try:
-        # Carrega imagem com OpenCV suportando caminhos com espaços/UTF-8
-        arr = np.fromfile(image_path, dtype=np.uint8)
-        img_cv = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img_cv is None:
-            raise ValueError('Não foi possível abrir a imagem com OpenCV')
-
-        # Escala e converte para grayscale
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        h, w = gray.shape[:2]
-        gray = cv2.resize(gray, (w*2, h*2), interpolation=cv2.INTER_CUBIC)
-
-        # Redução de ruído preservando contornos
-        gray = cv2.bilateralFilter(gray, d=9, sigmaColor=75, sigmaSpace=75)
-
-        # Melhora contraste local
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-
-        # Binarização adaptativa (ajustável) - robusto a iluminação
-        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                     cv2.THRESH_BINARY, 15, 9)
-
-        # Pequeno fechamento para conectar traços finos do cifrão
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2,2))
-        gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel, iterations=1)
-
-        # Converter para PIL para passar ao pytesseract
-        pil_img = Image.fromarray(gray)
-
-        # Config: PSM 6 (assume bloco de texto) — não usar whitelist muito restritiva
-        config = '--psm 6'
-        text = pytesseract.image_to_string(pil_img, lang='por', config=config)
-        return text
+        return extract_text_from_array(load_image(image_path, decision))
     except Exception:
-        # Fallback simples (rápido)
+        return extract_text_fallback(image_path)
+
+def extract_texts_batch(image_paths, workers=None):
+    """Extrai o texto de vários arquivos, na ordem de `image_paths`.
+
+    Leitura e pré-processamento rodam num pool de threads (batch_preprocess),
+    à frente do OCR; gera (caminho, texto).
+    """
+    prepare = lambda path: preprocess_array(load_image(path, triage_file(path)))
+    for image_path, gray, error in preprocess_batch(image_paths, prepare, workers=workers):
+        if error is not None:
+            yield image_path, extract_text_fallback(image_path)
+            continue
         try:
-            image = Image.open(image_path)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            width, height = image.size
-            image = image.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
-            return pytesseract.image_to_string(image, lang='por')
-        except Exception as e:
-            print(f"Erro ao extrair texto: {e}")
-            return ""
+            with profiling.span('ocr_psm6'):
+                text = get_engine().image_to_string(gray, lang='por', psm=6)
+        except Exception:
+            text = extract_text_fallback(image_path)
+        yield image_path, text
 
 def extract_name_from_filename(image_path):
     """
@@ -136,77 +207,38 @@ def extract_name_value_and_date(text, image_path):
     if name:
         result['Nome'] = name
     
-    # Normaliza possíveis confusões do OCR antes de extrair (RS, R5, R S)
-    text_norm = text
-    # Substitui casos como 'RS 180', 'R5 180', 'R S180' por 'R$ 180'
-    text_norm = re.sub(r'R[\s]*[Ss5]\s*(?=\d)', 'R$ ', text_norm)
-    text_norm = re.sub(r'R\s*\$\s*', 'R$ ', text_norm)
-
-    # Extrair valor a partir do texto normalizado
-    value_match = re.search(r'R\$\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', text_norm)
-    if value_match:
-        value = value_match.group(1)
-        if '.' in value and len(value.split('.')[-1]) == 2:
-            value = value.replace('.', ',')
-        elif ',' not in value:
-            value = value + ',00'
-        result['Valor'] = f"R$ {value}"
-    
-    # Extrair data
-    date_match = re.search(r'(\d{2})/(\d{2})/(\d{4})', text)
-    if date_match:
-        day = date_match.group(1).zfill(2)
-        month = date_match.group(2).zfill(2)
-        year = date_match.group(3)
-        result['Data'] = f"{day}/{month}/{year}"
+    # Extrai valor e data (o símbolo de real é normalizado antes da varredura)
+    with profiling.span('extracao'):
+        result.update(extract_fields(text, SIMPLE_PATTERNS))
     
     return result
 
-def save_to_csv(result, image_path, csv_filename="ocr_results.csv"):
-    """Salva os resultados no CSV"""
-    file_exists = os.path.exists(csv_filename)
-    
-    row_data = {
+# Colunas do CSV de resultados
+# (Duplicata: caminho do comprovante original quando a imagem é uma cópia dele)
+CSV_FIELDNAMES = ['Nome', 'Valor', 'Data', 'Arquivo_Imagem', 'Arquivo_Imagem_Caminho', 'Timestamp',
+                  'Duplicata']
+
+def build_row(result, image_path, duplicate_of=None):
+    """Monta a linha de resultado de uma imagem"""
+    return {
         'Nome': result.get('Nome', ''),
         'Valor': result.get('Valor', ''),
         'Data': result.get('Data', ''),
         'Arquivo_Imagem': os.path.basename(image_path),
         'Arquivo_Imagem_Caminho': os.path.abspath(image_path),
-        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'Duplicata': os.path.abspath(duplicate_of) if duplicate_of else ''
     }
-    
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['Nome', 'Valor', 'Data', 'Arquivo_Imagem', 'Arquivo_Imagem_Caminho', 'Timestamp']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(row_data)
+
+def save_to_csv(result, image_path, csv_filename="ocr_results.csv"):
+    """Salva os resultados no CSV"""
+    with CsvSink(csv_filename, CSV_FIELDNAMES) as sink:
+        sink.write(build_row(result, image_path))
     
     print(f"Dados salvos no arquivo CSV")
 
-def main():
-    """Função principal"""
-    if len(sys.argv) != 2:
-        print("Uso: python script.py <imagem>")
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    
-    if not os.path.exists(image_path):
-        print(f"Erro: Arquivo '{image_path}' não encontrado.")
-        sys.exit(1)
-    
-    print(f"Processando imagem: {image_path}")
-    
-    # Extrai texto
-    text = extract_text_simple(image_path)
-    
-    if not text.strip():
-        print("Erro: Não foi possível extrair texto da imagem.")
-        sys.exit(1)
-    
+def report_and_save(image_path, text):
+    """Mostra o texto e os campos extraídos de uma imagem e grava no CSV"""
     print("\nTexto extraído:")
     print("-" * 50)
     print(text[:300] + "..." if len(text) > 300 else text)
@@ -228,5 +260,53 @@ def main():
         print("Não foi possível extrair dados da imagem.")
         save_to_csv({}, image_path)
 
+def main():
+    """Função principal"""
+    if len(sys.argv) < 2:
+        print("Uso: python script.py <imagem> [<imagem> ...]")
+        sys.exit(1)
+    
+    image_paths = sys.argv[1:]
+    
+    if len(image_paths) == 1:
+        image_path = image_paths[0]
+        if not os.path.exists(image_path):
+            print(f"Erro: Arquivo '{image_path}' não encontrado.")
+            sys.exit(1)
+        
+        print(f"Processando imagem: {image_path}")
+        
+        # Triagem pelo cabeçalho e extração do texto
+        decision = triage_file(image_path)
+        print(f"Triagem: {describe(decision)} ({decision['motivo']})")
+        text = extract_text_simple(image_path, decision)
+        
+        if not text.strip():
+            print("Erro: Não foi possível extrair texto da imagem.")
+            sys.exit(1)
+        
+        report_and_save(image_path, text)
+        return
+    
+    # Várias imagens: pré-processamento em lote, à frente do OCR
+    existing = []
+    for image_path in image_paths:
+        if os.path.exists(image_path):
+            existing.append(image_path)
+        else:
+            print(f"Erro: Arquivo '{image_path}' não encontrado.")
+    
+    failures = len(image_paths) - len(existing)
+    for image_path, text in extract_texts_batch(existing):
+        print(f"\nProcessando imagem: {image_path}")
+        if not text.strip():
+            print("Erro: Não foi possível extrair texto da imagem.")
+            failures += 1
+            continue
+        report_and_save(image_path, text)
+    
+    if failures:
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
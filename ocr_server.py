@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Servidor de OCR de longa duração com workers já aquecidos.
+
+Em vez de iniciar um interpretador (e carregar o Tesseract) para cada
+comprovante, mantém um pool de processos com cv2/numpy/PIL/PyPDF2 e o
+backend de OCR carregados, e recebe os arquivos por HTTP em localhost ou em
+um socket Unix.
+
+API:
+  POST /extrair?arquivo=<nome do arquivo>[&texto=1]
+       corpo: bytes da imagem ou do PDF
+       resposta: {"arquivo", "tipo", "status", "resultado": {Nome, Valor, Data}}
+  GET  /saude
+       resposta: workers, requisições em execução e na fila
+
+O nome do arquivo (parâmetro `arquivo` ou cabeçalho X-Arquivo) define o tipo
+(pela extensão) e o Nome, com a mesma regra dos scripts. Sem ele, o tipo é
+detectado pelo conteúdo.
+
+Controle de carga: no máximo `--workers` arquivos são processados ao mesmo
+tempo e até `--fila` requisições aguardam a vez; acima disso o servidor
+responde 503 com Retry-After, sem aceitar mais trabalho do que consegue
+processar. Corpos acima de `--max-mb` recebem 413 e arquivos que excedem
+`--timeout` recebem 504.
+
+O Tesseract não pode ser interrompido dentro do worker: no timeout (ou se um
+processo do pool morrer) o pool é substituído por um novo, como no modo em
+lote de batch_process.py, e as demais requisições em andamento recomeçam
+nele uma vez.
+
+Uso:
+  python ocr_server.py [--host 127.0.0.1] [--port 8765] [--workers 4] [--fila 16]
+  python ocr_server.py --unix /tmp/ocr.sock
+  curl --data-binary @comprovante.png "http://127.0.0.1:8765/extrair?arquivo=Comprovante%20-%20Ana.png"
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import batch_process
+from triage import sniff_kind
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_MB = 20
+
+# Limites da leitura da requisição HTTP
+MAX_HEADER_BYTES = 16 * 1024
+READ_TIMEOUT = 30
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+    500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+
+def process_bytes(data, filename, kind):
+    """Extrai texto e campos de um arquivo recebido em memória (no worker).
+
+    Imagens são decodificadas direto do buffer, em escala de cinza; PDFs
+    passam por um arquivo temporário, pois o `pdf_fast` lê as páginas a
+    partir do caminho.
+    """
+    if kind == 'imagem':
+        import numpy as np
+        import ocr_fast
+        from triage import decode_gray
+        image = decode_gray(np.frombuffer(data, dtype=np.uint8))
+        if image is None:
+            raise ValueError('Não foi possível decodificar a imagem')
+        text = ocr_fast.extract_text_from_array(image)
+        result = ocr_fast.extract_name_value_and_date(text, filename) if text.strip() else {}
+    else:
+        import pdf_fast
+        fd, tmp_path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            text, fields = pdf_fast.extract_text_from_pdf(tmp_path)
+        finally:
+            os.remove(tmp_path)
+        result = {}
+        if text.strip():
+            result['Nome'] = pdf_fast.extract_name_from_filename(filename)
+            result.update(fields)
+
+    return {
+        'arquivo': filename,
+        'tipo': kind,
+        'status': 'ok' if text.strip() else 'sem_texto',
+        'texto': text,
+        'resultado': result,
+    }
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class OcrServer:
+    """Recebe as requisições e distribui os arquivos entre os workers.
+
+    `workers` limita o processamento simultâneo e `queue_size` o número de
+    requisições que podem esperar por um worker.
+    """
+
+    def __init__(self, workers=None, queue_size=None, timeout=DEFAULT_TIMEOUT,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = self.workers * 4 if queue_size is None else max(0, queue_size)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.executor = None
+        self._slots = None
+        self.running = 0
+        self.waiting = 0
+        self.served = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=batch_process._init_worker,
+            initargs=(False, None, batch_process.worker_cores(self.workers)))
+
+    def start_workers(self):
+        self.executor = self._new_executor()
+        # Inicia todos os processos do pool e aguarda a importação dos módulos
+        list(self.executor.map(int, range(self.workers)))
+        self._slots = asyncio.Semaphore(self.workers)
+
+    def _replace_executor(self, executor):
+        """Substitui o pool `executor` (com um processo preso ou morto) por um novo.
+
+        Os processos do pool antigo são encerrados numa thread, sem segurar o
+        loop; se outra requisição já o substituiu, não faz nada.
+        """
+        if executor is not self.executor:
+            return
+        self.executor = self._new_executor()
+        asyncio.get_running_loop().run_in_executor(None, batch_process._terminate_executor,
+                                                   executor)
+
+    def close(self):
+        if self.executor is not None:
+            batch_process._terminate_executor(self.executor)
+            self.executor = None
+
+    async def _run(self, data, filename, kind):
+        """Processa o arquivo em um worker, mantendo a vaga até o fim do processamento."""
+        if self.waiting >= self.queue_size and self._slots.locked():
+            raise HttpError(503, 'Servidor ocupado; tente novamente em instantes',
+                            {'Retry-After': '1'})
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await self._submit(data, filename, kind)
+        finally:
+            # A vaga só é liberada quando o worker está livre: no timeout, o
+            # pool com o processo preso já foi substituído
+            self.running -= 1
+            self._slots.release()
+
+    async def _submit(self, data, filename, kind):
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            executor = self.executor
+            try:
+                future = loop.run_in_executor(executor, process_bytes, data, filename, kind)
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self._replace_executor(executor)
+                raise HttpError(504, f'Timeout ao processar o arquivo (>{self.timeout}s)')
+            except BrokenProcessPool:
+                # Um processo do pool morreu (ou o pool foi substituído por
+                # causa do timeout de outra requisição): recomeça no novo pool
+                self._replace_executor(executor)
+        raise HttpError(500, 'Processo de OCR encerrado inesperadamente')
+
+    async def extract(self, query, headers, body):
+        # Cabeçalhos só aceitam ASCII: X-Arquivo vem codificado como na URL
+        filename = (query.get('arquivo') or [unquote(headers.get('x-arquivo', ''))])[0]
+        filename = os.path.basename(filename) or 'arquivo'
+        kind = batch_process.file_kind(filename) or sniff_kind(body)
+        if kind is None:
+            raise HttpError(415, 'Tipo de arquivo não suportado (imagem jpg/png/gif ou PDF)')
+        if not Path(filename).suffix:
+            filename += '.pdf' if kind == 'pdf' else '.png'
+
+        outcome = await self._run(body, filename, kind)
+        self.served += 1
+        if query.get('texto', ['0'])[0] not in ('1', 'true', 'sim'):
+            outcome.pop('texto', None)
+        return outcome
+
+    def health(self):
+        return {'workers': self.workers, 'em_execucao': self.running, 'na_fila': self.waiting,
+                'limite_fila': self.queue_size, 'atendidas': self.served}
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await asyncio.wait_for(read_head(reader), READ_TIMEOUT)
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                if url.path == '/saude':
+                    if method != 'GET':
+                        raise HttpError(405, 'Use GET')
+                    status, payload = 200, self.health()
+                elif url.path == '/extrair':
+                    if method != 'POST':
+                        raise HttpError(405, 'Use POST com os bytes do arquivo no corpo')
+                    body = await asyncio.wait_for(read_body(reader, headers, self.max_bytes),
+                                                  READ_TIMEOUT)
+                    status, payload = 200, await self.extract(query, headers, body)
+                else:
+                    raise HttpError(404, f'Caminho desconhecido: {url.path}')
+                extra = {}
+            except HttpError as e:
+                status, payload, extra = e.status, {'erro': str(e)}, e.headers
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                status, payload, extra = 500, {'erro': f'{type(e).__name__}: {e}'}, {}
+            write_response(writer, status, payload, extra)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def read_head(reader):
+    """Lê a linha de requisição e os cabeçalhos (nomes em minúsculas)."""
+    try:
+        raw = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, 'Cabeçalhos muito grandes')
+    lines = raw.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'Linha de requisição inválida')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+
+async def read_body(reader, headers, max_bytes):
+    if 'content-length' not in headers:
+        raise HttpError(411, 'Content-Length obrigatório')
+    try:
+        length = int(headers['content-length'])
+    except ValueError:
+        raise HttpError(400, 'Content-Length inválido')
+    if length > max_bytes:
+        raise HttpError(413, f'Arquivo maior que o limite de {max_bytes // (1024 * 1024)} MB')
+    if length <= 0:
+        raise HttpError(400, 'Corpo vazio')
+    return await reader.readexactly(length)
+
+
+def write_response(writer, status, payload, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}',
+             'Content-Type: application/json; charset=utf-8',
+             f'Content-Length: {len(body)}',
+             'Connection: close']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+
+async def serve(server, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    server.start_workers()
+    limit = MAX_HEADER_BYTES
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        listener = await asyncio.start_unix_server(server.handle, path=unix_path, limit=limit)
+        where = f'unix:{unix_path}'
+    else:
+        listener = await asyncio.start_server(server.handle, host, port, limit=limit)
+        where = f'http://{host}:{port}'
+    print(f"Servidor de OCR em {where} com {server.workers} worker(s) "
+          f"(fila de até {server.queue_size} requisições)")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Servidor de OCR com workers aquecidos')
+    ap.add_argument('--host', default=DEFAULT_HOST, help='Endereço HTTP (padrão: só localhost)')
+    ap.add_argument('--port', '-p', type=int, default=DEFAULT_PORT, help='Porta HTTP')
+    ap.add_argument('--unix', default=None, help='Escuta em um socket Unix em vez de TCP')
+    ap.add_argument('--workers', '-w', type=int, default=None,
+                    help='Processos de OCR (padrão: número de CPUs)')
+    ap.add_argument('--fila', type=int, default=None,
+                    help='Requisições que podem aguardar um worker (padrão: 4 por worker)')
+    ap.add_argument('--timeout', '-t', type=int, default=DEFAULT_TIMEOUT, help='Timeout (s) por arquivo')
+    ap.add_argument('--max-mb', type=int, default=DEFAULT_MAX_MB, help='Tamanho máximo do arquivo (MB)')
+    args = ap.parse_args()
+
+    if args.unix and not hasattr(asyncio, 'start_unix_server'):
+        print('Erro: sockets Unix não são suportados nesta plataforma; use --host/--port')
+        sys.exit(1)
+
+    server = OcrServer(args.workers, args.fila, args.timeout, args.max_mb * 1024 * 1024)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print('\nServidor encerrado.')
+
+
+if __name__ == '__main__':
+    main()
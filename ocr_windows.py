@@ -6,7 +6,9 @@ Versão adaptada para Windows.
 
 import os
 import sys
-import pytesseract
+
+from lazy_imports import is_available
+from ocr_engine import set_tesseract_cmd
 from ocr import main as ocr_main
 
 # Configura o caminho do Tesseract (ajuste conforme seu caminho de instalação)
@@ -14,15 +16,13 @@ tesseract_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
 def check_requirements():
     """Verifica se todos os requisitos estão instalados"""
-    try:
-        import cv2
-        import numpy
-        from PIL import Image
-    except ImportError as e:
-        print(f"Erro: Biblioteca {e.name} não encontrada.")
-        print("\nPor favor, instale as dependências necessárias usando:")
-        print("pip install -r requirements.txt")
-        sys.exit(1)
+    # Só localiza os módulos; a importação fica para quando forem usados
+    for module in ('cv2', 'numpy', 'PIL', 'pytesseract'):
+        if not is_available(module):
+            print(f"Erro: Biblioteca {module} não encontrada.")
+            print("\nPor favor, instale as dependências necessárias usando:")
+            print("pip install -r requirements.txt")
+            sys.exit(1)
 
     # Verifica se o Tesseract está instalado
     if not os.path.exists(tesseract_path):
@@ -38,7 +38,7 @@ def check_requirements():
 def main():
     """Função principal adaptada para Windows"""
     # Configura o caminho do Tesseract
-    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    set_tesseract_cmd(tesseract_path)
     
     # Verifica os requisitos
     check_requirements()
@@ -1,19 +1,21 @@
 #!/usr/bin/env python3
-"""Extrai nome, valor e data de PDFs com texto pesquisável (sem OCR).
+"""Extrai nome, valor e data de PDFs com texto pesquisável.
 
-Uso: python pdf_fast.py <arquivo.pdf>
+As páginas são lidas em ordem e a leitura para assim que Valor e Data são
+encontrados. Páginas sem camada de texto (escaneadas) são rasterizadas e
+passam pelo OCR de `ocr_fast.py`.
+
+Uso: python pdf_fast.py <arquivo.pdf> [--workers N]
 """
-import re
 import os
 import sys
 from datetime import datetime
-import csv
 
-try:
-    from PyPDF2 import PdfReader
-except Exception:
-    print('Erro: PyPDF2 não encontrado. Instale com: pip install PyPDF2')
-    sys.exit(1)
+from extraction import extract_fields, SIMPLE_PATTERNS
+from result_sink import CsvSink
+import profiling
+
+PYPDF2_MISSING = 'PyPDF2 não encontrado. Instale com: pip install PyPDF2'
 
 
 def extract_name_from_filename(pdf_path):
@@ -25,54 +27,176 @@ def extract_name_from_filename(pdf_path):
     return name_without_ext.strip()
 
 
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    texts = []
-    for page in reader.pages:
+# Campos que encerram a leitura das páginas quando todos já foram encontrados
+REQUIRED_FIELDS = ('Valor', 'Data')
+
+# Abaixo deste número de páginas a extração é feita no próprio processo
+MIN_PAGES_FOR_POOL = 4
+
+# Resolução usada ao rasterizar páginas sem camada de texto
+OCR_DPI = 200
+
+# Máximo de caracteres de texto guardados por PDF; páginas além disso ainda
+# são lidas em busca dos campos, mas o texto delas não é acumulado
+MAX_TEXT_CHARS = 200_000
+
+# Leitor do último PDF aberto neste processo (reaproveitado entre páginas)
+_reader_cache = {}
+
+
+def _get_reader(pdf_path):
+    reader = _reader_cache.get(pdf_path)
+    if reader is None:
+        # Importado só quando um PDF é de fato aberto
         try:
-            t = page.extract_text()
-        except Exception:
-            t = ''
-        if t:
-            texts.append(t)
-    return '\n'.join(texts)
+            from PyPDF2 import PdfReader
+        except ImportError:
+            raise ImportError(PYPDF2_MISSING)
+        _reader_cache.clear()
+        reader = _reader_cache[pdf_path] = PdfReader(pdf_path)
+    return reader
+
 
+def page_images(pdf_path, page_index, dpi=OCR_DPI):
+    """Imagens em escala de cinza de uma página, para OCR.
 
-def normalize_currency_text(text):
-    # Normaliza variações comuns que o OCR confundia (RS, R5) — aqui por segurança
-    text = re.sub(r'R[\s]*[Ss5]\s*(?=\d)', 'R$ ', text)
-    text = re.sub(r'R\s*\$\s*', 'R$ ', text)
+    Usa o pypdfium2 (opcional) para rasterizar a página; sem ele, decodifica
+    as imagens embutidas na página, que em PDFs escaneados costumam ser a
+    própria página inteira.
+    """
+    import numpy as np
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+
+    if pdfium is not None:
+        from image_utils import cap_scale
+        doc = pdfium.PdfDocument(pdf_path)
+        try:
+            page = doc[page_index]
+            width, height = page.get_size()
+            # Páginas enormes são rasterizadas no limite de pixels de trabalho
+            scale = cap_scale((height, width), dpi / 72)
+            bitmap = page.render(scale=scale, grayscale=True)
+            return [np.asarray(bitmap.to_pil().convert('L'))]
+        finally:
+            doc.close()
+
+    import cv2
+    images = []
+    for embedded in _get_reader(pdf_path).pages[page_index].images:
+        arr = cv2.imdecode(np.frombuffer(embedded.data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if arr is not None:
+            images.append(arr)
+    return images
+
+
+def ocr_page(pdf_path, page_index):
+    """Texto de uma página sem camada de texto, via pipeline de OCR de imagens."""
+    import ocr_fast
+    return '\n'.join(ocr_fast.extract_text_from_array(img) for img in page_images(pdf_path, page_index))
+
+
+def extract_page_text(pdf_path, page_index, ocr_fallback=True, text_layer=True):
+    """Texto de uma página; recorre ao OCR se a página não tiver texto.
+
+    Com `text_layer` falso (PDF sem fontes, ver triage), vai direto ao OCR.
+    """
+    text = ''
+    if text_layer:
+        try:
+            with profiling.span('pdf_texto'):
+                text = _get_reader(pdf_path).pages[page_index].extract_text() or ''
+        except Exception:
+            text = ''
+    if not text.strip() and ocr_fallback:
+        try:
+            with profiling.span('pdf_ocr'):
+                text = ocr_page(pdf_path, page_index)
+        except Exception as e:
+            print(f"OCR da página {page_index + 1} falhou: {e}")
+            text = ''
     return text
 
 
-def extract_value_and_date(text):
-    result = {}
-    txt = normalize_currency_text(text)
+def iter_page_texts(pdf_path, workers=1, ocr_fallback=True, text_layer=True):
+    """Gera o texto de cada página, em ordem, sem guardar as anteriores.
 
-    # Extrair valor (formato brasileiro)
-    m = re.search(r'R\$\s*(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', txt)
-    if m:
-        val = m.group(1)
-        if '.' in val and len(val.split('.')[-1]) == 2:
-            val = val.replace('.', ',')
-        elif ',' not in val:
-            val = val + ',00'
-        result['Valor'] = f"R$ {val}"
+    Com `workers` > 1 e pelo menos MIN_PAGES_FOR_POOL páginas, as páginas
+    seguintes à atual são extraídas em paralelo em um pool de processos (no
+    máximo `workers` à frente). Interromper a iteração cancela as páginas
+    ainda não iniciadas.
+    """
+    pdf_path = str(pdf_path)
+    n_pages = len(_get_reader(pdf_path).pages)
 
-    # Extrair data dd/mm/yyyy
-    dm = re.search(r'(\d{2})/(\d{2})/(\d{4})', text)
-    if dm:
-        day = dm.group(1).zfill(2)
-        month = dm.group(2).zfill(2)
-        year = dm.group(3)
-        result['Data'] = f"{day}/{month}/{year}"
+    if workers <= 1 or n_pages < MIN_PAGES_FOR_POOL:
+        for i in range(n_pages):
+            yield extract_page_text(pdf_path, i, ocr_fallback, text_layer)
+        return
 
-    return result
+    from concurrent.futures import ProcessPoolExecutor
+    workers = min(workers, n_pages)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+    submitted = 0
+    try:
+        for i in range(n_pages):
+            while submitted < n_pages and submitted < i + workers:
+                pending[submitted] = executor.submit(extract_page_text, pdf_path, submitted,
+                                                  ocr_fallback, text_layer)
+                submitted += 1
+            yield pending.pop(i).result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
-def save_to_csv(result, pdf_path, csv_filename="ocr_results_pdf.csv"):
-    file_exists = os.path.exists(csv_filename)
-    row = {
+def extract_text_from_pdf(pdf_path, workers=1, ocr_fallback=True, stop_when_complete=True,
+                          text_layer=True):
+    """Extrai o texto das páginas em ordem, parando quando Valor e Data aparecem.
+
+    Retorna (texto, campos). Os campos são procurados página a página, de
+    modo que os de páginas além do limite do texto também são encontrados;
+    do texto, só os primeiros MAX_TEXT_CHARS caracteres são guardados. Os
+    chamadores devem usar os campos retornados em vez de procurá-los de novo
+    no texto. Páginas sem camada de texto
+    passam pelo OCR de imagens quando `ocr_fallback` é verdadeiro; com
+    `text_layer` falso, nenhuma extração de texto é tentada antes do OCR.
+    """
+    texts = []
+    size = 0
+    found = {}
+    pages = iter_page_texts(pdf_path, workers, ocr_fallback, text_layer)
+    try:
+        for text in pages:
+            if not text:
+                continue
+            if size < MAX_TEXT_CHARS:
+                texts.append(text[:MAX_TEXT_CHARS - size])
+                size += len(texts[-1])
+            for field, value in extract_value_and_date(text).items():
+                found.setdefault(field, value)
+            if stop_when_complete and all(f in found for f in REQUIRED_FIELDS):
+                break
+    finally:
+        pages.close()
+        # O leitor (e os objetos já resolvidos do PDF) não fica preso ao worker
+        _reader_cache.clear()
+    return '\n'.join(texts), found
+
+
+def extract_value_and_date(text):
+    # O símbolo de real é normalizado (RS, R5) antes da varredura
+    with profiling.span('extracao'):
+        return extract_fields(text, SIMPLE_PATTERNS)
+
+
+CSV_FIELDNAMES = ['Nome', 'Valor', 'Data', 'Arquivo', 'Arquivo_Caminho', 'Timestamp']
+
+
+def build_row(result, pdf_path):
+    return {
         'Nome': result.get('Nome', ''),
         'Valor': result.get('Valor', ''),
         'Data': result.get('Data', ''),
@@ -80,26 +204,45 @@ def save_to_csv(result, pdf_path, csv_filename="ocr_results_pdf.csv"):
         'Arquivo_Caminho': os.path.abspath(pdf_path),
         'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as f:
-        fieldnames = ['Nome', 'Valor', 'Data', 'Arquivo', 'Arquivo_Caminho', 'Timestamp']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+
+
+def save_to_csv(result, pdf_path, csv_filename="ocr_results_pdf.csv"):
+    with CsvSink(csv_filename, CSV_FIELDNAMES) as sink:
+        sink.write(build_row(result, pdf_path))
 
 
 def main():
-    if len(sys.argv) != 2:
-        print('Uso: python pdf_fast.py <arquivo.pdf>')
+    args = sys.argv[1:]
+
+    # --workers N: extrai as páginas em paralelo em PDFs com muitas páginas
+    workers = 1
+    if '--workers' in args:
+        i = args.index('--workers')
+        try:
+            workers = int(args[i + 1])
+        except (IndexError, ValueError):
+            print('Erro: --workers requer um número inteiro')
+            sys.exit(1)
+        del args[i:i + 2]
+
+    if len(args) != 1:
+        print('Uso: python pdf_fast.py <arquivo.pdf> [--workers N]')
         sys.exit(1)
 
-    pdf_path = sys.argv[1]
+    pdf_path = args[0]
     if not os.path.exists(pdf_path):
         print(f"Erro: arquivo '{pdf_path}' não encontrado")
         sys.exit(1)
 
     print(f"Processando: {pdf_path}")
-    text = extract_text_from_pdf(pdf_path)
+    try:
+        # PDF sem fontes (escaneado): direto ao OCR, sem tentar extrair texto
+        from triage import pdf_has_text_layer
+        text, fields = extract_text_from_pdf(pdf_path, workers=workers,
+                                             text_layer=pdf_has_text_layer(pdf_path))
+    except ImportError as e:
+        print(f'Erro: {e}')
+        sys.exit(1)
     if not text.strip():
         print('Nenhum texto extraível do PDF.')
         sys.exit(1)
@@ -111,7 +254,7 @@ def main():
 
     result = {}
     result['Nome'] = extract_name_from_filename(pdf_path)
-    result.update(extract_value_and_date(text))
+    result.update(fields)
 
     if 'Nome' in result:
         print(f"Nome: {result['Nome']}")
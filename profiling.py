@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Instrumentação leve das etapas do pipeline (leitura, pré-processamento,
+OCR e extração).
+
+Desativada por padrão: `span()` devolve um contexto nulo compartilhado e
+`stage_timer()` só chama `time.perf_counter()`, de modo que o custo fica
+perto de zero. Ativada com `enable()` (ou a variável de ambiente
+OCR_PROFILE=1), cada etapa executada entre `begin_file()` e `end_file()`
+vira um intervalo (etapa, início, duração) no registro JSON do arquivo, e
+todas as etapas alimentam histogramas agregados do processo.
+
+Os registros podem ser gerados em outros processos (pool de workers) e
+agregados no processo principal com `add_record()`.
+"""
+import math
+import os
+import threading
+import time
+
+
+ENABLED = os.environ.get('OCR_PROFILE', '') not in ('', '0')
+
+# Limites superiores (ms) das faixas dos histogramas; a última faixa é aberta
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_local = threading.local()
+_lock = threading.Lock()
+_durations = {}
+
+
+def enable(flag=True):
+    """Ativa (ou desativa) a instrumentação neste processo."""
+    global ENABLED
+    ENABLED = flag
+
+
+def is_enabled():
+    return ENABLED
+
+
+def stage_timer(timings=None):
+    """
+    Retorna uma função `mark(etapa)` que registra o tempo (s) decorrido desde
+    a marcação anterior: acumula em `timings`, se for um dicionário, e gera
+    um intervalo quando a instrumentação está ativa. `mark(None)` apenas
+    reinicia a contagem.
+    """
+    last = [time.perf_counter()]
+
+    def mark(stage):
+        now = time.perf_counter()
+        if stage is not None:
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + now - last[0]
+            if ENABLED:
+                record(stage, last[0], now)
+        last[0] = now
+
+    return mark
+
+
+def record(stage, start, end):
+    """Registra uma etapa medida com `time.perf_counter()` entre `start` e `end`."""
+    if not ENABLED:
+        return
+    duration = end - start
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current['etapas'].append({'etapa': stage,
+                                  'inicio_s': round(start - current['_inicio'], 6),
+                                  'duracao_s': round(duration, 6)})
+    with _lock:
+        _durations.setdefault(stage, []).append(duration)
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, self.start, time.perf_counter())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage):
+    """Contexto que mede o bloco como uma etapa (nulo se desativado)."""
+    return _Span(stage) if ENABLED else _NULL_SPAN
+
+
+def begin_file(path, kind=None):
+    """Inicia o registro das etapas de um arquivo na thread atual."""
+    if not ENABLED:
+        return
+    _local.current = {'arquivo': str(path), 'tipo': kind, 'etapas': [],
+                      'inicio': time.time(), '_inicio': time.perf_counter()}
+
+
+def end_file():
+    """Encerra o registro do arquivo atual e o retorna (None se desativado)."""
+    current = getattr(_local, 'current', None)
+    if current is None:
+        return None
+    _local.current = None
+    current['duracao_s'] = round(time.perf_counter() - current.pop('_inicio'), 6)
+    return current
+
+
+def add_record(file_record):
+    """Agrega aos histogramas as etapas de um registro vindo de outro processo."""
+    with _lock:
+        for entry in file_record.get('etapas', []):
+            _durations.setdefault(entry['etapa'], []).append(entry['duracao_s'])
+
+
+def reset():
+    """Descarta as durações agregadas."""
+    with _lock:
+        _durations.clear()
+
+
+def _percentile(ordered, p):
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary():
+    """Estatísticas e histograma por etapa, em milissegundos."""
+    with _lock:
+        snapshot = {stage: sorted(values) for stage, values in _durations.items()}
+    result = {}
+    for stage, values in snapshot.items():
+        ms = [v * 1000 for v in values]
+        buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for v in ms:
+            i = 0
+            while i < len(HISTOGRAM_BOUNDS_MS) and v > HISTOGRAM_BOUNDS_MS[i]:
+                i += 1
+            buckets[i] += 1
+        result[stage] = {
+            'execucoes': len(ms),
+            'total_ms': round(sum(ms), 3),
+            'media_ms': round(sum(ms) / len(ms), 3),
+            'p50_ms': round(_percentile(ms, 50), 3),
+            'p95_ms': round(_percentile(ms, 95), 3),
+            'max_ms': round(ms[-1], 3),
+            'histograma': buckets,
+        }
+    return result
+
+
+def format_summary():
+    """Tabela das etapas ordenada pelo tempo total, com o histograma de cada uma."""
+    stats = summary()
+    if not stats:
+        return "Nenhuma etapa registrada."
+    labels = [f"<={b}" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+    lines = [f"{'etapa':<28} {'n':>6} {'total ms':>10} {'média':>8} {'p50':>8} {'p95':>8} {'máx':>8}"]
+    for stage, s in sorted(stats.items(), key=lambda item: -item[1]['total_ms']):
+        lines.append(f"{stage:<28} {s['execucoes']:>6} {s['total_ms']:>10.1f} {s['media_ms']:>8.1f} "
+                     f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['max_ms']:>8.1f}")
+        bars = ' '.join(f"{label}:{n}" for label, n in zip(labels, s['histograma']) if n)
+        lines.append(f"{'':<28} {bars}")
+    return '\n'.join(lines)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Conciliação dos comprovantes extraídos com a lista de pagamentos esperados.
+
+Lê os resultados do OCR (ocr_results.csv / .jsonl / .parquet, gravados por
+ocr.py, ocr_fast.py ou batch_process.py) e um CSV de pagamentos esperados
+com as colunas Nome, Valor e Data (vírgula, ponto e vírgula ou tabulação;
+Valor como "180,00" ou "R$ 1.234,56", Data como "15/01/2024" ou
+"2024-01-15").
+
+Valor vira centavos (inteiro) e Data uma data ISO; os comprovantes são
+indexados por (centavos, dia), pelo nome normalizado (sem acentos, caixa
+ou pontuação) e pelas palavras do nome. Cada pagamento esperado consulta
+só as chaves do seu valor nos dias da janela (±`window` dias): a rodada
+exata procura direto a chave (centavos, dia, nome), e a comparação
+aproximada de nomes (difflib) é feita só com até MAX_FUZZY_CANDIDATES
+candidatos de mesmo valor e data na janela, pré-selecionados pelas palavras
+do nome quando há muitas doações do mesmo valor no mesmo dia. Assim o custo
+cresce quase linearmente com o número de linhas.
+
+As associações são feitas em rodadas, da mais forte para a mais fraca, e
+cada comprovante é usado uma só vez:
+- 'exato': mesmo valor, data na janela e mesmo nome normalizado;
+- 'aproximado': mesmo valor, data na janela e nome parecido (>= `threshold`);
+- 'valor_data': mesmo valor e data na janela, único candidato restante;
+- 'data_divergente': mesmo nome e valor, data fora da janela (ou ausente
+  em um dos lados);
+- 'valor_divergente': mesmo nome e data na janela, valor diferente (exige
+  a data dos dois lados).
+Pagamentos sem comprovante ficam 'pendente'; comprovantes sem pagamento
+esperado, 'sem_esperado'. Cópias de comprovantes (coluna Duplicata) não
+entram na conciliação.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import unicodedata
+from datetime import date
+from difflib import SequenceMatcher
+
+from result_sink import open_sink, FORMATS
+
+
+DEFAULT_RESULTS = ('ocr_results.csv', 'ocr_results_pdf.csv')
+DEFAULT_OUTPUT = 'conciliacao.csv'
+
+# Dias de diferença aceitos entre a data esperada e a do comprovante
+DEFAULT_WINDOW_DAYS = 1
+
+# Similaridade mínima (0-1) dos nomes na rodada aproximada
+DEFAULT_NAME_THRESHOLD = 0.8
+
+# Comprovantes comparados, no máximo, a cada pagamento na rodada aproximada
+MAX_FUZZY_CANDIDATES = 50
+
+# Ordem das rodadas de associação (ver docstring do módulo)
+MATCH_LEVELS = ('exato', 'aproximado', 'valor_data', 'data_divergente', 'valor_divergente')
+
+OUTPUT_FIELDNAMES = ['Status', 'Esperado_Linha', 'Esperado_Nome', 'Esperado_Valor', 'Esperado_Data',
+                     'Comprovante_Nome', 'Comprovante_Valor', 'Comprovante_Data', 'Arquivo',
+                     'Dias_Diferenca', 'Similaridade']
+
+# Colunas com o caminho do arquivo, em ordem de preferência, nos resultados
+# de cada script
+_FILE_COLUMNS = ('Arquivo_Imagem_Caminho', 'Arquivo_Caminho', 'Arquivo_Imagem', 'Arquivo')
+
+_DATE_BR = re.compile(r'(\d{1,2})\s*[/.-]\s*(\d{1,2})\s*[/.-]\s*(\d{2}|\d{4})$')
+_DATE_ISO = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+
+
+def parse_cents(text):
+    """Valor em centavos ("R$ 1.234,56" -> 123456), ou None se ilegível.
+
+    A vírgula é o separador decimal; um ponto seguido de exatamente dois
+    dígitos no fim também é tratado como decimal ("180.00").
+    """
+    if not text:
+        return None
+    digits = re.sub(r'[^\d,.]', '', str(text))
+    if not digits or not any(c.isdigit() for c in digits):
+        return None
+    if ',' in digits:
+        integer, _, fraction = digits.rpartition(',')
+        integer = integer.replace('.', '')
+    elif re.search(r'\.\d{2}$', digits) and digits.count('.') == 1:
+        integer, _, fraction = digits.partition('.')
+    else:
+        integer, fraction = digits.replace('.', ''), ''
+    if not integer.isdigit() and integer != '':
+        return None
+    fraction = (fraction + '00')[:2]
+    if not fraction.isdigit():
+        return None
+    return int(integer or 0) * 100 + int(fraction)
+
+
+def parse_date(text):
+    """Data de "15/01/2024", "15/01/24" ou "2024-01-15", ou None se inválida."""
+    text = (text or '').strip()
+    m = _DATE_ISO.match(text)
+    if m:
+        year, month, day = m.groups()
+    else:
+        m = _DATE_BR.match(text)
+        if not m:
+            return None
+        day, month, year = m.groups()
+        if len(year) == 2:
+            year = '20' + year
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def normalize_name(text):
+    """Nome sem acentos, caixa e pontuação, com espaços simples."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+
+def name_similarity(a, b):
+    """Similaridade (0-1) entre dois nomes já normalizados.
+
+    A maior entre a razão do difflib e a fração das palavras do nome mais
+    curto contidas no outro (nomes de arquivo costumam trazer só parte do
+    nome); a segunda só vale com pelo menos duas palavras.
+    """
+    if not a or not b:
+        return 0.0
+    ratio = SequenceMatcher(None, a, b).ratio()
+    shorter, longer = sorted((a.split(), b.split()), key=len)
+    if len(shorter) >= 2:
+        ratio = max(ratio, len(set(shorter) & set(longer)) / len(set(shorter)))
+    return ratio
+
+
+def format_cents(cents):
+    """Centavos em texto de exibição (123456 -> "R$ 1.234,56")."""
+    if cents is None:
+        return ''
+    integer = f"{cents // 100:,}".replace(',', '.')
+    return f"R$ {integer},{cents % 100:02d}"
+
+
+def _read_rows(path):
+    fmt = os.path.splitext(str(path))[1].lstrip('.').lower() or 'csv'
+    if fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if fmt == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow não encontrado. Instale com: pip install pyarrow')
+        return pq.read_table(path).to_pylist()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        return list(csv.DictReader(f, dialect=dialect))
+
+
+def _column(row, *names):
+    # Procura a coluna sem diferenciar caixa nem acentos
+    wanted = {normalize_name(name) for name in names}
+    for key, value in row.items():
+        if key is not None and normalize_name(key) in wanted:
+            return value
+    return None
+
+
+def load_receipts(paths):
+    """Comprovantes dos arquivos de resultados, com valor e data já convertidos.
+
+    Retorna (comprovantes, cópias ignoradas); cada comprovante é um
+    dicionário com 'nome', 'nome_norm', 'centavos', 'data', 'arquivo' e a
+    linha original em 'linha'.
+    """
+    receipts, duplicates = [], 0
+    for path in paths:
+        for row in _read_rows(path):
+            if (row.get('Duplicata') or '').strip():
+                duplicates += 1
+                continue
+            name = row.get('Nome') or ''
+            receipts.append({
+                'nome': name,
+                'nome_norm': normalize_name(name),
+                'centavos': parse_cents(row.get('Valor')),
+                'data': parse_date(row.get('Data')),
+                'arquivo': next((row[c] for c in _FILE_COLUMNS if row.get(c)), ''),
+                'linha': row,
+            })
+    return receipts, duplicates
+
+
+def load_expected(path):
+    """Pagamentos esperados do CSV (colunas Nome, Valor e Data)."""
+    expected = []
+    for i, row in enumerate(_read_rows(path), start=2):
+        name = _column(row, 'Nome', 'Pagador') or ''
+        expected.append({
+            'linha_arquivo': i,
+            'nome': name,
+            'nome_norm': normalize_name(name),
+            'centavos': parse_cents(_column(row, 'Valor')),
+            'data': parse_date(_column(row, 'Data')),
+        })
+    return expected
+
+
+class ReceiptIndex:
+    """Índices dos comprovantes livres por (centavos, dia), por (centavos, dia,
+    nome normalizado), por (centavos, dia, palavra do nome) e por nome
+    normalizado.
+
+    Cada chave guarda os índices dos comprovantes num dicionário ordenado;
+    `use(i)` marca o comprovante como associado e o retira de todas as
+    chaves, de modo que as consultas só percorrem comprovantes livres.
+    """
+
+    def __init__(self, receipts):
+        self.receipts = receipts
+        self.used = set()
+        self.by_amount_day = {}
+        self.by_amount_day_name = {}
+        self.by_amount_day_token = {}
+        self.by_name = {}
+        for i in range(len(receipts)):
+            for index, key in self._keys(i):
+                index.setdefault(key, {})[i] = None
+
+    def _keys(self, i):
+        r = self.receipts[i]
+        name = r['nome_norm']
+        if r['centavos'] is not None and r['data'] is not None:
+            key = (r['centavos'], r['data'].toordinal())
+            yield self.by_amount_day, key
+            if name:
+                yield self.by_amount_day_name, key + (name,)
+                for token in set(name.split()):
+                    yield self.by_amount_day_token, key + (token,)
+        if name:
+            yield self.by_name, name
+
+    def use(self, i):
+        """Marca o comprovante `i` como associado."""
+        self.used.add(i)
+        for index, key in self._keys(i):
+            ids = index[key]
+            del ids[i]
+            if not ids:
+                del index[key]
+
+    def _lists(self, index, cents, day, window, *extra):
+        # Chaves do índice para o valor em cada dia da janela
+        if cents is None or day is None:
+            return []
+        center = day.toordinal()
+        return [ids for ordinal in range(center - window, center + window + 1)
+                for ids in [index.get((cents, ordinal) + extra)] if ids]
+
+    def in_window(self, cents, day, window, limit=None):
+        """Comprovantes livres com o valor `cents` e data a até `window` dias
+        de `day`; com `limit`, no máximo `limit` deles."""
+        found = []
+        for ids in self._lists(self.by_amount_day, cents, day, window):
+            found.extend(ids)
+            if limit is not None and len(found) >= limit:
+                return found[:limit]
+        return found
+
+    def same_name(self, cents, day, name, window):
+        """Comprovantes livres com o valor, a data na janela e o nome normalizado `name`."""
+        if not name:
+            return []
+        return [i for ids in self._lists(self.by_amount_day_name, cents, day, window, name)
+                for i in ids]
+
+    def similar_names(self, cents, day, name, window, limit=MAX_FUZZY_CANDIDATES):
+        """Candidatos livres à comparação aproximada de nomes.
+
+        Se o valor tem até `limit` comprovantes livres nos dias da janela,
+        todos são candidatos. Senão (muitas doações do mesmo valor no mesmo
+        dia), parte dos que têm a palavra do nome mais rara entre eles e vai
+        restringindo aos que também têm as demais, enquanto sobrar algum;
+        ficam no máximo `limit` candidatos.
+        """
+        lists = self._lists(self.by_amount_day, cents, day, window)
+        if sum(len(ids) for ids in lists) <= limit:
+            return [i for ids in lists for i in ids]
+        postings = []
+        for token in set(name.split()):
+            token_lists = self._lists(self.by_amount_day_token, cents, day, window, token)
+            if token_lists:
+                postings.append(set().union(*token_lists))
+        candidates = None
+        for ids in sorted(postings, key=len):
+            narrowed = ids if candidates is None else candidates & ids
+            if narrowed:
+                candidates = narrowed
+        return sorted(candidates or ())[:limit]
+
+    def named(self, name):
+        """Comprovantes livres com o nome normalizado `name`."""
+        return list(self.by_name.get(name, ()))
+
+
+def _days_apart(expected, receipt):
+    if expected['data'] is None or receipt['data'] is None:
+        return None
+    return abs((receipt['data'] - expected['data']).days)
+
+
+def _candidates(level, entry, index, window, threshold):
+    # Candidatos (distância, -similaridade, índice) de uma rodada para um pagamento
+    receipts = index.receipts
+    if level == 'exato':
+        ids = index.same_name(entry['centavos'], entry['data'], entry['nome_norm'], window)
+        return [(_days_apart(entry, receipts[i]), -1.0, i) for i in ids]
+    if level == 'aproximado':
+        found = []
+        for i in index.similar_names(entry['centavos'], entry['data'], entry['nome_norm'], window):
+            score = name_similarity(entry['nome_norm'], receipts[i]['nome_norm'])
+            if score >= threshold:
+                found.append((_days_apart(entry, receipts[i]), -score, i))
+        return found
+    if level == 'valor_data':
+        ids = index.in_window(entry['centavos'], entry['data'], window, limit=2)
+        return [(_days_apart(entry, receipts[ids[0]]), 0.0, ids[0])] if len(ids) == 1 else []
+    ids = index.named(entry['nome_norm']) if entry['nome_norm'] else []
+    if level == 'data_divergente':
+        ids = [i for i in ids if entry['centavos'] is not None
+               and receipts[i]['centavos'] == entry['centavos']]
+    else:
+        # Sem data de um dos lados não há como confirmar a janela: não associa
+        ids = [i for i in ids if receipts[i]['centavos'] != entry['centavos']
+               and _days_apart(entry, receipts[i]) is not None
+               and _days_apart(entry, receipts[i]) <= window]
+    return [(_days_apart(entry, receipts[i]), -1.0, i) for i in ids]
+
+
+def reconcile(expected, receipts, window=DEFAULT_WINDOW_DAYS, threshold=DEFAULT_NAME_THRESHOLD):
+    """Associa os pagamentos esperados aos comprovantes (ver docstring do módulo).
+
+    Retorna a lista de associações: dicionários com 'status', 'esperado'
+    (ou None) e 'comprovante' (ou None), e 'similaridade' quando houver.
+    """
+    index = ReceiptIndex(receipts)
+    matched = {}
+    for level in MATCH_LEVELS:
+        for n, entry in enumerate(expected):
+            if n in matched:
+                continue
+            candidates = _candidates(level, entry, index, window, threshold)
+            if not candidates:
+                continue
+            _, neg_score, best = min(candidates, key=lambda c: (c[0] is None, c[0] or 0, c[1], c[2]))
+            index.use(best)
+            matched[n] = (level, best, -neg_score)
+    results = []
+    for n, entry in enumerate(expected):
+        if n not in matched:
+            results.append({'status': 'pendente', 'esperado': entry, 'comprovante': None})
+            continue
+        level, best, score = matched[n]
+        result = {'status': level, 'esperado': entry, 'comprovante': receipts[best]}
+        if level == 'aproximado':
+            result['similaridade'] = score
+        results.append(result)
+    for i, receipt in enumerate(receipts):
+        if i not in index.used:
+            results.append({'status': 'sem_esperado', 'esperado': None, 'comprovante': receipt})
+    return results
+
+
+def build_row(result):
+    """Linha do relatório de conciliação."""
+    entry, receipt = result['esperado'], result['comprovante']
+    row = {'Status': result['status']}
+    if entry is not None:
+        row.update({
+            'Esperado_Linha': entry['linha_arquivo'],
+            'Esperado_Nome': entry['nome'],
+            'Esperado_Valor': format_cents(entry['centavos']),
+            'Esperado_Data': entry['data'].isoformat() if entry['data'] else '',
+        })
+    if receipt is not None:
+        row.update({
+            'Comprovante_Nome': receipt['nome'],
+            'Comprovante_Valor': format_cents(receipt['centavos']),
+            'Comprovante_Data': receipt['data'].isoformat() if receipt['data'] else '',
+            'Arquivo': receipt['arquivo'],
+        })
+    if entry is not None and receipt is not None:
+        days = _days_apart(entry, receipt)
+        row['Dias_Diferenca'] = '' if days is None else days
+    if 'similaridade' in result:
+        row['Similaridade'] = f"{result['similaridade']:.2f}"
+    return {name: row.get(name, '') for name in OUTPUT_FIELDNAMES}
+
+
+def summarize(results):
+    """Contagem de associações por status, na ordem das rodadas."""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    order = list(MATCH_LEVELS) + ['pendente', 'sem_esperado']
+    return ', '.join(f"{counts[status]} {status}" for status in order if status in counts)
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Concilia os comprovantes extraídos com uma lista de pagamentos esperados')
+    ap.add_argument('esperados', help='CSV de pagamentos esperados (colunas Nome, Valor e Data)')
+    ap.add_argument('--resultados', nargs='+', default=None,
+                    help=f"Arquivos de resultados do OCR (padrão: {', '.join(DEFAULT_RESULTS)})")
+    ap.add_argument('--saida', default=DEFAULT_OUTPUT,
+                    help=f"Relatório de conciliação ({', '.join(FORMATS)}; padrão: {DEFAULT_OUTPUT})")
+    ap.add_argument('--janela-dias', type=int, default=DEFAULT_WINDOW_DAYS,
+                    help='Diferença máxima, em dias, entre a data esperada e a do comprovante')
+    ap.add_argument('--similaridade', type=float, default=DEFAULT_NAME_THRESHOLD,
+                    help='Similaridade mínima (0-1) dos nomes na associação aproximada')
+    args = ap.parse_args()
+
+    results_paths = args.resultados or [p for p in DEFAULT_RESULTS if os.path.exists(p)]
+    for path in [args.esperados] + results_paths:
+        if not os.path.exists(path):
+            print(f"Erro: Arquivo '{path}' não encontrado.")
+            sys.exit(1)
+    if not results_paths:
+        print(f"Erro: nenhum arquivo de resultados encontrado ({', '.join(DEFAULT_RESULTS)}).")
+        sys.exit(1)
+
+    receipts, duplicates = load_receipts(results_paths)
+    expected = load_expected(args.esperados)
+    unreadable = sum(1 for r in receipts if r['centavos'] is None or r['data'] is None)
+    print(f"{len(expected)} pagamento(s) esperado(s), {len(receipts)} comprovante(s)"
+          f" ({unreadable} sem valor ou data legível; {duplicates} cópia(s) ignorada(s))")
+
+    results = reconcile(expected, receipts, max(0, args.janela_dias), args.similaridade)
+
+    # O relatório é refeito a cada execução (os destinos gravam em modo append)
+    if os.path.exists(args.saida):
+        os.remove(args.saida)
+    with open_sink(args.saida, OUTPUT_FIELDNAMES) as sink:
+        for result in results:
+            sink.write(build_row(result))
+    print(f"Conciliação: {summarize(results)}")
+    print(f"Relatório salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
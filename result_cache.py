@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Cache persistente de resultados de OCR em SQLite.
+
+Cada entrada é identificada pelo hash SHA-256 do conteúdo do arquivo e pela
+versão do pipeline que a gerou; guarda o texto bruto do OCR e os campos
+Nome/Valor/Data extraídos. Arquivos inalterados são resolvidos pelo cache
+sem passar pelo OCR. Quando o tamanho total das entradas passa do limite,
+as menos acessadas recentemente são removidas.
+"""
+import hashlib
+import sqlite3
+import time
+
+
+DEFAULT_CACHE_PATH = 'ocr_cache.sqlite3'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Acessos guardados em memória antes de gravar as datas de acesso de uma vez
+ACCESS_FLUSH_ROWS = 256
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Calcula o SHA-256 do conteúdo do arquivo."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Cache de resultados indexado por (hash do arquivo, versão do pipeline)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS resultados ('
+            ' hash TEXT NOT NULL,'
+            ' versao TEXT NOT NULL,'
+            ' texto TEXT NOT NULL,'
+            ' nome TEXT, valor TEXT, data TEXT,'
+            ' tamanho INTEGER NOT NULL,'
+            ' criado_em REAL NOT NULL,'
+            ' acessado_em REAL NOT NULL,'
+            ' PRIMARY KEY (hash, versao))')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (acessado_em)')
+        self._conn.commit()
+        row = self._conn.execute('SELECT COALESCE(SUM(tamanho), 0) FROM resultados').fetchone()
+        self._total_bytes = row[0]
+        # (hash, versão) -> data do último acesso ainda não gravada. As
+        # leituras não abrem transação: o arquivo é compartilhado com o
+        # índice de cópias (duplicate_index.py), que precisa gravar nele
+        self._accessed = {}
+
+    def get(self, digest, version):
+        """Retorna {'texto', 'Nome', 'Valor', 'Data'} ou None se não houver entrada."""
+        row = self._conn.execute(
+            'SELECT texto, nome, valor, data FROM resultados WHERE hash = ? AND versao = ?',
+            (digest, version)).fetchone()
+        if row is None:
+            return None
+        self._accessed[(digest, version)] = time.time()
+        if len(self._accessed) >= ACCESS_FLUSH_ROWS:
+            self._write_accesses()
+            self._conn.commit()
+        text, nome, valor, data = row
+        result = {k: v for k, v in (('Nome', nome), ('Valor', valor), ('Data', data)) if v}
+        return {'texto': text, 'resultado': result}
+
+    def _write_accesses(self):
+        # Grava as datas de acesso pendentes (na transação de quem chama)
+        if self._accessed:
+            self._conn.executemany(
+                'UPDATE resultados SET acessado_em = ? WHERE hash = ? AND versao = ?',
+                [(when, digest, version) for (digest, version), when in self._accessed.items()])
+            self._accessed = {}
+
+    def put(self, digest, version, text, result):
+        """Grava (ou substitui) o resultado de um arquivo e aplica o limite de tamanho."""
+        self._write_accesses()
+        size = len(text.encode('utf-8')) + sum(
+            len(str(result.get(k, '')).encode('utf-8')) for k in ('Nome', 'Valor', 'Data'))
+        old = self._conn.execute(
+            'SELECT tamanho FROM resultados WHERE hash = ? AND versao = ?',
+            (digest, version)).fetchone()
+        if old is not None:
+            self._total_bytes -= old[0]
+
+        now = time.time()
+        self._conn.execute(
+            'INSERT OR REPLACE INTO resultados'
+            ' (hash, versao, texto, nome, valor, data, tamanho, criado_em, acessado_em)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (digest, version, text, result.get('Nome'), result.get('Valor'),
+             result.get('Data'), size, now, now))
+        self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+        self._conn.commit()
+
+    def evict(self, target_ratio=0.9):
+        """Remove as entradas menos acessadas até ficar abaixo de `target_ratio` do limite."""
+        target = self.max_bytes * target_ratio
+        rows = self._conn.execute(
+            'SELECT hash, versao, tamanho FROM resultados ORDER BY acessado_em').fetchall()
+        removed = []
+        for digest, version, size in rows:
+            if self._total_bytes <= target:
+                break
+            removed.append((digest, version))
+            self._total_bytes -= size
+        self._conn.executemany(
+            'DELETE FROM resultados WHERE hash = ? AND versao = ?', removed)
+        return len(removed)
+
+    def close(self):
+        self._write_accesses()
+        self._conn.commit()
+        self._conn.close()
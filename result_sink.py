@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Destinos de gravação dos resultados (CSV, JSONL e Parquet).
+
+Cada destino mantém um único arquivo aberto e grava as linhas em lotes:
+`buffer_rows` linhas são acumuladas antes de cada escrita e o conteúdo é
+sincronizado com o disco (fsync) no máximo a cada `fsync_interval` segundos.
+`ThreadedSink` envolve qualquer destino com uma fila e uma única thread de
+escrita, para uso a partir de várias threads sem intercalar linhas.
+
+O Parquet não aceita acréscimos: o arquivo é regravado com as linhas
+antigas e as novas, e só é substituído no fechamento.
+
+Parquet requer o pyarrow (opcional): pip install pyarrow
+"""
+import csv
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+
+DEFAULT_BUFFER_ROWS = 50
+DEFAULT_FSYNC_INTERVAL = 5.0
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+class ResultSink:
+    """Interface comum: `write(linha)`, `flush()` e `close()`.
+
+    `durable_on_flush` indica se as linhas já estão no arquivo de destino
+    depois de `flush()` (senão, só depois de `close()`).
+    """
+
+    durable_on_flush = True
+
+    def write(self, row):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _BufferedFileSink(ResultSink):
+    """Base dos destinos em arquivo texto: buffer de linhas e fsync periódico."""
+
+    def __init__(self, path, fieldnames, buffer_rows=DEFAULT_BUFFER_ROWS,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.path = str(path)
+        self.fieldnames = list(fieldnames)
+        self.buffer_rows = max(1, buffer_rows)
+        self.fsync_interval = fsync_interval
+        self._rows = []
+        self._last_sync = time.monotonic()
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        # Arquivo novo (ou vazio): permite gravar um cabeçalho
+        self._is_new = self._file.tell() == 0
+
+    def write(self, row):
+        self._rows.append({k: row.get(k, '') for k in self.fieldnames})
+        if len(self._rows) >= self.buffer_rows:
+            self.flush()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def flush(self):
+        if self._rows:
+            self._write_rows(self._rows)
+            self._rows = []
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+class CsvSink(_BufferedFileSink):
+    """CSV em modo append; o cabeçalho só é escrito em arquivo novo.
+
+    Em um arquivo existente valem as colunas do cabeçalho dele: colunas
+    novas ficam de fora, para não desalinhar as linhas já gravadas.
+    """
+
+    def __init__(self, path, fieldnames, **kwargs):
+        super().__init__(path, fieldnames, **kwargs)
+        if not self._is_new:
+            with open(self.path, newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), None)
+            if header and header != self.fieldnames:
+                missing = [name for name in self.fieldnames if name not in header]
+                if missing:
+                    print(f"Aviso: {self.path} não tem a(s) coluna(s) {', '.join(missing)}; "
+                          f"elas não serão gravadas neste arquivo")
+                self.fieldnames = header
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        if self._is_new:
+            self._writer.writeheader()
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+
+
+class JsonlSink(_BufferedFileSink):
+    """Um objeto JSON por linha, em modo append."""
+
+    def _write_rows(self, rows):
+        self._file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+class ParquetSink(ResultSink):
+    """Parquet com um row group por lote.
+
+    O formato não permite acrescentar linhas a um arquivo existente: as
+    linhas são gravadas num arquivo temporário, que começa com as linhas do
+    arquivo existente (com as colunas dele, como no CSV) e o substitui de
+    forma atômica em `close()`. Até lá o arquivo original fica intacto, e as
+    linhas novas só passam a existir nele no fechamento (`durable_on_flush`
+    é False).
+    """
+
+    durable_on_flush = False
+
+    def __init__(self, path, fieldnames, buffer_rows=DEFAULT_BUFFER_ROWS, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow não encontrado. Instale com: pip install pyarrow')
+        self._pa = pyarrow
+        self.path = str(path)
+        self.fieldnames = list(fieldnames)
+        self.buffer_rows = max(1, buffer_rows)
+        existing = pq.ParquetFile(self.path) if os.path.exists(self.path) else None
+        if existing is not None:
+            header = existing.schema_arrow.names
+            missing = [name for name in self.fieldnames if name not in header]
+            if missing:
+                print(f"Aviso: {self.path} não tem a(s) coluna(s) {', '.join(missing)}; "
+                      f"elas não serão gravadas neste arquivo")
+            self.fieldnames = header
+        self._schema = pyarrow.schema([(name, pyarrow.string()) for name in self.fieldnames])
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path),
+                                              suffix='.tmp')
+        os.close(fd)
+        self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+        if existing is not None:
+            for batch in existing.iter_batches():
+                self._writer.write_table(self._pa.Table.from_batches([batch]).cast(self._schema))
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = {name: [str(row.get(name, '')) for row in self._rows] for name in self.fieldnames}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
+        os.replace(self._tmp_path, self.path)
+
+
+class ThreadedSink(ResultSink):
+    """Serializa as escritas de várias threads em uma única thread de gravação.
+
+    `write` apenas coloca a linha na fila (bloqueia se houver mais de
+    `max_pending` linhas pendentes); a thread de gravação repassa as linhas ao
+    destino envolvido e faz flush quando a fila esvazia.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sink, max_pending=1000):
+        self.sink = sink
+        self.durable_on_flush = sink.durable_on_flush
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='result-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                self.sink.write(item)
+                if self._queue.empty():
+                    self.sink.flush()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def write(self, row):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(row)
+
+    def flush(self):
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.sink.close()
+        if self._error is not None:
+            raise self._error
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sink(path, fieldnames, fmt=None, threaded=False, **kwargs):
+    """Abre o destino adequado ao formato (ou à extensão de `path`)."""
+    fmt = fmt or os.path.splitext(str(path))[1].lstrip('.').lower() or 'csv'
+    if fmt not in SINKS:
+        raise ValueError(f"Formato de saída desconhecido: {fmt} (opções: {', '.join(FORMATS)})")
+    sink = SINKS[fmt](path, fieldnames, **kwargs)
+    return ThreadedSink(sink) if threaded else sink
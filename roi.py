@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Recorte das regiões de interesse (ROI) de um comprovante.
+
+Os extratores só precisam de poucas linhas: "Valor R$ ...", a linha da data
+e o bloco "Origem". Em vez de aplicar o OCR caro à imagem inteira:
+
+1. uma passada barata (`image_to_data` em uma cópia reduzida, sem
+   pré-processamento) localiza as linhas de texto e as palavras-chave;
+2. as zonas candidatas (linha encontrada + linha seguinte) são recortadas da
+   imagem original e só esses recortes passam pelo OCR completo;
+3. as zonas que levaram a uma extração bem-sucedida são guardadas, em
+   coordenadas normalizadas, como modelo do layout de cada banco
+   (`layout_templates.json`), e preenchem as zonas que a passada barata não
+   encontrar nos próximos comprovantes do mesmo banco.
+"""
+import json
+import os
+import re
+import tempfile
+
+from image_utils import choose_scale_factor, resize_by
+
+
+DEFAULT_TEMPLATES_PATH = 'layout_templates.json'
+
+# Altura de texto (px) usada na passada barata de localização
+LOCATE_TEXT_HEIGHT = 20
+
+# Campos com zona própria, na ordem em que aparecem no texto recortado
+ROI_FIELDS = ('valor', 'data', 'origem')
+
+_VALUE_LINE = re.compile(r'valor|R\s*\$|R[S5]\s*\d', re.IGNORECASE)
+_DATE_LINE = re.compile(
+    r'\d{1,2}\s*/\s*\d{1,2}\s*/\s*\d{2,4}'
+    r'|\d{1,2}\s+(?:de\s+)?(?:jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)'
+    r'|\d{4}-\d{1,2}-\d{1,2}|DATA:',
+    re.IGNORECASE)
+_ORIGEM_LINE = re.compile(r'origem', re.IGNORECASE)
+_INSTITUICAO_LINE = re.compile(r'institui', re.IGNORECASE)
+
+# Palavras-chave que identificam o banco emissor
+BANK_KEYWORDS = [
+    ('nubank', re.compile(r'nu\s*pagamentos|nubank', re.IGNORECASE)),
+    ('itau', re.compile(r'ita[uú]', re.IGNORECASE)),
+    ('cora', re.compile(r'\bcora\b', re.IGNORECASE)),
+    ('inter', re.compile(r'banco\s+inter\b', re.IGNORECASE)),
+    ('bradesco', re.compile(r'bradesco', re.IGNORECASE)),
+    ('santander', re.compile(r'santander', re.IGNORECASE)),
+    ('bb', re.compile(r'banco\s+do\s+brasil', re.IGNORECASE)),
+    ('caixa', re.compile(r'caixa\s+econ', re.IGNORECASE)),
+]
+
+
+def group_lines(words):
+    """Agrupa as palavras de `image_to_data` em linhas.
+
+    Retorna uma lista, de cima para baixo, de dicionários com 'text' e a
+    caixa da linha ('left', 'top', 'width', 'height').
+    """
+    lines = {}
+    for w in words:
+        key = (w['block'], w['line'])
+        x1, y1 = w['left'], w['top']
+        x2, y2 = x1 + w['width'], y1 + w['height']
+        if key not in lines:
+            lines[key] = {'words': [w['text']], 'box': [x1, y1, x2, y2]}
+            continue
+        line = lines[key]
+        line['words'].append(w['text'])
+        box = line['box']
+        line['box'] = [min(box[0], x1), min(box[1], y1), max(box[2], x2), max(box[3], y2)]
+
+    result = []
+    for line in lines.values():
+        x1, y1, x2, y2 = line['box']
+        result.append({'text': ' '.join(line['words']), 'left': x1, 'top': y1,
+                       'width': x2 - x1, 'height': y2 - y1})
+    result.sort(key=lambda l: (l['top'], l['left']))
+    return result
+
+
+def detect_bank(lines):
+    """Identifica o banco emissor pelas linhas do bloco Origem ou do cabeçalho.
+
+    O bloco Origem tem prioridade porque o banco de destino também aparece no
+    comprovante (ex.: "CAIXA ECONOMICA" no destino de um comprovante Nubank).
+    """
+    texts = [l['text'] for l in lines]
+    origem = next((i for i, t in enumerate(texts) if _ORIGEM_LINE.search(t)), None)
+    regions = []
+    if origem is not None:
+        regions.append(texts[origem:origem + 6])
+    regions.append(texts[:3])
+    regions.append(texts)
+    for region in regions:
+        joined = '\n'.join(region)
+        for bank, pattern in BANK_KEYWORDS:
+            if pattern.search(joined):
+                return bank
+    return None
+
+
+def _line_zone(lines, i, count, shape):
+    """Caixa que cobre `count` linhas a partir da i-ésima, na largura total da imagem."""
+    selected = lines[i:i + count]
+    top = min(l['top'] for l in selected)
+    bottom = max(l['top'] + l['height'] for l in selected)
+    pad = max(4, int(0.3 * selected[0]['height']))
+    top = max(0, top - pad)
+    bottom = min(shape[0], bottom + pad)
+    return (0, top, shape[1], bottom - top)
+
+
+def locate_zones(lines, shape):
+    """Localiza as zonas de Valor, Data e Origem a partir das linhas.
+
+    Valor e Data incluem a linha seguinte, pois vários bancos põem o rótulo
+    em uma linha e o valor na outra. Origem vai até a linha "Instituição".
+    """
+    zones = {}
+    for i, line in enumerate(lines):
+        text = line['text']
+        if 'valor' not in zones and _VALUE_LINE.search(text):
+            zones['valor'] = _line_zone(lines, i, 2, shape)
+        if 'data' not in zones and _DATE_LINE.search(text):
+            zones['data'] = _line_zone(lines, i, 2, shape)
+        if 'origem' not in zones and _ORIGEM_LINE.search(text):
+            end = i + 1
+            while end < len(lines) and end - i < 6 and not _INSTITUICAO_LINE.search(lines[end]['text']):
+                end += 1
+            zones['origem'] = _line_zone(lines, i, end - i + 1, shape)
+    return zones
+
+
+def merge_zones(zones):
+    """Une zonas sobrepostas para não aplicar o OCR duas vezes à mesma área.
+
+    Retorna as caixas resultantes de cima para baixo.
+    """
+    boxes = sorted(zones.values(), key=lambda b: b[1])
+    merged = []
+    for x, y, w, h in boxes:
+        if merged:
+            mx, my, mw, mh = merged[-1]
+            if y <= my + mh:
+                left, right = min(mx, x), max(mx + mw, x + w)
+                bottom = max(my + mh, y + h)
+                merged[-1] = (left, my, right - left, bottom - my)
+                continue
+        merged.append((x, y, w, h))
+    return merged
+
+
+# Chave, no modelo de cada banco, da contagem de acertos por estágio de OCR
+STAGES_KEY = 'estagios'
+
+
+class LayoutTemplates:
+    """Zonas aprendidas por banco, em coordenadas normalizadas (0-1).
+
+    Cada zona guarda a média das caixas observadas e o número de observações;
+    `STAGES_KEY` guarda quantas vezes cada estágio de OCR resolveu um
+    comprovante do banco (ver layouts.py).
+    """
+
+    def __init__(self, path=DEFAULT_TEMPLATES_PATH):
+        self.path = str(path)
+        self.templates = {}
+        self.changed = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.templates = json.load(f)
+            except (OSError, ValueError):
+                self.templates = {}
+
+    def zone_for(self, bank, field, shape):
+        """Zona em pixels do campo para o banco, ou None se não houver modelo."""
+        entry = self.templates.get(bank, {}).get(field)
+        if not entry:
+            return None
+        h, w = shape[:2]
+        x, y, zw, zh = entry['box']
+        return (int(x * w), int(y * h), max(1, int(zw * w)), max(1, int(zh * h)))
+
+    def learn(self, bank, field, box, shape):
+        """Incorpora à média do modelo uma zona que levou a uma extração correta."""
+        h, w = shape[:2]
+        norm = [box[0] / w, box[1] / h, box[2] / w, box[3] / h]
+        fields = self.templates.setdefault(bank, {})
+        entry = fields.get(field)
+        if entry is None:
+            fields[field] = {'box': norm, 'n': 1}
+        else:
+            n = entry['n']
+            entry['box'] = [(old * n + new) / (n + 1) for old, new in zip(entry['box'], norm)]
+            entry['n'] = n + 1
+        self.changed = True
+
+    def save(self):
+        """Grava os modelos de forma atômica (vários workers podem gravar o mesmo arquivo)."""
+        if not self.changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.templates, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def stage_for(self, bank, min_count=1):
+        """Estágio de OCR que mais vezes resolveu os comprovantes do banco,
+        se observado pelo menos `min_count` vezes; senão None."""
+        counts = self.templates.get(bank, {}).get(STAGES_KEY)
+        if not counts:
+            return None
+        stage, count = max(counts.items(), key=lambda item: item[1])
+        return stage if count >= min_count else None
+
+    def learn_stage(self, bank, stage):
+        """Conta mais um comprovante do banco resolvido pelo estágio `stage`."""
+        counts = self.templates.setdefault(bank, {}).setdefault(STAGES_KEY, {})
+        counts[stage] = counts.get(stage, 0) + 1
+        self.changed = True
+
+
+def probe_lines(gray, engine, lang='por'):
+    """Passada barata de localização: OCR de uma cópia reduzida, sem
+    pré-processamento. Retorna as linhas (ver `group_lines`) em coordenadas
+    da imagem original."""
+    probe_scale = min(1.0, choose_scale_factor(gray, 1.0, target=LOCATE_TEXT_HEIGHT))
+    probe = resize_by(gray, probe_scale)
+    words = engine.image_to_data(probe, lang=lang, psm=11)
+    for w in words:
+        for key in ('left', 'top', 'width', 'height'):
+            w[key] = int(w[key] / probe_scale)
+    return group_lines(words)
+
+
+def read_zones(gray, engine, read_crop, templates=None, lang='por', lines=None):
+    """Localiza as zonas de interesse e aplica o OCR completo só nos recortes.
+
+    `gray` é a imagem original em escala de cinza e `read_crop(recorte)`
+    aplica o pré-processamento e o OCR a um recorte. Retorna a lista com o
+    resultado de `read_crop` para cada recorte (de cima para baixo), as zonas
+    localizadas pela passada barata e o banco identificado. Zonas não
+    localizadas vêm do modelo do banco, se houver. `lines`, se já
+    calculadas por `probe_lines`, dispensam a passada barata.
+    """
+    shape = gray.shape[:2]
+    if lines is None:
+        lines = probe_lines(gray, engine, lang)
+    bank = detect_bank(lines)
+    located = locate_zones(lines, shape)
+
+    zones = dict(located)
+    if templates is not None and bank is not None:
+        for field in ROI_FIELDS:
+            if field not in zones:
+                box = templates.zone_for(bank, field, shape)
+                if box is not None:
+                    zones[field] = box
+
+    results = []
+    for x, y, w, h in merge_zones(zones):
+        crop = gray[y:y + h, x:x + w]
+        if crop.size:
+            results.append(read_crop(crop))
+    return results, located, bank
+
+
+def learn_zones(templates, bank, located, result, shape):
+    """Atualiza o modelo do banco com as zonas que produziram campos.
+
+    Valor e Data só são aprendidos quando o campo foi extraído; Origem é
+    aprendida sempre que localizada pela palavra-chave.
+    """
+    if templates is None or bank is None:
+        return
+    field_for_zone = {'valor': 'Valor', 'data': 'Data'}
+    for zone, box in located.items():
+        field = field_for_zone.get(zone)
+        if field is None or field in result:
+            templates.learn(bank, zone, box, shape)
@@ -0,0 +1,32 @@
+import batch_process
+
+
+def run_batch(tmp_path, monkeypatch):
+    processed = []
+
+    def fake_pool(files, workers, timeout, on_result, retry=None):
+        for p in files:
+            processed.append(p.name)
+            on_result({'arquivo': str(p), 'tipo': batch_process.content_kind(p), 'status': 'ok',
+                       'texto': 'R$ 10,00', 'resultado': {'Valor': 'R$ 10,00'}})
+
+    monkeypatch.setattr(batch_process, 'run_pool', fake_pool)
+    batch_process.process_directory(
+        tmp_path / 'entrada', False, 10, workers=1, cache_path=tmp_path / 'cache.sqlite3',
+        manifest_path=tmp_path / 'manifesto.sqlite3', detect_duplicates=False,
+        output=batch_process.BatchOutput('jsonl', output_dir=tmp_path))
+    return processed
+
+
+def test_content_kind_wins_over_extension(tmp_path):
+    path = tmp_path / 'comprovante.png'
+    path.write_bytes(b'%PDF-1.4\n')
+    assert batch_process.content_kind(path) == 'pdf'
+    assert batch_process.content_kind(tmp_path / 'inexistente.pdf') == 'pdf'
+
+
+def test_misnamed_file_hits_the_cache(tmp_path, monkeypatch):
+    (tmp_path / 'entrada').mkdir()
+    (tmp_path / 'entrada' / 'comprovante.png').write_bytes(b'%PDF-1.4\n%%EOF\n')
+    assert run_batch(tmp_path, monkeypatch) == ['comprovante.png']
+    assert run_batch(tmp_path, monkeypatch) == []
@@ -0,0 +1,89 @@
+import re
+from pathlib import Path
+
+import pytest
+
+import extraction
+from extraction import (BANK_SPECS, FULL_PATTERNS, FULL_SPECS, SIMPLE_PATTERNS, SIMPLE_SPECS,
+                        extend_patterns, extract_fields, normalize_currency_text)
+
+OCR_OUTPUT = Path(__file__).resolve().parent.parent / 'ocr_output.txt'
+
+SAMPLES = [
+    'RS 180,00',
+    'R$.300,00',
+    'R$ 1.000,00',
+    'Valor: R$ 30,00',
+    'R$ 30',
+    'Valor R$ 30.00',
+    'valor - R$ 45.50',
+    'DATA: 04/02/2025',
+    '15/01/2024 - 08.45.06',
+    '15/01/2024 - 08:45:06',
+    'Pago em 5/1/2024',
+    '3 de março de 2025',
+    '21 fev.2025',
+    '21/02/25 às 10:00',
+    '12 jan de 2025',
+    '?? FEV 2025',
+    '04-02-2025',
+    '2025-02-04',
+    'R5 12,34 em 01/02/2025 e R$ 99,00 em 31/12/2024',
+    'transferência de R$ 2.500,00 — 10/10/2024, estorno R$ 10,00 15/10/2024',
+    'sem valor nem data',
+    '',
+]
+
+
+def sequential_fields(text, specs, flags=0, normalize=None):
+    # Referência: cada padrão testado com re.search, em ordem de prioridade
+    if normalize is not None:
+        text = normalize(text)
+    fields = {}
+    for _, field, regex, formatter in specs:
+        if field in fields:
+            continue
+        m = re.search(regex, text, flags)
+        if m:
+            fields[field] = formatter(m.groups())
+    return fields
+
+
+def texts():
+    return SAMPLES + [OCR_OUTPUT.read_text(encoding='utf-8')]
+
+
+@pytest.mark.parametrize('text', texts())
+def test_full_patterns_match_sequential_search(text):
+    assert extract_fields(text, FULL_PATTERNS) == sequential_fields(text, FULL_SPECS, re.IGNORECASE)
+
+
+@pytest.mark.parametrize('text', texts())
+def test_simple_patterns_match_sequential_search(text):
+    expected = sequential_fields(text, SIMPLE_SPECS, normalize=normalize_currency_text)
+    assert extract_fields(text, SIMPLE_PATTERNS) == expected
+
+
+@pytest.mark.parametrize('text', texts())
+def test_bank_patterns_take_priority(text):
+    specs = BANK_SPECS['nubank'] + FULL_SPECS
+    expected = sequential_fields(text, specs, re.IGNORECASE)
+    assert extract_fields(text, extend_patterns(BANK_SPECS['nubank'])) == expected
+
+
+def test_ocr_output_fields():
+    fields = extract_fields(OCR_OUTPUT.read_text(encoding='utf-8'))
+    assert fields == {'Valor': 'R$ 180,00', 'Data': '15/01/2024'}
+
+
+def test_scored_fields_use_lowest_word_confidence():
+    words = [
+        {'text': 'Valor', 'conf': 95, 'block': 1, 'par': 1, 'line': 1},
+        {'text': 'R$', 'conf': 90, 'block': 1, 'par': 1, 'line': 1},
+        {'text': '180,00', 'conf': 60, 'block': 1, 'par': 1, 'line': 1},
+        {'text': '15/01/2024', 'conf': 85, 'block': 1, 'par': 1, 'line': 2},
+    ]
+    text, scored, _ = extraction.extract_scored_fields(words)
+    assert text == 'Valor R$ 180,00\n15/01/2024'
+    assert scored['Valor'] == ('R$ 180,00', 60)
+    assert scored['Data'] == ('15/01/2024', 85)
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import batch_process
+from job_manifest import JobManifest, retry_delay
+
+
+@pytest.fixture
+def batch(tmp_path):
+    files = []
+    for name in ('a.png', 'b.png', 'c.png'):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        files.append(str(path))
+    manifest = JobManifest(tmp_path / 'manifesto.sqlite3')
+    manifest.start(tmp_path, False, files)
+    yield manifest, files
+    manifest.close()
+
+
+def test_start_marks_files_pending(batch):
+    manifest, files = batch
+    assert manifest.counts() == {'pendente': 3}
+    assert manifest.describe()['diretorio'] == os.path.dirname(os.path.abspath(files[0]))
+
+
+def test_resume_skips_completed(batch):
+    manifest, files = batch
+    manifest.record({'arquivo': files[0], 'status': 'ok'})
+    manifest.record({'arquivo': files[1], 'status': 'duplicata'})
+    todo, exhausted = manifest.resume(files, max_attempts=3)
+    assert todo == files[2:]
+    assert exhausted == []
+
+
+def test_resume_retries_failures_until_exhausted(batch):
+    manifest, files = batch
+    manifest.record({'arquivo': files[0], 'status': 'erro', 'erro': 'falha'})
+    assert manifest.record({'arquivo': files[1], 'status': 'timeout', 'timeout': 5}) == 1
+    assert manifest.record({'arquivo': files[1], 'status': 'timeout', 'timeout': 5}) == 2
+    todo, exhausted = manifest.resume(files, max_attempts=2)
+    assert todo == [files[0], files[2]]
+    assert exhausted == [files[1]]
+    assert manifest.state(files[0]) == 'falhou'
+
+
+def test_resume_reprocesses_changed_and_new_files(batch, tmp_path):
+    manifest, files = batch
+    for path in files:
+        manifest.record({'arquivo': path, 'status': 'ok'})
+    with open(files[0], 'ab') as f:
+        f.write(b'alterado')
+    new = tmp_path / 'd.png'
+    new.write_bytes(b'd')
+    todo, _ = manifest.resume(files + [str(new)], max_attempts=3)
+    assert sorted(todo) == sorted([files[0], str(new)])
+    assert manifest.state(files[0]) == 'pendente'
+    assert manifest.state(new) == 'pendente'
+
+
+def test_retry_delay_grows_up_to_the_limit():
+    assert retry_delay(1, base=2) == 2
+    assert retry_delay(3, base=2) == 8
+    assert retry_delay(10, base=2, limit=60) == 60
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl', 'parquet'])
+def test_output_durability(tmp_path, fmt):
+    # O manifesto só dá um arquivo como concluído quando a linha dele está no
+    # arquivo de saída: no Parquet, isso só acontece no fechamento
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    output = batch_process.BatchOutput(fmt, output_dir=tmp_path)
+    result = {'Valor': 'R$ 1,00', 'Data': '01/01/2025'}
+    assert output.save({'arquivo': str(tmp_path / 'a.png'), 'tipo': 'imagem', 'status': 'ok',
+                        'resultado': result})
+    output.flush()
+    assert output.durable_on_flush == (fmt != 'parquet')
+    output.close()
@@ -0,0 +1,30 @@
+import pdf_fast
+
+
+def fake_pages(*pages):
+    def iter_page_texts(pdf_path, workers=1, ocr_fallback=True, text_layer=True):
+        yield from pages
+    return iter_page_texts
+
+
+def test_fields_beyond_the_text_limit_are_kept(monkeypatch):
+    first = 'x' * (pdf_fast.MAX_TEXT_CHARS + 50000)
+    monkeypatch.setattr(pdf_fast, 'iter_page_texts',
+                        fake_pages(first, 'Valor R$ 180,00 em 15/01/2024'))
+    text, fields = pdf_fast.extract_text_from_pdf('comprovante.pdf')
+    assert len(text) == pdf_fast.MAX_TEXT_CHARS
+    assert fields == {'Valor': 'R$ 180,00', 'Data': '15/01/2024'}
+
+
+def test_stops_when_fields_are_complete(monkeypatch):
+    read = []
+
+    def iter_page_texts(pdf_path, workers=1, ocr_fallback=True, text_layer=True):
+        for page in ('R$ 10,00', 'em 01/02/2025', 'R$ 99,00'):
+            read.append(page)
+            yield page
+    monkeypatch.setattr(pdf_fast, 'iter_page_texts', iter_page_texts)
+    text, fields = pdf_fast.extract_text_from_pdf('comprovante.pdf')
+    assert fields == {'Valor': 'R$ 10,00', 'Data': '01/02/2025'}
+    assert read == ['R$ 10,00', 'em 01/02/2025']
+    assert text == 'R$ 10,00\nem 01/02/2025'
@@ -0,0 +1,94 @@
+from datetime import date
+
+import reconcile
+
+
+def expected(name, value, day, line=2):
+    return {'linha_arquivo': line, 'nome': name, 'nome_norm': reconcile.normalize_name(name),
+            'centavos': reconcile.parse_cents(value), 'data': reconcile.parse_date(day)}
+
+
+def receipt(name, value, day, path='a.png'):
+    return {'nome': name, 'nome_norm': reconcile.normalize_name(name),
+            'centavos': reconcile.parse_cents(value), 'data': reconcile.parse_date(day),
+            'arquivo': path, 'linha': {}}
+
+
+def statuses(results):
+    return [(r['status'], r['comprovante']['arquivo'] if r['comprovante'] else None) for r in results]
+
+
+def test_parse_cents_and_date():
+    assert reconcile.parse_cents('R$ 1.234,56') == 123456
+    assert reconcile.parse_cents('180,00') == 18000
+    assert reconcile.parse_cents('180.00') == 18000
+    assert reconcile.parse_cents('30') == 3000
+    assert reconcile.parse_cents('') is None
+    assert reconcile.parse_date('15/01/2024') == date(2024, 1, 15)
+    assert reconcile.parse_date('2024-01-15') == date(2024, 1, 15)
+    assert reconcile.parse_date('15/01/24') == date(2024, 1, 15)
+    assert reconcile.parse_date('') is None
+    assert reconcile.parse_date('31/02/2024') is None
+
+
+def test_rounds():
+    results = reconcile.reconcile(
+        [expected('Sérgio Muniz', '180,00', '15/01/2024'),
+         expected('Ízias Canário Monte Nero', '1.000,00', '20/01/2024'),
+         expected('Fulano de Tal', '30,00', '21/01/2024'),
+         expected('Maria Silva', '75,00', '01/02/2024'),
+         expected('Ana Lima', '12,00', '05/02/2024'),
+         expected('Ninguém', '500,00', '01/01/2024')],
+        [receipt('Sergio Muniz', 'R$ 180,00', '16/01/2024', 'a.png'),
+         receipt('Canario Monte Nero', 'R$ 1.000,00', '20/01/2024', 'b.png'),
+         receipt('contecomigo 2019', 'R$ 30,00', '21/01/2024', 'c.png'),
+         receipt('Maria Silva', 'R$ 75,00', '01/03/2024', 'd.png'),
+         receipt('Ana Lima', 'R$ 10,00', '05/02/2024', 'e.png'),
+         receipt('Pedro Alvares', 'R$ 99,00', '02/02/2024', 'f.png')])
+    assert statuses(results) == [
+        ('exato', 'a.png'), ('aproximado', 'b.png'), ('valor_data', 'c.png'),
+        ('data_divergente', 'd.png'), ('valor_divergente', 'e.png'), ('pendente', None),
+        ('sem_esperado', 'f.png')]
+
+
+def test_each_receipt_used_once():
+    results = reconcile.reconcile(
+        [expected('Ana Souza', '50,00', '10/01/2024'), expected('Ana Souza', '50,00', '10/01/2024')],
+        [receipt('Ana Souza', '50,00', '10/01/2024')])
+    assert statuses(results) == [('exato', 'a.png'), ('pendente', None)]
+
+
+def test_missing_expected_date():
+    # Data em branco no esperado e comprovante do mesmo nome com data
+    results = reconcile.reconcile(
+        [expected('Ana Souza', '200,00', ''), expected('Ana Souza', '150,00', '')],
+        [receipt('Ana Souza', '200,00', '10/01/2024', 'a.png'),
+         receipt('Ana Souza', '300,00', '10/01/2024', 'b.png')])
+    assert statuses(results) == [('data_divergente', 'a.png'), ('pendente', None),
+                                 ('sem_esperado', 'b.png')]
+
+
+def test_missing_receipt_date():
+    results = reconcile.reconcile(
+        [expected('Ana Souza', '200,00', '10/01/2024'), expected('Ana Souza', '150,00', '10/01/2024')],
+        [receipt('Ana Souza', '200,00', '', 'a.png'), receipt('Ana Souza', '300,00', '', 'b.png')])
+    assert statuses(results) == [('data_divergente', 'a.png'), ('pendente', None),
+                                 ('sem_esperado', 'b.png')]
+    rows = [reconcile.build_row(r) for r in results]
+    assert rows[0]['Dias_Diferenca'] == ''
+
+
+def test_crowded_amount_and_day():
+    # Muitas doações do mesmo valor no mesmo dia: a rodada exata vai direto à
+    # chave do nome e a aproximada compara só candidatos com palavras em comum
+    receipts = [receipt(f'Doador Numero {i}', '100,00', '07/01/2024', f'{i}.png') for i in range(2000)]
+    receipts.append(receipt('Ana Souza Lima', '100,00', '07/01/2024', 'ana.png'))
+    results = reconcile.reconcile(
+        [expected('Doador Numero 1500', '100,00', '07/01/2024'),
+         expected('Ana Souza Lina', '100,00', '07/01/2024')], receipts)
+    assert statuses(results)[:2] == [('exato', '1500.png'), ('aproximado', 'ana.png')]
+
+    index = reconcile.ReceiptIndex(receipts)
+    candidates = index.similar_names(10000, date(2024, 1, 7), 'doador numero 12', 1)
+    assert len(candidates) <= reconcile.MAX_FUZZY_CANDIDATES
+    assert 12 in candidates
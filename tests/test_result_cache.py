@@ -0,0 +1,38 @@
+import sqlite3
+
+from result_cache import ResultCache
+
+
+def access_time(path, digest):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT acessado_em FROM resultados WHERE hash = ?',
+                            (digest,)).fetchone()[0]
+
+
+def test_hit_does_not_lock_the_file(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResultCache(path)
+    cache.put('abc', 'imagem:1', 'texto', {'Valor': 'R$ 1,00'})
+    assert cache.get('abc', 'imagem:1') == {'texto': 'texto', 'resultado': {'Valor': 'R$ 1,00'}}
+    # Outra conexão (o índice de cópias usa o mesmo arquivo) consegue gravar
+    other = sqlite3.connect(path, timeout=0.1)
+    other.execute('CREATE TABLE outra (x)')
+    other.commit()
+    other.close()
+    cache.close()
+
+
+def test_access_time_is_written_on_close(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResultCache(path)
+    cache.put('abc', 'imagem:1', 'texto', {})
+    written = access_time(path, 'abc')
+    cache.get('abc', 'imagem:1')
+    cache.close()
+    assert access_time(path, 'abc') > written
+
+
+def test_miss_returns_none(tmp_path):
+    cache = ResultCache(tmp_path / 'cache.sqlite3')
+    assert cache.get('abc', 'imagem:1') is None
+    cache.close()
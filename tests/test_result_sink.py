@@ -0,0 +1,82 @@
+import csv
+import json
+
+import pytest
+
+import result_sink
+
+FIELDS = ['Nome', 'Valor']
+
+
+def read_rows(path, fmt):
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    if fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    import pyarrow.parquet as pq
+    return pq.read_table(path).to_pylist()
+
+
+def write_run(path, fmt, names, close=True):
+    sink = result_sink.open_sink(path, FIELDS, fmt=fmt, buffer_rows=2)
+    for name in names:
+        sink.write({'Nome': name, 'Valor': 'R$ 1,00'})
+    if close:
+        sink.close()
+    else:
+        sink.flush()
+    return sink
+
+
+@pytest.fixture(params=result_sink.FORMATS)
+def fmt(request):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+def test_rerun_appends(tmp_path, fmt):
+    # Uma nova execução (cache ou --resume) só grava as linhas novas
+    path = tmp_path / f'saida.{fmt}'
+    write_run(path, fmt, ['a', 'b', 'c'])
+    write_run(path, fmt, ['d', 'e'])
+    assert [row['Nome'] for row in read_rows(path, fmt)] == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_threaded_sink(tmp_path, fmt):
+    path = tmp_path / f'saida.{fmt}'
+    write_run(path, fmt, ['a'])
+    sink = result_sink.open_sink(path, FIELDS, fmt=fmt, threaded=True)
+    for name in 'bcd':
+        sink.write({'Nome': name})
+    sink.close()
+    assert [row['Nome'] for row in read_rows(path, fmt)] == ['a', 'b', 'c', 'd']
+
+
+def test_interrupted_run_keeps_previous_rows(tmp_path, fmt):
+    # Execução interrompida antes do close: nenhuma linha anterior se perde,
+    # e as linhas que o destino declara duráveis já estão no arquivo
+    path = tmp_path / f'saida.{fmt}'
+    write_run(path, fmt, ['a', 'b'])
+    sink = write_run(path, fmt, ['c', 'd', 'e'], close=False)
+    names = [row['Nome'] for row in read_rows(path, fmt)]
+    expected = ['a', 'b', 'c', 'd', 'e'] if sink.durable_on_flush else ['a', 'b']
+    assert names == expected
+    sink.close()
+    assert [row['Nome'] for row in read_rows(path, fmt)] == ['a', 'b', 'c', 'd', 'e']
+
+
+class FailingSink(result_sink.ResultSink):
+    def write(self, row):
+        raise OSError('disco cheio')
+
+
+def test_threaded_flush_reports_write_errors():
+    sink = result_sink.ThreadedSink(FailingSink())
+    sink.write({'Nome': 'Ana'})
+    with pytest.raises(OSError, match='disco cheio'):
+        sink.flush()
+    with pytest.raises(OSError):
+        sink.close()
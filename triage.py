@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Triagem barata dos arquivos antes do OCR, sem decodificar a imagem.
+
+Lê só o cabeçalho de cada arquivo:
+- o tipo real pelo conteúdo (um .jpg que na verdade é PNG ou PDF ainda vai
+  para o caminho certo);
+- de imagens JPEG/PNG/GIF, largura, altura e modo de cor (segmento SOF do
+  JPEG, IHDR do PNG, tela lógica do GIF);
+- de PDFs, se há camada de texto: um PDF sem nenhuma fonte não tem texto
+  extraível e vai direto para o OCR das páginas.
+
+E escolhe a estratégia mais barata que ainda serve:
+- 'pdf_texto': PDF com camada de texto (o OCR fica só para páginas sem texto);
+- 'pdf_ocr': PDF escaneado, sem tentar extrair texto antes;
+- 'jpeg_reduzido': JPEG grande decodificado já reduzido (1/2 ou 1/4, na
+  própria DCT) — `decode_gray` confere a altura do texto e volta à
+  decodificação completa se ela ficar pequena;
+- 'completo': o pipeline completo.
+
+Toda imagem é decodificada direto em escala de cinza (`load_gray`): os
+pipelines só usam o cinza, e assim nenhuma cópia colorida é alocada, muito
+menos no tamanho ampliado.
+
+A decisão é um dicionário; `decode_gray` acrescenta a economia de tempo
+estimada ('economia_s') e, se precisar recuar, a estratégia realmente usada.
+"""
+import struct
+import time
+
+from lazy_imports import lazy_import
+from image_utils import TARGET_TEXT_HEIGHT, NO_RESIZE_BAND, estimate_text_height
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+# Reduções possíveis na decodificação de JPEG (IMREAD_REDUCED_GRAYSCALE_N)
+JPEG_REDUCTIONS = (4, 2)
+
+# Menor lado que a imagem reduzida deve manter (comprovantes com menos que
+# isso costumam ter texto pequeno demais para perder resolução)
+REDUCED_MIN_SIDE = 1000
+
+# Altura mínima do texto na imagem reduzida: abaixo disso seria preciso
+# ampliá-la de novo, e a decodificação completa dá um resultado melhor
+MIN_REDUCED_TEXT_HEIGHT = TARGET_TEXT_HEIGHT / NO_RESIZE_BAND[1]
+
+# Custo da decodificação completa em cinza em relação à reduzida (medido
+# com JPEGs de 2000 a 4000 px de largura); usado para estimar o tempo
+# economizado
+REDUCED_DECODE_COST = {2: 1.7, 4: 2.7}
+
+# Bytes lidos do início do arquivo para identificar o tipo e o cabeçalho
+HEAD_BYTES = 32
+
+# Maior trecho de um PDF lido à procura de fontes (PDFs maiores são
+# tratados como tendo texto, que é o caminho padrão)
+PDF_SCAN_BYTES = 16 * 1024 * 1024
+
+# Marcadores SOF (início do quadro) do JPEG, que trazem tamanho e componentes
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+_PNG_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+
+def sniff_kind(data):
+    """Tipo do arquivo pelo conteúdo ('pdf', 'imagem' ou None)."""
+    head = data[:16]
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if (head.startswith(b'\xff\xd8\xff') or head.startswith(b'\x89PNG\r\n\x1a\n')
+            or head[:6] in (b'GIF87a', b'GIF89a')):
+        return 'imagem'
+    return None
+
+
+def _jpeg_info(f):
+    # Percorre os segmentos (pulando EXIF, miniaturas, tabelas) até o SOF
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if marker in _JPEG_SOF:
+            segment = f.read(6)
+            if len(segment) < 6:
+                return None
+            _, height, width, components = struct.unpack('>BHHB', segment)
+            return {'formato': 'jpeg', 'largura': width, 'altura': height,
+                    'modo': _JPEG_MODES.get(components, str(components))}
+        f.seek(length - 2, 1)
+
+
+def image_info(path):
+    """Formato, largura, altura e modo de cor lidos do cabeçalho, ou None."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(HEAD_BYTES)
+            if head.startswith(b'\xff\xd8'):
+                return _jpeg_info(f)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                width, height, _, color_type = struct.unpack('>IIBB', head[16:26])
+                return {'formato': 'png', 'largura': width, 'altura': height,
+                        'modo': _PNG_MODES.get(color_type, str(color_type))}
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                width, height = struct.unpack('<HH', head[6:10])
+                return {'formato': 'gif', 'largura': width, 'altura': height, 'modo': 'P'}
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def pdf_has_text_layer(path):
+    """Indica se o PDF pode ter camada de texto.
+
+    Texto em PDF sempre usa uma fonte; um PDF sem nenhuma referência a /Font
+    é só imagem. Fontes declaradas dentro de fluxos de objetos comprimidos
+    (/ObjStm) não são visíveis sem descomprimir: nesse caso, e em PDFs muito
+    grandes, a resposta é True (o caminho padrão).
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(PDF_SCAN_BYTES + 1)
+    except OSError:
+        return True
+    if len(data) > PDF_SCAN_BYTES:
+        return True
+    return b'/Font' in data or b'/ObjStm' in data
+
+
+def choose_jpeg_reduction(width, height):
+    """Maior redução que mantém o menor lado da imagem com REDUCED_MIN_SIDE px."""
+    for reduction in JPEG_REDUCTIONS:
+        if min(width, height) / reduction >= REDUCED_MIN_SIDE:
+            return reduction
+    return None
+
+
+def triage_file(path):
+    """Examina o cabeçalho do arquivo e escolhe a estratégia de extração.
+
+    Retorna um dicionário com 'tipo' ('imagem', 'pdf' ou None se não
+    reconhecido), 'estrategia', 'motivo' e, para imagens, o cabeçalho lido
+    ('formato', 'largura', 'altura', 'modo').
+    """
+    try:
+        with open(path, 'rb') as f:
+            kind = sniff_kind(f.read(HEAD_BYTES))
+    except OSError:
+        kind = None
+    if kind is None:
+        return {'tipo': None, 'estrategia': 'completo', 'motivo': 'tipo não reconhecido pelo conteúdo'}
+
+    if kind == 'pdf':
+        if pdf_has_text_layer(path):
+            return {'tipo': 'pdf', 'estrategia': 'pdf_texto', 'motivo': 'PDF com fontes'}
+        return {'tipo': 'pdf', 'estrategia': 'pdf_ocr', 'motivo': 'PDF sem fontes (escaneado)'}
+
+    decision = {'tipo': 'imagem', 'estrategia': 'completo', 'motivo': 'cabeçalho ilegível'}
+    info = image_info(path)
+    if info is None:
+        return decision
+    decision.update(info)
+    if info['formato'] == 'jpeg' and info['modo'] in ('L', 'RGB'):
+        reduction = choose_jpeg_reduction(info['largura'], info['altura'])
+        if reduction:
+            decision.update(estrategia='jpeg_reduzido', reducao=reduction,
+                            motivo=f"JPEG de {info['largura']}x{info['altura']}")
+            return decision
+    decision['motivo'] = f"{info['formato'].upper()} {info['modo']} de {info['largura']}x{info['altura']}"
+    return decision
+
+
+def describe(decision):
+    """Rótulo curto da estratégia, para o log de progresso."""
+    strategy = decision.get('estrategia')
+    if strategy == 'jpeg_reduzido':
+        return f"JPEG reduzido 1/{decision['reducao']}"
+    return {'pdf_texto': 'PDF com texto', 'pdf_ocr': 'PDF escaneado',
+            'completo': 'pipeline completo'}.get(strategy, strategy)
+
+
+def summarize(decisions):
+    """Resumo da triagem de um lote: contagem por estratégia e economia estimada."""
+    counts = {}
+    saved = 0.0
+    for decision in decisions:
+        label = describe(decision)
+        counts[label] = counts.get(label, 0) + 1
+        saved += decision.get('economia_s', 0.0)
+    parts = ', '.join(f"{n} {label}" for label, n in sorted(counts.items(), key=lambda x: -x[1]))
+    return f"Triagem: {parts}; economia estimada de {saved:.1f}s na decodificação"
+
+
+
+def decode_gray(arr, decision=None):
+    """Decodifica o conteúdo de uma imagem (array uint8) direto em cinza.
+
+    Com a estratégia 'jpeg_reduzido', decodifica o JPEG já reduzido, desde
+    que o texto ainda tenha a altura de trabalho; senão, volta à
+    decodificação completa e registra a estratégia usada em `decision`,
+    junto com o tempo economizado estimado ('economia_s', negativo se a
+    tentativa reduzida foi perdida). Retorna None se não decodificar.
+    """
+    if decision and decision.get('estrategia') == 'jpeg_reduzido':
+        gray = _decode_reduced(arr, decision)
+        if gray is not None:
+            return gray
+    return cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+
+
+def _decode_reduced(arr, decision):
+    flags = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4}
+    saved = 0.0
+    for reduction in JPEG_REDUCTIONS:
+        if reduction > decision['reducao']:
+            continue
+        start = time.perf_counter()
+        gray = cv2.imdecode(arr, flags[reduction])
+        decoded = time.perf_counter()
+        text_height = estimate_text_height(gray) if gray is not None else None
+        # A estimativa da altura do texto é um custo extra desta estratégia
+        saved -= time.perf_counter() - decoded
+        if text_height is not None and text_height >= MIN_REDUCED_TEXT_HEIGHT:
+            decision['reducao'] = reduction
+            decision['economia_s'] = saved + (decoded - start) * (REDUCED_DECODE_COST[reduction] - 1)
+            return gray
+        saved -= decoded - start
+        # Texto não estimável, ou pequeno demais mesmo com a redução seguinte
+        if text_height is None or text_height * reduction / 2 < MIN_REDUCED_TEXT_HEIGHT:
+            break
+    decision.update(estrategia='completo', economia_s=saved,
+                    motivo=decision['motivo'] + '; texto pequeno na imagem reduzida')
+    return None
+
+
+def load_gray(image_path, decision=None):
+    """Lê a imagem direto em escala de cinza (ver `decode_gray`).
+
+    np.fromfile + imdecode aceita caminhos com acentos no Windows. Retorna
+    None se o arquivo não puder ser decodificado.
+    """
+    return decode_gray(np.fromfile(str(image_path), dtype=np.uint8), decision)